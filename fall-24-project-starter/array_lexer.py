@@ -0,0 +1,133 @@
+import re
+from array import array
+
+import brewlex
+
+# token type ids, in brewlex.tokens order; EOF ends every token stream
+TOKEN_TYPES = list(brewlex.tokens) + ['$end']
+TOKEN_IDS = {token_type: token_id for token_id, token_type in enumerate(TOKEN_TYPES)}
+EOF = TOKEN_IDS['$end']
+NAME = TOKEN_IDS['NAME']
+NUMBER = TOKEN_IDS['NUMBER']
+STRING = TOKEN_IDS['STRING']
+RESERVED_IDS = {word: TOKEN_IDS[token_type] for word, token_type in brewlex.reserved_map.items()}
+
+
+# The tokens of a program as parallel arrays: type ids, values, line numbers
+# and positions (lexpos), ending in an EOF token at the last line. lineno is
+# the line the lexer ended on, counting trailing newlines and comments
+class Token_Stream:
+    def __init__(self):
+        self.types = array('B')
+        self.values = []
+        self.lines = array('l')
+        self.positions = array('l')
+        self.lineno = 1
+
+    def __len__(self):
+        return len(self.types)
+
+    # the token at index as PLY would have produced it, None for EOF
+    def token(self, index):
+        if self.types[index] == EOF:
+            return None
+        # only syntax errors need one, so PLY isn't imported before that
+        from ply.lex import LexToken
+        token = LexToken()
+        token.type = TOKEN_TYPES[self.types[index]]
+        token.value = self.values[index]
+        token.lineno = self.lines[index]
+        token.lexpos = self.positions[index]
+        return token
+
+
+# The rules of brewlex combined into one regex in the order PLY tries them:
+# function rules in definition order, then string rules by decreasing regex
+# length, each in a group named after the rule. Ignored characters are
+# skipped ahead of the rules, as PLY skips them before trying any; \Z lets
+# trailing ones match at the end of the input
+def master_regex():
+    rules = vars(brewlex)
+    function_rules = [(name, rule.__doc__) for name, rule in rules.items()
+                      if name.startswith('t_') and callable(rule) and name != 't_error']
+    function_rules.sort(key=lambda rule: rules[rule[0]].__code__.co_firstlineno)
+    string_rules = [(name, rule) for name, rule in rules.items()
+                    if name.startswith('t_') and isinstance(rule, str) and name != 't_ignore']
+    string_rules.sort(key=lambda rule: len(rule[1]), reverse=True)
+    groups = [f"(?P<{name}>{pattern})" for name, pattern in function_rules + string_rules]
+    return re.compile(f"[{re.escape(brewlex.t_ignore)}]*(?:{'|'.join(groups)}|\\Z)", re.VERBOSE)
+
+
+# MASTER_REGEX and RULES (group index -> the token type id of a string rule,
+# or the name of a function rule), compiled by the first tokenize rather than
+# on import
+MASTER_REGEX = None
+RULES = None
+
+def build_rules():
+    global MASTER_REGEX, RULES
+    regex = master_regex()
+    rules = [None] * (regex.groups + 1)
+    for rule_name, group_index in regex.groupindex.items():
+        is_string_rule = isinstance(vars(brewlex)[rule_name], str)
+        rules[group_index] = TOKEN_IDS[rule_name[2:]] if is_string_rule else rule_name
+    MASTER_REGEX, RULES = regex, rules
+
+
+# Tokenizes program in a single pass over MASTER_REGEX, producing the same
+# tokens, values, line numbers and positions as brewlex's PLY lexer without
+# creating a token object per token. Characters no rule matches are reported
+# and skipped as t_error does (with the t_DOT catch-all there are none).
+def tokenize(program):
+    if RULES is None:
+        build_rules()
+    stream = Token_Stream()
+    add_type = stream.types.append
+    add_value = stream.values.append
+    add_line = stream.lines.append
+    add_position = stream.positions.append
+    rules = RULES
+    reserved_ids = RESERVED_IDS
+    lineno = 1
+    position = 0
+    for match in MASTER_REGEX.finditer(program):
+        if match.start() != position:
+            report_illegal(program[position:match.start()])
+        position = match.end()
+        group_index = match.lastindex
+        if group_index is None:
+            continue
+        rule = rules[group_index]
+        start = match.start(group_index)
+        if rule.__class__ is int:
+            add_type(rule)
+            add_value(match.group(group_index))
+        elif rule == 't_NAME':
+            value = match.group(group_index)
+            add_type(reserved_ids.get(value, NAME))
+            add_value(value)
+        elif rule == 't_newline':
+            lineno += position - start
+            continue
+        elif rule == 't_NUMBER':
+            add_type(NUMBER)
+            add_value(int(match.group(group_index)))
+        elif rule == 't_STRING':
+            add_type(STRING)
+            add_value(match.group(group_index)[1:-1])
+        else:  # t_comment
+            lineno += match.group(group_index).count("\n")
+            continue
+        add_line(lineno)
+        add_position(start)
+    add_type(EOF)
+    add_value(None)
+    add_line(lineno)
+    add_position(len(program))
+    stream.lineno = lineno
+    return stream
+
+
+def report_illegal(characters):
+    for character in characters:
+        print(f"Illegal character {character}")
@@ -0,0 +1,1220 @@
+import contextlib
+import io
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import array_lexer
+import brewlex
+from brewparse import Parser, LALR_PARSER, PRATT_PARSER, parse_program
+from element import Element, Generic_Node
+from incremental_parser import Incremental_Parser
+from intbase import ErrorType
+from interpreterv3 import Interpreter
+from program_cache import Program_Cache
+
+# typed versions of the recursive programs in test.py
+fib_program = """
+func fib(n: int): int {
+  if (n <= 2) {
+    return 1;
+  }
+  return fib(n - 2) + fib(n - 1);
+}
+
+func main(): void {
+  print(fib(25));
+}
+"""
+
+catalan_program = """
+func catalan(n: int): int {
+  if (n <= 1) {
+    return 1;
+  }
+  var res: int;
+  res = 0;
+  var i: int;
+  for (i = 0; i < n; i = i + 1) {
+    var left: int;
+    var right: int;
+    left = catalan(i);
+    right = catalan(n - i - 1);
+    res = res + (left * right);
+  }
+  return res;
+}
+
+func main(): void {
+  print(catalan(11));
+}
+"""
+
+# a counting loop nested inside several blocks, reading variables defined at the top
+deep_scopes_program = """
+func main(): void {
+  var total: int;
+  var step: int;
+  total = 0;
+  step = 3;
+  if (true) { var a: int;
+    if (true) { var b: int;
+      if (true) { var c: int;
+        if (true) { var d: int;
+          var i: int;
+          for (i = 0; i < 20000; i = i + 1) {
+            if (i > 0) {
+              total = total + step;
+            }
+          }
+        }
+      }
+    }
+  }
+  print(total);
+}
+"""
+
+# builds a linked list and walks it repeatedly through dotted field paths
+linked_list_program = """
+struct node {
+  val: int;
+  next: node;
+}
+
+func main(): void {
+  var head: node;
+  var n: node;
+  var i: int;
+  for (i = 0; i < 300; i = i + 1) {
+    n = new node;
+    n.val = i;
+    n.next = head;
+    head = n;
+  }
+  var total: int;
+  var round: int;
+  total = 0;
+  for (round = 0; round < 30; round = round + 1) {
+    for (n = head; n.next != nil; n = n.next) {
+      total = total + n.next.val;
+      n.val = n.val + 1;
+    }
+  }
+  print(total);
+}
+"""
+
+# allocation-heavy: a wide struct created on every iteration
+struct_alloc_program = """
+struct point {
+  x: int;
+  y: int;
+  label: string;
+  visible: bool;
+  left: point;
+  right: point;
+}
+
+func main(): void {
+  var p: point;
+  var prev: point;
+  var i: int;
+  var total: int;
+  total = 0;
+  for (i = 0; i < 20000; i = i + 1) {
+    p = new point;
+    p.x = i;
+    p.left = prev;
+    prev = p;
+    total = total + p.x + p.y;
+  }
+  print(total);
+}
+"""
+
+# loop-heavy arithmetic that also keeps a few thousand values alive in a list
+value_loop_program = """
+struct cell {
+  val: int;
+  big: int;
+  flag: bool;
+  next: cell;
+}
+
+func main(): void {
+  var head: cell;
+  var c: cell;
+  var i: int;
+  var j: int;
+  var total: int;
+  total = 0;
+  for (i = 0; i < 3000; i = i + 1) {
+    c = new cell;
+    c.val = i - (i / 7) * 7;
+    c.big = i * 1000;
+    c.flag = i > 1500;
+    c.next = head;
+    head = c;
+  }
+  for (j = 0; j < 10; j = j + 1) {
+    for (c = head; c != nil; c = c.next) {
+      if (c.flag && c.val < 3) {
+        total = total + c.val;
+      }
+    }
+  }
+  print(total);
+}
+"""
+
+# nested counted loops with a small body
+counted_loop_program = """
+func main(): void {
+  var i: int;
+  var j: int;
+  var n: int;
+  var total: int;
+  n = 300;
+  total = 0;
+  for (i = 0; i < n; i = i + 1) {
+    for (j = 0; j <= 100; j = j + 1) {
+      var k: int;
+      k = i + j;
+      total = total + k;
+    }
+  }
+  print(total);
+}
+"""
+
+# a general (non-counted) loop with an if in its body, 40 blocks deep
+nested_blocks_program = """
+func main(): void {
+  var total: int;
+  var i: int;
+  total = 0;
+""" + "  if (true) {\n" * 40 + """
+  for (i = 0; i < 20000; i = i * 1 + 1) {
+    if (i > 0) {
+      total = total + 1;
+    }
+  }
+""" + "  }\n" * 40 + """
+  print(total);
+}
+"""
+
+# every iteration enters two try blocks, one raise in a thousand
+try_heavy_program = """
+func check(i: int): int {
+  if (i - (i / 1000) * 1000 == 999) {
+    raise "rare";
+  }
+  return i;
+}
+
+func main(): void {
+  var i: int;
+  var total: int;
+  var caught: int;
+  total = 0;
+  caught = 0;
+  for (i = 0; i < 20000; i = i + 1) {
+    try {
+      try {
+        total = total + check(i);
+      }
+      catch "other" {
+        total = 0;
+      }
+    }
+    catch "rare" {
+      caught = caught + 1;
+    }
+  }
+  print(total, " ", caught);
+}
+"""
+
+# the same work with no try blocks and no raise
+no_try_program = """
+func check(i: int): int {
+  if (i - (i / 1000) * 1000 == 999) {
+    return -1;
+  }
+  return i;
+}
+
+func main(): void {
+  var i: int;
+  var total: int;
+  var caught: int;
+  var v: int;
+  total = 0;
+  caught = 0;
+  for (i = 0; i < 20000; i = i + 1) {
+    v = check(i);
+    if (v < 0) {
+      caught = caught + 1;
+    } else {
+      total = total + v;
+    }
+  }
+  print(total, " ", caught);
+}
+"""
+
+# walks a list through guards whose right-hand side is an expensive call
+guard_traversal_program = """
+struct node {
+  val: int;
+  next: node;
+}
+
+func heavy(v: int): bool {
+  var i: int;
+  var sum: int;
+  sum = 0;
+  for (i = 0; i < 5; i = i + 1) {
+    sum = sum + v;
+  }
+  return sum > 100;
+}
+
+func main(): void {
+  var head: node;
+  var n: node;
+  var i: int;
+  var round: int;
+  var hits: int;
+  for (i = 0; i < 500; i = i + 1) {
+    n = new node;
+    n.val = i;
+    n.next = head;
+    head = n;
+  }
+  hits = 0;
+  for (round = 0; round < 10; round = round + 1) {
+    for (n = head; n != nil; n = n.next) {
+      if (n.val - (n.val / 10) * 10 == 0 && heavy(n.val)) {
+        hits = hits + 1;
+      }
+      if (n.val < 480 || heavy(n.val)) {
+        hits = hits + 1;
+      }
+    }
+  }
+  print(hits);
+}
+"""
+
+# recursion far deeper than Python's own stack allows
+deep_recursion_program = """
+func depth(n: int): int {
+  if (n == 0) {
+    return 0;
+  }
+  return 1 + depth(n - 1);
+}
+
+func main(): void {
+  print(depth(100000));
+}
+"""
+
+
+# a matrix-style walk whose bounds and scale factors are recomputed on every
+# iteration unless they are moved out of the loops
+invariant_loop_program = """
+func main(): void {
+  var rows: int;
+  var cols: int;
+  var scale: int;
+  var label: string;
+  var i: int;
+  var j: int;
+  var total: int;
+  rows = 60;
+  cols = 50;
+  scale = 7;
+  label = "cell";
+  total = 0;
+  for (i = 0; i < rows * 2 - 1; i = i + 1) {
+    for (j = 0; j < cols + cols / 2; j = j + 1) {
+      total = total + i * (scale * scale + rows) - j * (cols - scale * 3);
+      if ((label + "s") == "cells" && scale * 2 > cols - rows) {
+        total = total + 1;
+      }
+    }
+  }
+  print(total);
+}
+"""
+
+
+# a loop whose body mixes constant expressions, dead branches and real work
+def generate_constant_program(statements, seed):
+    rng = random.Random(seed)
+    body = []
+    for i in range(statements):
+        a, b, c = rng.randint(1, 60), rng.randint(1, 60), rng.randint(1, 9)
+        kind = i % 4
+        if kind == 0:
+            body.append(f"total = total + {a} * {b} - {c} * ({a} / {c});")
+        elif kind == 1:
+            body.append(f'label = "n" + {a} + "-" + {b};')
+        elif kind == 2:
+            body.append(f"if ({a} > {b} && !false) {{ total = total + {c}; }} else {{ total = total - {c}; }}")
+        else:
+            body.append(f'if (false) {{ print("debug ", {a}); total = 0; }}')
+    return """
+func main(): void {
+  var i: int;
+  var total: int;
+  var label: string;
+  total = 0;
+  for (i = 0; i < 2000; i = i + 1) {
+    """ + "\n    ".join(body) + """
+  }
+  print(total, " ", label);
+}
+"""
+
+
+# count small functions that each loop, branch and call the previous one
+# (in chains of ten); main only calls the last, so parsing dominates a run
+def generate_functions_program(count):
+    functions = []
+    for n in range(count):
+        call = f"f{n - 1}(x - 1)" if n % 10 != 0 else "x"
+        functions.append(f"""
+func f{n}(x: int): int {{
+  var total: int;
+  var i: int;
+  total = 0;
+  for (i = 0; i < 3; i = i + 1) {{
+    if (i * {n % 7} > x) {{
+      total = total + i;
+    }} else {{
+      total = total - 1;
+    }}
+  }}
+  return total + {call};
+}}""")
+    return "".join(functions) + f"""
+func main(): void {{
+  print(f{count - 1}(5));
+}}
+"""
+
+
+def peak_memory(program, inp=None, **interpreter_args):
+    interpreter = Interpreter(console_output=False, inp=inp, **interpreter_args)
+    tracemalloc.start()
+    interpreter.run(program)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def time_run(program, inp=None, **interpreter_args):
+    interpreter = Interpreter(console_output=False, inp=inp, **interpreter_args)
+    start = time.perf_counter()
+    interpreter.run(program)
+    return time.perf_counter() - start, interpreter.get_output()
+
+
+def compare(name, program, configs):
+    print(f"== {name}")
+    baseline_time, baseline_output = None, None
+    for label, interpreter_args in configs:
+        elapsed, output = time_run(program, **interpreter_args)
+        if baseline_time is None:
+            baseline_time, baseline_output = elapsed, output
+        elif output != baseline_output:
+            raise AssertionError(f"{label} output {output} differs from {baseline_output}")
+        print(f"  {label:<12} {elapsed:8.3f}s  x{baseline_time / elapsed:5.2f}")
+
+
+#####################################################################
+# benchmarks
+#####################################################################
+
+def bench_engines():
+    configs = [
+        ("tree", {}),
+        ("closure", {"engine": Interpreter.CLOSURE_ENGINE}),
+        ("vm", {"engine": Interpreter.VM_ENGINE}),
+    ]
+    compare("fib(25)", fib_program, configs)
+    compare("catalan(11)", catalan_program, configs)
+    compare("deep scopes", deep_scopes_program, configs)
+    compare("linked list", linked_list_program, configs)
+
+
+def bench_structs():
+    configs = [
+        ("tree", {}),
+        ("closure", {"engine": Interpreter.CLOSURE_ENGINE}),
+        ("vm", {"engine": Interpreter.VM_ENGINE}),
+    ]
+    compare("struct alloc", struct_alloc_program, configs)
+    compare("linked list", linked_list_program, configs)
+
+
+def bench_values():
+    configs = [
+        ("tree", {}),
+        ("closure", {"engine": Interpreter.CLOSURE_ENGINE}),
+        ("vm", {"engine": Interpreter.VM_ENGINE}),
+    ]
+    compare("value loop", value_loop_program, configs)
+    for label, interpreter_args in configs:
+        print(f"  {label:<12} peak {peak_memory(value_loop_program, **interpreter_args) / 1024:8.0f} KiB")
+
+
+def bench_memo():
+    configs = [
+        ("tree", {}),
+        ("tree memo", {"memoize": True}),
+        ("closure memo", {"engine": Interpreter.CLOSURE_ENGINE, "memoize": True}),
+        ("vm memo", {"engine": Interpreter.VM_ENGINE, "memoize": True}),
+    ]
+    for name, program in [("fib(25)", fib_program), ("catalan(11)", catalan_program)]:
+        compare(name, program, configs)
+        interpreter = Interpreter(console_output=False, memoize=True)
+        interpreter.run(program)
+        for func_key, (hits, misses) in interpreter.get_memo_stats().items():
+            print(f"  {func_key}: {hits} hits, {misses} misses")
+
+
+def bench_loops():
+    configs = [
+        ("tree", {}),
+        ("closure", {"engine": Interpreter.CLOSURE_ENGINE}),
+        ("vm", {"engine": Interpreter.VM_ENGINE}),
+    ]
+    compare("counted loops", counted_loop_program, configs)
+    compare("deep scopes", deep_scopes_program, configs)
+    compare("nested blocks", nested_blocks_program, configs)
+
+
+# programs that raise, with the output and the error (None if the program
+# ends normally) every engine must produce: handlers match by string, raises
+# unwind the frames and block scopes of the calls and blocks they leave (and
+# the VM's operand stack), a raise in a handler goes to the try around it, an
+# uncaught raise is a FAULT_ERROR and raising a non-string a TYPE_ERROR
+raising_programs = [
+    ("""
+func thrower(n: int): int {
+  var x: int;
+  x = n;
+  if (n > 2) {
+    raise "deep";
+  }
+  return x + thrower(n + 1);
+}
+
+func main(): void {
+  var x: int;
+  var i: int;
+  var total: int;
+  x = 1;
+  try {
+    var x: string;
+    x = "inner";
+    try {
+      print(thrower(0));
+    }
+    catch "other" {
+      print("wrong handler");
+    }
+    print("not reached");
+  }
+  catch "deep" {
+    print(x);
+  }
+  total = 0;
+  for (i = 0; i < 5; i = i + 1) {
+    try {
+      total = total + i * 10 + thrower(i);
+    }
+    catch "deep" {
+      total = total + 1;
+    }
+  }
+  print(total);
+  try {
+    try {
+      raise "first";
+    }
+    catch "first" {
+      print("caught first");
+      raise "second";
+    }
+  }
+  catch "second" {
+    print("caught second");
+  }
+}""", ["1", "5", "caught first", "caught second"], None),
+    ("""
+func main(): void {
+  var i: int;
+  var total: int;
+  total = 0;
+  for (i = 0; i < 3; i = i + 1) {
+    try {
+      if (i > 0) {
+        var y: int;
+        y = i;
+        if (y > 1) {
+          raise "nested";
+        }
+      }
+      total = total + 100;
+    }
+    catch "nested" {
+      var z: int;
+      z = 7;
+      total = total + z;
+    }
+    if (true) {
+      var w: int;
+      w = 1000;
+      total = total + w;
+    }
+  }
+  print(total);
+}""", ["3207"], None),
+    ("""
+func fail(): void {
+  raise "uncaught";
+}
+
+func main(): void {
+  print("before");
+  try {
+    fail();
+  }
+  catch "other" {
+    print("wrong handler");
+  }
+  print("after");
+}""", ["before"], ErrorType.FAULT_ERROR),
+    ("""
+func main(): void {
+  try {
+    raise 5;
+  }
+  catch "5" {
+    print("caught");
+  }
+}""", [], ErrorType.TYPE_ERROR),
+]
+
+# raises from a call in the middle of an expression, COUNT times; whatever a
+# raise leaves behind (operands, frames) would grow with COUNT
+raise_in_expression_program = """
+func fail(n: int): int {
+  raise "x";
+}
+
+func main(): void {
+  var i: int;
+  var total: int;
+  total = 0;
+  for (i = 0; i < COUNT; i = i + 1) {
+    try {
+      total = total + i * (i + fail(i));
+    }
+    catch "x" {
+      total = total + 1;
+    }
+  }
+  print(total);
+}
+"""
+
+
+def bench_exceptions():
+    engines = [Interpreter.TREE_ENGINE, Interpreter.CLOSURE_ENGINE, Interpreter.VM_ENGINE]
+    for program, output, error_type in raising_programs:
+        for engine in engines:
+            interpreter = Interpreter(console_output=False, engine=engine)
+            try:
+                interpreter.run(program)
+            except Exception:
+                pass
+            result = (interpreter.get_output(), interpreter.get_error_type_and_line()[0])
+            if result != (output, error_type):
+                raise AssertionError(f"{engine} gave {result}, expected {(output, error_type)} on:\n{program}")
+        few, many = (raise_in_expression_program.replace("COUNT", str(count)) for count in (1000, 20000))
+        # the first run builds the parser
+        peak_memory(few, engine=engine)
+        growth = peak_memory(many, engine=engine) - peak_memory(few, engine=engine)
+        if growth > 64 * 1024:
+            raise AssertionError(f"{engine} peak memory grows by {growth // 1024} KiB with 19000 more raises")
+    print(f"== {len(raising_programs)} raising programs")
+    print("  every engine catches, unwinds and reports errors alike")
+    print("  memory doesn't grow with the number of raises")
+    print("== try blocks that rarely raise")
+    for label, engine in [("tree", Interpreter.TREE_ENGINE), ("closure", Interpreter.CLOSURE_ENGINE), ("vm", Interpreter.VM_ENGINE)]:
+        with_try, output = time_run(try_heavy_program, engine=engine)
+        without_try, expected = time_run(no_try_program, engine=engine)
+        if output != expected:
+            raise AssertionError(f"{label} output {output} differs from {expected}")
+        print(f"  {label:<12} {with_try:8.3f}s  without try {without_try:8.3f}s")
+
+
+# programs whose right operands of && and || have effects: a call that
+# prints (in check, which the JIT compiles once it is hot) and a nil
+# dereference behind a nil guard. Each has the output and error (None if it
+# ends normally) without short_circuit, where every operand is evaluated,
+# and the output with it, where the right operands are skipped
+short_circuit_programs = [
+    ("""
+func noisy(n: int): bool {
+  print("evaluated ", n);
+  return true;
+}
+
+func check(n: int): int {
+  var count: int;
+  count = 0;
+  if (n < 0 && noisy(n)) {
+    count = count + 1;
+  }
+  if (n >= 0 || noisy(n)) {
+    count = count + 2;
+  }
+  return count;
+}
+
+func main(): void {
+  var i: int;
+  var total: int;
+  total = 0;
+  for (i = 0; i < 60; i = i + 1) {
+    total = total + check(i);
+  }
+  print(total);
+}""", [f"evaluated {i}" for i in range(60) for _ in range(2)] + ["120"], None, ["120"]),
+    ("""
+struct node {
+  v: bool;
+}
+
+func main(): void {
+  var p: node;
+  if (p != nil && p.v) {
+    print("dereferenced");
+  }
+  print("guarded");
+}""", [], ErrorType.FAULT_ERROR, ["guarded"]),
+]
+
+
+def bench_short_circuit():
+    engine_configs = [
+        ("tree", {}),
+        ("tree jit", {"jit": True}),
+        ("closure", {"engine": Interpreter.CLOSURE_ENGINE}),
+        ("vm", {"engine": Interpreter.VM_ENGINE}),
+    ]
+    for program, output, error_type, short_circuit_output in short_circuit_programs:
+        for label, interpreter_args in engine_configs:
+            for short_circuit, expected in [(False, (output, error_type)), (True, (short_circuit_output, None))]:
+                interpreter = Interpreter(console_output=False, short_circuit=short_circuit, **interpreter_args)
+                try:
+                    interpreter.run(program)
+                except Exception:
+                    pass
+                result = (interpreter.get_output(), interpreter.get_error_type_and_line()[0])
+                if result != expected:
+                    raise AssertionError(f"{label} with short_circuit={short_circuit} gave {result}, expected {expected} on:\n{program}")
+                if interpreter_args.get("jit") and "func check" in program and "check_1" not in interpreter.get_jit_functions():
+                    raise AssertionError(f"{label} didn't compile check")
+    print(f"== {len(short_circuit_programs)} programs with effects on the right of && and ||")
+    print("  every engine skips them with short_circuit and evaluates them without")
+    configs = [
+        ("tree", {}),
+        ("tree sc", {"short_circuit": True}),
+        ("closure", {"engine": Interpreter.CLOSURE_ENGINE}),
+        ("closure sc", {"engine": Interpreter.CLOSURE_ENGINE, "short_circuit": True}),
+        ("vm", {"engine": Interpreter.VM_ENGINE}),
+        ("vm sc", {"engine": Interpreter.VM_ENGINE, "short_circuit": True}),
+    ]
+    compare("guarded traversal", guard_traversal_program, configs)
+    compare("value loop", value_loop_program, configs)
+
+
+def bench_optimizer():
+    for seed in range(3):
+        program = generate_constant_program(12, seed)
+        for label, engine in [("tree", Interpreter.TREE_ENGINE), ("closure", Interpreter.CLOSURE_ENGINE), ("vm", Interpreter.VM_ENGINE)]:
+            compare(f"generated #{seed} {label}", program, [
+                ("plain", {"engine": engine}),
+                ("optimized", {"engine": engine, "optimize": True}),
+            ])
+        interpreter = Interpreter(console_output=False, optimize=True)
+        interpreter.run(program)
+        print(f"  {interpreter.get_nodes_removed()} nodes removed")
+
+
+def bench_licm():
+    for label, engine in [("tree", Interpreter.TREE_ENGINE), ("closure", Interpreter.CLOSURE_ENGINE), ("vm", Interpreter.VM_ENGINE)]:
+        compare(f"invariant loops {label}", invariant_loop_program, [
+            ("plain", {"engine": engine}),
+            ("licm", {"engine": engine, "licm": True}),
+        ])
+    interpreter = Interpreter(console_output=False, licm=True)
+    interpreter.run(invariant_loop_program)
+    print(f"  {interpreter.get_hoisted_count()} expressions hoisted")
+
+
+def bench_jit():
+    configs = [
+        ("tree", {}),
+        ("tree jit", {"jit": True}),
+        ("closure", {"engine": Interpreter.CLOSURE_ENGINE}),
+        ("vm", {"engine": Interpreter.VM_ENGINE}),
+    ]
+    compare("fib(25)", fib_program, configs)
+    compare("catalan(12)", catalan_program.replace("catalan(11)", "catalan(12)"), configs)
+    interpreter = Interpreter(console_output=False, jit=True)
+    interpreter.run(fib_program)
+    print(f"  compiled {interpreter.get_jit_functions()}")
+
+
+def bench_cache():
+    program = generate_functions_program(200)
+    runs = 20
+    with tempfile.TemporaryDirectory() as cache_dir:
+        print(f"== {runs} runs of 200 functions")
+        baseline_time, baseline_output = None, None
+        for label, interpreter_args in [("no cache", {}), ("cache", {"cache_dir": cache_dir})]:
+            start = time.perf_counter()
+            for _ in range(runs):
+                interpreter = Interpreter(console_output=False, **interpreter_args)
+                interpreter.run(program)
+            elapsed = time.perf_counter() - start
+            if baseline_time is None:
+                baseline_time, baseline_output = elapsed, interpreter.get_output()
+            elif interpreter.get_output() != baseline_output:
+                raise AssertionError(f"{label} output {interpreter.get_output()} differs from {baseline_output}")
+            print(f"  {label:<12} {elapsed:8.3f}s  x{baseline_time / elapsed:5.2f}")
+        # every run shares the cache directory, so only the first one parses
+        hits = 0
+        for _ in range(runs):
+            interpreter = Interpreter(console_output=False, cache_dir=cache_dir)
+            interpreter.run(program)
+            hits += interpreter.get_cache_stats()[0]
+        print(f"  {hits}/{runs} warm runs served from the cache")
+        # an entry signed with another key is a miss and is never unpickled
+        forger = Program_Cache(cache_dir, secret=os.urandom(Program_Cache.KEY_BYTES))
+        key = interpreter.program_cache.key(program, False, False)
+        forger.store(key, (Element(Interpreter.PROGRAM_NODE, structs=[], functions=[]), [], 0, 0))
+        interpreter = Interpreter(console_output=False, cache_dir=cache_dir)
+        interpreter.run(program)
+        if interpreter.get_cache_stats()[0] != 0 or interpreter.get_output() != baseline_output:
+            raise AssertionError("a cache entry signed with another key was loaded")
+        print("  an entry signed with another key is rejected")
+
+
+# many programs parsed at once on a thread pool, each task with a Parser of
+# its own; the trees and the final line numbers must match a serial parse
+def bench_parser_threads():
+    programs = [fib_program, catalan_program, deep_scopes_program, linked_list_program, struct_alloc_program,
+                try_heavy_program, guard_traversal_program, invariant_loop_program, generate_functions_program(30)]
+    programs += [generate_constant_program(40, seed) for seed in range(8)]
+
+    def parse(program):
+        parser = Parser()
+        ast = parser.parse(program)
+        return str(ast), parser.lineno
+
+    expected = [parse(program) for program in programs]
+    tasks = list(range(len(programs))) * 20
+    random.Random(0).shuffle(tasks)
+    switch_interval = sys.getswitchinterval()
+    # switch threads as often as possible to provoke interleaving
+    sys.setswitchinterval(1e-6)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda index: parse(programs[index]), tasks))
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.setswitchinterval(switch_interval)
+    mismatches = sum(1 for index, result in zip(tasks, results) if result != expected[index])
+    if mismatches:
+        raise AssertionError(f"{mismatches} of {len(tasks)} concurrent parses differ from the serial parse")
+    print(f"== {len(tasks)} parses on 8 threads")
+    print(f"  {elapsed:8.3f}s, every tree and line count identical")
+
+
+# programs with random token edits (deleted, duplicated, replaced or swapped
+# tokens), nearly all of them syntax errors
+def mutate_program(program, count, seed):
+    rng = random.Random(seed)
+    tokens = re.findall(r'"[^"]*"|\w+|\S', program)
+    replacements = ['(', ')', '{', '}', ';', ',', '.', '=', '-', '!', '@', 'func', 'struct', 'var', 'else', 'catch', 'x', '1', '"s"']
+    mutants = []
+    for _ in range(count):
+        mutant = list(tokens)
+        for _ in range(rng.randint(1, 5)):
+            i, j = rng.randrange(len(mutant)), rng.randrange(len(mutant))
+            edit = rng.randrange(4)
+            if edit == 0 and len(mutant) > 1:
+                del mutant[i]
+            elif edit == 1:
+                mutant.insert(i, mutant[j])
+            elif edit == 2:
+                mutant[i] = rng.choice(replacements)
+            else:
+                mutant[i], mutant[j] = mutant[j], mutant[i]
+        mutants.append(rng.choice([" ", "\n"]).join(mutant))
+    return mutants
+
+
+def bench_pratt():
+    parser = Parser()
+
+    # the tree (or syntax error), everything printed while parsing, the
+    # lexer's final line number and the source position of every node
+    def parse(program, method):
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            try:
+                tree = parser.parse(program, method)
+            except SyntaxError:
+                tree = None
+        positions = [node.position for node in collect_nodes(tree, [])]
+        return str(tree), printed.getvalue(), parser.lineno, positions
+
+    programs = [fib_program, catalan_program, deep_scopes_program, linked_list_program, struct_alloc_program,
+                try_heavy_program, guard_traversal_program, invariant_loop_program, generate_functions_program(20)]
+    programs += [generate_constant_program(20, seed) for seed in range(4)]
+    corpus = list(programs)
+    for seed, program in enumerate(programs):
+        corpus += mutate_program(program, 200, seed)
+    errors = 0
+    for program in corpus:
+        expected = parse(program, LALR_PARSER)
+        if parse(program, PRATT_PARSER) != expected:
+            raise AssertionError(f"pratt parser differs from the LALR parser on:\n{program}")
+        errors += bool(expected[1])
+    print(f"== parity on {len(corpus)} programs ({errors} with syntax errors)")
+    print("  every tree, node position, error message and line count identical")
+
+    for name, program in [("1000 functions", generate_functions_program(1000)),
+                          ("2000 statements", generate_constant_program(2000, 0))]:
+        print(f"== parse {name} ({len(program) // 1024} KiB)")
+        baseline = None
+        for method in [LALR_PARSER, PRATT_PARSER]:
+            start = time.perf_counter()
+            parser.parse(program, method)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print(f"  {method:<12} {elapsed:8.3f}s  x{baseline / elapsed:5.2f}  {len(program) / elapsed / 1e6:6.2f} MB/s")
+
+
+# source mixing every kind of token with comments, newlines in runs, tabs and
+# characters only the t_DOT catch-all matches
+def generate_noisy_program(size, seed):
+    rng = random.Random(seed)
+    pieces = ["func", "struct", "var", "if", "else", "return", "true", "nil", "new", "try", "catch", "raise",
+              "name", "Var", "_x9", "12", "007", '"text"', '""', '"a\tb"', "==", "!=", ">=", "<=", "&&", "||",
+              "(", ")", "{", "}", ";", ",", ":", ".", "=", "+", "-", "*", "/", "!", "<", ">", "@", "#", "\r",
+              '"', "|", "&", "é", "/* comment */", "/* two\nlines */", "/* open", " ", "  ", "\t", "\n", "\n\n"]
+    parts, length = [], 0
+    while length < size:
+        piece = rng.choice(pieces)
+        parts.append(piece)
+        length += len(piece)
+    return "".join(parts)
+
+
+def bench_lexer():
+    def ply_tokens(program):
+        ply_lexer = brewlex.get_lexer().clone()
+        ply_lexer.lineno = 1
+        ply_lexer.input(program)
+        tokens = []
+        token = ply_lexer.token()
+        while token is not None:
+            tokens.append((token.type, token.value, token.lineno, token.lexpos))
+            token = ply_lexer.token()
+        return tokens, ply_lexer.lineno
+
+    def array_tokens(program):
+        stream = array_lexer.tokenize(program)
+        tokens = [(array_lexer.TOKEN_TYPES[stream.types[i]], stream.values[i], stream.lines[i], stream.positions[i])
+                  for i in range(len(stream) - 1)]
+        return tokens, stream.lineno
+
+    for name, program in [("10000 functions", generate_functions_program(10000)),
+                          ("noisy source", generate_noisy_program(2 * 1024 * 1024, 0))]:
+        print(f"== tokenize {name} ({len(program) / 2 ** 20:.1f} MiB)")
+        start = time.perf_counter()
+        ply_lexer = brewlex.get_lexer().clone()
+        ply_lexer.input(program)
+        while ply_lexer.token() is not None:
+            pass
+        ply_time = time.perf_counter() - start
+        start = time.perf_counter()
+        stream = array_lexer.tokenize(program)
+        array_time = time.perf_counter() - start
+        if array_tokens(program) != ply_tokens(program):
+            raise AssertionError(f"token streams differ on {name}")
+        print(f"  ply          {ply_time:8.3f}s  x 1.00")
+        print(f"  array        {array_time:8.3f}s  x{ply_time / array_time:5.2f}  {len(stream) - 1} identical tokens")
+
+
+# the tree with every node in the previous dict-per-node layout
+def to_dict_nodes(value):
+    if isinstance(value, Element):
+        return Generic_Node(value.elem_type, **{key: to_dict_nodes(child) for key, child in value.dict.items()})
+    if isinstance(value, list):
+        return [to_dict_nodes(child) for child in value]
+    return value
+
+
+def collect_nodes(value, nodes):
+    if isinstance(value, Element):
+        nodes.append(value)
+        for child in value.dict.values():
+            collect_nodes(child, nodes)
+    elif isinstance(value, list):
+        for child in value:
+            collect_nodes(child, nodes)
+    return nodes
+
+
+def tree_size(build):
+    tracemalloc.start()
+    tree = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return tree, size
+
+
+def bench_ast():
+    program = generate_functions_program(1000)
+    slotted, slotted_size = tree_size(lambda: parse_program(program))
+    dict_nodes, dict_size = tree_size(lambda: to_dict_nodes(slotted))
+    nodes = len(collect_nodes(slotted, []))
+    print(f"== memory for {nodes} nodes")
+    print(f"  dict nodes   {dict_size / nodes:8.1f} bytes/node")
+    print(f"  slotted      {slotted_size / nodes:8.1f} bytes/node  x{dict_size / slotted_size:5.2f}")
+
+    # the walker's reads of operator operands: node.dict['op1'] before,
+    # node.op1 now
+    operators = [node for node in collect_nodes(slotted, []) if node.elem_type in ('+', '-', '*', '>', '<')]
+    dict_operators = [node for node in collect_nodes(dict_nodes, []) if node.elem_type in ('+', '-', '*', '>', '<')]
+    print(f"== reading the operands of {len(operators)} operators 200 times")
+    start = time.perf_counter()
+    for _ in range(200):
+        for node in dict_operators:
+            node.dict['op1'], node.dict['op2']
+    dict_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(200):
+        for node in operators:
+            node.op1, node.op2
+    slotted_time = time.perf_counter() - start
+    print(f"  dict nodes   {dict_time:8.3f}s")
+    print(f"  slotted      {slotted_time:8.3f}s  x{dict_time / slotted_time:5.2f}")
+
+
+
+# programs that fail at a known line: a check deep in a call made from a
+# loop, a bad return reported at the call, and a raise nothing catches
+error_line_programs = [
+    ("""func f(a: int): int {
+  var x: int;
+  x = a + 1;
+  return x + "s";
+}
+func main(): void {
+  var y: int;
+  for (y = 0; y < 3; y = y + 1) {
+    if (y == 2) {
+      print(f(y));
+    }
+  }
+}""", 10),
+    ("""func g(): int {
+  return "s";
+}
+func main(): void {
+  print(1);
+
+  g();
+}""", 7),
+    ("""func main(): void {
+  try {
+    raise "a";
+  } catch "a" {
+    print("caught");
+  }
+  raise
+    "b";
+}""", 7),
+]
+
+
+# every engine reports the line of the statement that failed; the lines cost
+# nothing until an error is raised, so runs that don't fail keep their speed
+def bench_error_lines():
+    engines = [Interpreter.TREE_ENGINE, Interpreter.CLOSURE_ENGINE, Interpreter.VM_ENGINE]
+    for program, line in error_line_programs:
+        for engine in engines:
+            interpreter = Interpreter(console_output=False, engine=engine)
+            try:
+                interpreter.run(program)
+            except Exception as error:
+                message = str(error)
+            if interpreter.get_error_type_and_line()[1] != line or f" on line {line}:" not in message:
+                raise AssertionError(f"{engine} reported {message!r}, expected line {line}")
+    print(f"== error lines of {len(error_line_programs)} failing programs")
+    print("  every engine reports the failing statement's line")
+    for engine in engines:
+        elapsed, _ = time_run(fib_program, engine=engine)
+        print(f"  fib {engine:<12} {elapsed:8.3f}s")
+
+
+# An editor session on a large program: after a first parse, one function
+# changes at a time, first keeping its length (everything else stays where it
+# was) and then gaining a line (every later definition moves). Parity covers
+# the corpus, the corpus moved down a line and its mutants, each parsed after
+# the original, and checks that each parse leaves the tree before it as it was
+def bench_incremental():
+    def parse(parser, program):
+        printed = io.StringIO()
+        with contextlib.redirect_stdout(printed):
+            try:
+                tree = parser.parse(program)
+            except SyntaxError:
+                tree = None
+        return tree, snapshot(tree) + (printed.getvalue(), parser.lineno)
+
+    def snapshot(tree):
+        return str(tree), [node.position for node in collect_nodes(tree, [])]
+
+    full_parser = Parser()
+    programs = [fib_program, catalan_program, deep_scopes_program, linked_list_program, struct_alloc_program,
+                try_heavy_program, guard_traversal_program, invariant_loop_program, generate_functions_program(20)]
+    checked = 0
+    for seed, program in enumerate(programs):
+        for mutant in [program] + mutate_program(program, 100, seed):
+            incremental_parser = Incremental_Parser()
+            previous_tree, previous = None, None
+            # the newline moves every definition of program
+            for source in [program, "\n" + program, mutant, program]:
+                tree, result = parse(incremental_parser, source)
+                if result != parse(full_parser, source)[1]:
+                    raise AssertionError(f"incremental parse differs from a full parse on:\n{source}")
+                # a reparse must not change the trees earlier parses returned
+                if previous_tree is not None and snapshot(previous_tree) != previous:
+                    raise AssertionError(f"reparsing changed the previous tree of:\n{source}")
+                previous_tree, previous = tree, result[:2]
+                checked += 1
+    print(f"== parity on {checked} parses")
+    print("  every tree, node position, error message and line count identical")
+    print("  earlier trees unchanged by later parses")
+
+    program = generate_functions_program(1000)
+    target = "if (i * 3 > x) {"
+    edits = [("same length", target.replace("3", "4")), ("one more line", target + "\n      print(x);")]
+    incremental_parser = Incremental_Parser()
+    previous_tree = incremental_parser.parse(program)
+    for label, replacement in edits:
+        previous = snapshot(previous_tree)
+        # change the function in the middle of the program
+        at = program.index(target, len(program) // 2)
+        edited = program[:at] + replacement + program[at + len(target):]
+        start = time.perf_counter()
+        full_tree = full_parser.parse(edited)
+        full_time = time.perf_counter() - start
+        start = time.perf_counter()
+        tree = incremental_parser.parse(edited)
+        incremental_time = time.perf_counter() - start
+        if snapshot(tree) != snapshot(full_tree):
+            raise AssertionError(f"incremental parse of the {label} edit differs from a full parse")
+        if snapshot(previous_tree) != previous:
+            raise AssertionError(f"incremental parse of the {label} edit changed the previous tree")
+        print(f"== 1000 functions, one changed ({label})")
+        print(f"  full          {full_time:8.3f}s")
+        print(f"  incremental   {incremental_time:8.3f}s  x{full_time / incremental_time:6.2f}  ({incremental_parser.reparsed} reparsed)")
+        program, previous_tree = edited, tree
+
+
+# Startup of a fresh process: importing the interpreter, then parsing a first
+# program. The parser is built on that first LALR parse, from the frozen
+# tables in parsetab.py; "reflective build" is what import used to do, lex()
+# and yacc() reflecting over the rules. Each step is timed inside the
+# process, best of the runs
+def bench_startup():
+    first_program = "func main() { print(1); }"
+    steps = [
+        ("import", "import interpreterv3"),
+        ("import + first parse", f"import interpreterv3, brewparse; brewparse.parse_program({first_program!r})"),
+        ("import + first pratt parse", f"import interpreterv3, brewparse; brewparse.parse_program({first_program!r}, 'pratt')"),
+        ("import + reflective build", "import interpreterv3, brewlex, brewparse; from ply import yacc; "
+                                      "brewlex.get_lexer(); yacc.yacc(module=brewparse)"),
+    ]
+    runs = 10
+    print(f"== startup, best of {runs} fresh processes")
+    for label, step in steps:
+        script = f"import time; start = time.perf_counter(); {step}; print(time.perf_counter() - start)"
+        times = []
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    capture_output=True, text=True, check=True)
+            times.append(float(result.stdout.split()[-1]))
+        print(f"  {label:<28} {min(times) * 1000:8.1f}ms")
+
+def bench_recursion():
+    compare("depth(100000)", deep_recursion_program, [("vm", {"engine": Interpreter.VM_ENGINE})])
+    for engine in [Interpreter.TREE_ENGINE, Interpreter.CLOSURE_ENGINE]:
+        try:
+            time_run(deep_recursion_program, engine=engine)
+            print(f"  {engine:<12} ok")
+        except RecursionError:
+            print(f"  {engine:<12} RecursionError")
+
+
+BENCHMARKS = {
+    "engines": bench_engines,
+    "structs": bench_structs,
+    "values": bench_values,
+    "memo": bench_memo,
+    "recursion": bench_recursion,
+    "loops": bench_loops,
+    "exceptions": bench_exceptions,
+    "short_circuit": bench_short_circuit,
+    "optimizer": bench_optimizer,
+    "licm": bench_licm,
+    "jit": bench_jit,
+    "cache": bench_cache,
+    "parser_threads": bench_parser_threads,
+    "pratt": bench_pratt,
+    "lexer": bench_lexer,
+    "ast": bench_ast,
+    "error_lines": bench_error_lines,
+    "incremental": bench_incremental,
+    "startup": bench_startup,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+    for name in names:
+        BENCHMARKS[name]()
@@ -1,5 +1,4 @@
-
-from ply import lex
+import threading
 
 reserved = (
     "VAR",
@@ -130,7 +129,27 @@ def t_error(t):
     t.lexer.skip(1)
 
 def reset_lineno():
-    lexer.lineno = 1
-
-# Build the lexer
-lexer = lex.lex()
+    get_lexer().lineno = 1
+
+# Build the lexer on first use: lex.lex() reflects over the rules above and
+# compiles them, and importing PLY costs more than that, which a process that
+# never reaches the PLY lexer (array_lexer tokenizes on its own) shouldn't pay.
+# brewlex.lexer still works, building it when first read
+built_lexer = None
+lexer_lock = threading.Lock()
+
+def get_lexer():
+    global built_lexer
+    if built_lexer is None:
+        with lexer_lock:
+            if built_lexer is None:
+                from ply import lex
+                # lex() reads the rules from this module's globals, in
+                # definition order, which orders string rules of equal length
+                built_lexer = lex.lex()
+    return built_lexer
+
+def __getattr__(name):
+    if name == "lexer":
+        return get_lexer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
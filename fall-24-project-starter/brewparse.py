@@ -1,7 +1,11 @@
-from element import Element
+import copy
+import threading
+
+import brewlex
+from element import Element, POSITION_BITS
 from brewlex import *
 from intbase import InterpreterBase
-from ply import yacc
+from pratt_parser import Pratt_Parser
 
 # Parsing rules
 
@@ -14,6 +18,12 @@ precedence = (
     ("right", "UMINUS", "NOT"),
 )
 
+# the source position of p[n], packed as pack_position does: of its token, or
+# of a variable_w_dot's first NAME
+def position(p, n):
+    symbol = p.slice[n]
+    return symbol.lineno << POSITION_BITS | symbol.lexpos
+
 def collapse_items(p, group_index, singleton_index):
     if len(p) == 2:
         p[0] = [p[1]]
@@ -29,6 +39,7 @@ def p_program(p):
         p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=[], functions=p[1])
     else:
         p[0] = Element(InterpreterBase.PROGRAM_NODE, structs=p[1], functions=p[2])
+    p[0].position = p[1][0].position
 
 def p_structs(p):
     """structs : structs struct
@@ -37,7 +48,7 @@ def p_structs(p):
 
 def p_struct(p):
    "struct : STRUCT NAME LBRACE fields RBRACE"
-   p[0] = Element(InterpreterBase.STRUCT_NODE, name=p[2], fields=p[4])
+   p[0] = Element(InterpreterBase.STRUCT_NODE, name=p[2], fields=p[4], position=position(p, 1))
 
 def p_fields(p):
    """fields : fields field
@@ -46,7 +57,7 @@ def p_fields(p):
 
 def p_field(p):
   "field : NAME COLON NAME SEMI"  # field_name: type
-  p[0] = Element(InterpreterBase.FIELD_DEF_NODE, name=p[1], var_type=p[3])
+  p[0] = Element(InterpreterBase.FIELD_DEF_NODE, name=p[1], var_type=p[3], position=position(p, 1))
 
 def p_funcs(p):
     """funcs : funcs func
@@ -58,17 +69,17 @@ def p_func(p):
     """func : FUNC NAME LPAREN formal_args RPAREN COLON NAME LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN COLON NAME LBRACE statements RBRACE"""
     if len(p) == 11:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = p[7], statements=p[9])
+        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = p[7], statements=p[9], position=position(p, 1))
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = p[6], statements=p[8])
+        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = p[6], statements=p[8], position=position(p, 1))
 
 def p_func2(p):
     """func : FUNC NAME LPAREN formal_args RPAREN LBRACE statements RBRACE
     | FUNC NAME LPAREN RPAREN LBRACE statements RBRACE"""
     if len(p) == 9:  # handle with 1+ formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = None, statements=p[7])
+        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=p[4], return_type = None, statements=p[7], position=position(p, 1))
     else:  # handle no formal args
-        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = None, statements=p[6])
+        p[0] = Element(InterpreterBase.FUNC_NODE, name=p[2], args=[], return_type = None, statements=p[6], position=position(p, 1))
 
 def p_formal_args(p):
     """formal_args : formal_args COMMA formal_arg
@@ -80,9 +91,9 @@ def p_formal_arg(p):
     """formal_arg : NAME COLON NAME
     | NAME"""
     if len(p) == 2:
-      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = None)
+      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = None, position=position(p, 1))
     else:
-      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = p[3])
+      p[0] = Element(InterpreterBase.ARG_NODE, name=p[1], var_type = p[3], position=position(p, 1))
 
 def p_statements(p):
     """statements : statements statement
@@ -96,15 +107,15 @@ def p_statement___assign(p):
 
 def p_assign(p):
     "assign : variable_w_dot ASSIGN expression"
-    p[0] = Element("=", name=p[1], expression=p[3])
+    p[0] = Element("=", name=p[1], expression=p[3], position=position(p, 1))
 
 def p_statement___var(p):
     """statement : VAR variable COLON NAME SEMI
     | VAR variable SEMI"""
     if len(p) == 6:
-      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=p[4])
+      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=p[4], position=position(p, 1))
     else:
-      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=None)
+      p[0] = Element(InterpreterBase.VAR_DEF_NODE, name=p[2], var_type=None, position=position(p, 1))
 
 def p_variable(p):
     "variable : NAME"
@@ -117,6 +128,9 @@ def p_variable_w_dot(p):
         p[0] = p[1] + "." + p[3]
     else:
         p[0] = p[1]
+    # a dotted name starts at its first NAME
+    p.slice[0].lineno = p.slice[1].lineno
+    p.slice[0].lexpos = p.slice[1].lexpos
 
 def p_statement_if(p):
     """statement : IF LPAREN expression RPAREN LBRACE statements RBRACE
@@ -128,6 +142,7 @@ def p_statement_if(p):
             condition=p[3],
             statements=p[6],
             else_statements=None,
+            position=position(p, 1),
         )
     else:
         p[0] = Element(
@@ -135,11 +150,12 @@ def p_statement_if(p):
             condition=p[3],
             statements=p[6],
             else_statements=p[10],
+            position=position(p, 1),
         )
 
 def p_statement_try(p):
     """statement : TRY LBRACE statements RBRACE catchers"""
-    p[0] = Element(InterpreterBase.TRY_NODE, statements=p[3], catchers=p[5])
+    p[0] = Element(InterpreterBase.TRY_NODE, statements=p[3], catchers=p[5], position=position(p, 1))
 
 def p_catches(p):
     """catchers : catchers catch
@@ -148,15 +164,15 @@ def p_catches(p):
 
 def p_catch(p):
     "catch : CATCH STRING LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.CATCH_NODE, exception_type=p[2], statements=p[4])
+    p[0] = Element(InterpreterBase.CATCH_NODE, exception_type=p[2], statements=p[4], position=position(p, 1))
 
 def p_statement_for(p):
     "statement : FOR LPAREN assign SEMI expression SEMI assign RPAREN LBRACE statements RBRACE"
-    p[0] = Element(InterpreterBase.FOR_NODE, init=p[3], condition=p[5], update=p[7], statements=p[10])
+    p[0] = Element(InterpreterBase.FOR_NODE, init=p[3], condition=p[5], update=p[7], statements=p[10], position=position(p, 1))
 
 def p_statement_raise(p):
     "statement : RAISE expression SEMI"
-    p[0] = Element(InterpreterBase.RAISE_NODE, exception_type=p[2])
+    p[0] = Element(InterpreterBase.RAISE_NODE, exception_type=p[2], position=position(p, 1))
 
 def p_statement_expr(p):
     "statement : expression SEMI"
@@ -170,21 +186,21 @@ def p_statement_return(p):
         expr = p[2]
     else:
         expr = None
-    p[0] = Element(InterpreterBase.RETURN_NODE, expression=expr)
+    p[0] = Element(InterpreterBase.RETURN_NODE, expression=expr, position=position(p, 1))
 
 
 def p_expression_not(p):
     "expression : NOT expression"
-    p[0] = Element(InterpreterBase.NOT_NODE, op1=p[2])
+    p[0] = Element(InterpreterBase.NOT_NODE, op1=p[2], position=position(p, 1))
 
 
 def p_expression_uminus(p):
     "expression : MINUS expression %prec UMINUS"
-    p[0] = Element(InterpreterBase.NEG_NODE, op1=p[2])
+    p[0] = Element(InterpreterBase.NEG_NODE, op1=p[2], position=position(p, 1))
 
 def p_expression_new(p):
     "expression : NEW NAME"
-    p[0] = Element(InterpreterBase.NEW_NODE, var_type=p[2])
+    p[0] = Element(InterpreterBase.NEW_NODE, var_type=p[2], position=position(p, 1))
 
 
 def p_arith_expression_binop(p):
@@ -198,7 +214,7 @@ def p_arith_expression_binop(p):
     | expression MINUS expression
     | expression MULTIPLY expression
     | expression DIVIDE expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = Element(p[2], op1=p[1], op2=p[3], position=position(p, 2))
 
 
 def p_expression_group(p):
@@ -209,43 +225,43 @@ def p_expression_group(p):
 def p_expression_and_or(p):
     """expression : expression OR expression
     | expression AND expression"""
-    p[0] = Element(p[2], op1=p[1], op2=p[3])
+    p[0] = Element(p[2], op1=p[1], op2=p[3], position=position(p, 2))
 
 
 def p_expression_number(p):
     "expression : NUMBER"
-    p[0] = Element(InterpreterBase.INT_NODE, val=p[1])
+    p[0] = Element(InterpreterBase.INT_NODE, val=p[1], position=position(p, 1))
 
 
 def p_expression_bool(p):
     """expression : TRUE
     | FALSE"""
     bool_val = p[1] == InterpreterBase.TRUE_DEF
-    p[0] = Element(InterpreterBase.BOOL_NODE, val=bool_val)
+    p[0] = Element(InterpreterBase.BOOL_NODE, val=bool_val, position=position(p, 1))
 
 
 def p_expression_nil(p):
     "expression : NIL"
-    p[0] = Element(InterpreterBase.NIL_NODE)
+    p[0] = Element(InterpreterBase.NIL_NODE, position=position(p, 1))
 
 
 def p_expression_string(p):
     "expression : STRING"
-    p[0] = Element(InterpreterBase.STRING_NODE, val=p[1])
+    p[0] = Element(InterpreterBase.STRING_NODE, val=p[1], position=position(p, 1))
 
 
 def p_expression_variable(p):
     "expression : variable_w_dot"
-    p[0] = Element(InterpreterBase.VAR_NODE, name=p[1])
+    p[0] = Element(InterpreterBase.VAR_NODE, name=p[1], position=position(p, 1))
 
 
 def p_func_call(p):
     """expression : NAME LPAREN args RPAREN
     | NAME LPAREN RPAREN"""
     if len(p) == 5:
-        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=p[3])
+        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=p[3], position=position(p, 1))
     else:
-        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=[])
+        p[0] = Element(InterpreterBase.FCALL_NODE, name=p[1], args=[], position=position(p, 1))
 
 
 def p_expression_args(p):
@@ -261,14 +277,89 @@ def p_error(p):
         print("Syntax error at EOF")
 
 
-# exported function
-def parse_program(program):
-    reset_lineno()
-    ast = yacc.parse(program)
-    if ast is None:
-        raise SyntaxError("Syntax error")
-    return ast
+# the parsers parse_program can use: the PLY-generated LALR parser, or the
+# hand-written recursive-descent/Pratt parser, which builds the same trees and
+# reports the same syntax errors
+LALR_PARSER = "lalr"
+PRATT_PARSER = "pratt"
+PARSERS = [LALR_PARSER, PRATT_PARSER]
+
+
+# A parser with its own lexer (a clone of the module's) and its own LR parser
+# state, so separate instances can parse at the same time. The grammar tables
+# and rule functions are shared; they are never written while parsing. One
+# instance must not be used by two threads at once. The Pratt parser reads
+# tokens from array_lexer instead of the PLY lexer, so the lexer and the LR
+# parser are only set up for the first LALR parse. lineno is the line the
+# last parse ended on
+class Parser:
+    def __init__(self):
+        self.lexer = None
+        self.lr_parser = None
+        self.pratt_parser = Pratt_Parser(precedence, p_error)
+        self.lineno = 1
+
+    def parse(self, program, method=LALR_PARSER):
+        if method == PRATT_PARSER:
+            ast, self.lineno = self.pratt_parser.parse(program)
+        else:
+            if self.lr_parser is None:
+                self.lexer = brewlex.get_lexer().clone()
+                self.lr_parser = copy.copy(get_lr_parser())
+            self.lexer.lineno = 1
+            ast = self.lr_parser.parse(program, lexer=self.lexer)
+            self.lineno = self.lexer.lineno
+        if ast is None:
+            raise SyntaxError("Syntax error")
+        return ast
+
+
+# each thread parses with a Parser of its own
+thread_parsers = threading.local()
 
-
-# generate our parser
-yacc.yacc() # yacc.yacc(debug=True, debuglog=open("parse.log", "w"))
+# exported function
+def parse_program(program, method=LALR_PARSER):
+    parser = getattr(thread_parsers, 'parser', None)
+    if parser is None:
+        parser = Parser()
+        thread_parsers.parser = parser
+    return parser.parse(program, method)
+
+
+# The LR parser every Parser copies, built on first use. It is loaded straight
+# from the frozen tables in parsetab.py: no grammar reflection, no PLY
+# validation pass, no files written. Only if parsetab.py is out of date with
+# the rules above does yacc.yacc() run, regenerating it as it always did
+# (yacc.yacc(debug=True, debuglog=open("parse.log", "w")) logs the grammar)
+lr_parser = None
+lr_parser_lock = threading.Lock()
+
+def get_lr_parser():
+    global lr_parser
+    if lr_parser is None:
+        with lr_parser_lock:
+            if lr_parser is None:
+                lr_parser = load_lr_parser()
+    return lr_parser
+
+def load_lr_parser():
+    from ply import yacc
+    try:
+        import parsetab
+    except ImportError:
+        parsetab = None
+    if parsetab is not None and getattr(parsetab, '_tabversion', None) == yacc.__tabversion__ and getattr(parsetab, '_lr_signature', None) == grammar_signature():
+        tables = yacc.LRTable()
+        tables.read_table(parsetab)
+        tables.bind_callables(globals())
+        return yacc.LRParser(tables, p_error)
+    return yacc.yacc()
+
+# the signature yacc.yacc() stores in parsetab.py: the precedence table, the
+# sorted tokens and the rule docstrings in definition order
+def grammar_signature():
+    rules = [rule for name, rule in globals().items() if name.startswith('p_') and name != 'p_error' and callable(rule)]
+    rules.sort(key=lambda rule: (rule.__code__.co_firstlineno, rule.__name__))
+    parts = [''.join(''.join(level) for level in precedence), ' '.join(sorted(tokens))]
+    parts += [rule.__doc__ for rule in rules if rule.__doc__]
+    return ''.join(parts)
@@ -0,0 +1,948 @@
+from intbase import ErrorType
+from data_object import Data_Object, TRUE, FALSE, make_int
+from exception_object import Exception_Object
+
+
+#####################################################################
+# opcodes
+#####################################################################
+
+# ADD through OR must stay contiguous, the dispatch loop range-checks them
+LOAD_LOCAL = 0
+LOAD_CONST = 1
+STORE_LOCAL = 2
+JUMP_IF_FALSE = 3
+JUMP = 4
+ADD = 5
+SUB = 6
+MUL = 7
+DIV = 8
+LT = 9
+GT = 10
+LE = 11
+GE = 12
+EQ = 13
+NE = 14
+AND = 15
+OR = 16
+BINARY_UNKNOWN = 17
+NEG = 18
+NOT = 19
+NEW_FRAME = 20
+STORE_ARG = 21
+CALL = 22
+RETURN_VALUE = 23
+RETURN = 24
+POP = 25
+DEFINE = 26
+LOAD_FIELD = 27
+STORE_FIELD = 28
+LOAD_NIL = 29
+LOAD_NONE = 30
+LOAD_NODE_VALUE = 31
+NEW = 32
+FORMAT_VAR = 33
+FORMAT_VALUE = 34
+FORMAT_BOOL = 35
+FORMAT_CALL = 36
+PRINT = 37
+INPUTI = 38
+INPUTS = 39
+RAISE_ERROR = 40
+RAISE = 41
+SHORT_AND = 42
+SHORT_OR = 43
+
+OPNAMES = [
+    'LOAD_LOCAL',
+    'LOAD_CONST',
+    'STORE_LOCAL',
+    'JUMP_IF_FALSE',
+    'JUMP',
+    'ADD',
+    'SUB',
+    'MUL',
+    'DIV',
+    'LT',
+    'GT',
+    'LE',
+    'GE',
+    'EQ',
+    'NE',
+    'AND',
+    'OR',
+    'BINARY_UNKNOWN',
+    'NEG',
+    'NOT',
+    'NEW_FRAME',
+    'STORE_ARG',
+    'CALL',
+    'RETURN_VALUE',
+    'RETURN',
+    'POP',
+    'DEFINE',
+    'LOAD_FIELD',
+    'STORE_FIELD',
+    'LOAD_NIL',
+    'LOAD_NONE',
+    'LOAD_NODE_VALUE',
+    'NEW',
+    'FORMAT_VAR',
+    'FORMAT_VALUE',
+    'FORMAT_BOOL',
+    'FORMAT_CALL',
+    'PRINT',
+    'INPUTI',
+    'INPUTS',
+    'RAISE_ERROR',
+    'RAISE',
+    'SHORT_AND',
+    'SHORT_OR',
+]
+
+# opcodes whose operand is an index into the constant pool
+CONST_OPS = {
+    LOAD_CONST, STORE_ARG, NEW_FRAME, CALL, DEFINE, LOAD_FIELD, STORE_FIELD,
+    LOAD_NODE_VALUE, NEW, BINARY_UNKNOWN, RAISE_ERROR,
+}
+JUMP_OPS = { JUMP, JUMP_IF_FALSE, SHORT_AND, SHORT_OR }
+BINARY_OPS = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV,
+    '<': LT, '>': GT, '<=': LE, '>=': GE, '==': EQ, '!=': NE,
+    '&&': AND, '||': OR,
+}
+RET_SLOT = 0
+
+
+# Compiled form of one Brewin function: a flat [opcode, operand, ...] list,
+# a constant pool and the number of local slots its frame needs. Slot 0 always
+# holds the return value; every parameter and every var definition site gets
+# its own slot, so block scoping is resolved entirely at compile time.
+# 'handlers' is the exception table: (start, end, {exception type: handler pc})
+# per try, innermost first, covering the try body's ops [start, end).
+# 'statements' is the line table: (start, end, statement node) per statement,
+# covering its ops [start, end), inner statements before the ones around them.
+class Code:
+    def __init__(self, name, func_node):
+        self.name = name
+        self.func_node = func_node
+        self.ops = []
+        self.consts = []
+        self.slot_names = ['ret']
+        self.param_block = None
+        self.params = []
+        self.return_type = None
+        self.default_return = None
+        self.memo = None
+        self.memo_slots = ()
+        self.handlers = []
+        self.statements = []
+
+    @property
+    def num_slots(self):
+        return len(self.slot_names)
+
+    def add_const(self, value):
+        for i, const in enumerate(self.consts):
+            if const is value or (type(const) is type(value) and not isinstance(value, Data_Object) and const == value):
+                return i
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def emit(self, opcode, operand=0):
+        self.ops.append(opcode)
+        self.ops.append(operand)
+        return len(self.ops) - 2
+
+    def emit_const(self, opcode, value):
+        return self.emit(opcode, self.add_const(value))
+
+    def patch(self, at, target=None):
+        self.ops[at + 1] = len(self.ops) if target is None else target
+
+    def new_slot(self, name):
+        self.slot_names.append(name)
+        return len(self.slot_names) - 1
+
+    # pc of the handler for an exception raised by the instruction at pc, or None
+    def find_handler(self, pc, exception_type):
+        for start, end, table in self.handlers:
+            if start <= pc < end and exception_type in table:
+                return table[exception_type]
+        return None
+
+    # the innermost statement whose ops include pc, or None
+    def statement_at(self, pc):
+        for start, end, statement_node in self.statements:
+            if start <= pc < end:
+                return statement_node
+        return None
+
+
+def disassemble(code):
+    lines = [f"func {code.name} (slots={code.num_slots}, consts={len(code.consts)})"]
+    ops = code.ops
+    for pc in range(0, len(ops), 2):
+        opcode, operand = ops[pc], ops[pc + 1]
+        text = f"  {pc:4d} {OPNAMES[opcode]:<16}"
+        if opcode in CONST_OPS:
+            const = code.consts[operand]
+            if isinstance(const, Code):
+                const = const.name
+            elif isinstance(const, Data_Object):
+                const = repr(const)
+            text += f" {operand:<4d} ({const})"
+        elif opcode in (LOAD_LOCAL, STORE_LOCAL):
+            text += f" {operand:<4d} ({code.slot_names[operand]})"
+        elif opcode in JUMP_OPS or opcode in (PRINT, INPUTI, INPUTS):
+            text += f" {operand}"
+        lines.append(text)
+    for start, end, table in code.handlers:
+        lines.append(f"  try {start}-{end}: " + ", ".join(f"{exception_type} -> {pc}" for exception_type, pc in table.items()))
+    return "\n".join(lines)
+
+
+#####################################################################
+# compiler
+#####################################################################
+
+# Lowers the Element tree of every function to bytecode. Each compile_* method
+# mirrors the tree walker method that evaluates the same syntactic position,
+# so the VM reproduces the walker's output and errors exactly.
+class Bytecode_Compiler:
+    def __init__(self, interpreter):
+        self.interp = interpreter
+        self.codes = dict()
+
+    def compile_program(self):
+        interp = self.interp
+        for func_key, func_node in interp.func_defs_to_node.items():
+            self.codes[func_key] = self.prepare_function(Code(func_key, func_node))
+        for func_key, code in self.codes.items():
+            self.compile_function(code, is_main=(func_key == 'main_0'))
+        return self.codes
+
+    # fills in the calling convention first, so calls can be compiled before their callee
+    def prepare_function(self, code):
+        interp = self.interp
+        func_node = code.func_node
+        return_type = func_node.return_type
+        code.return_type = return_type
+        if return_type == interp.INT_NODE:
+            code.default_return = interp.int_object
+        elif return_type == interp.BOOL_NODE:
+            code.default_return = interp.false_object
+        elif return_type == interp.STRING_NODE:
+            code.default_return = interp.string_object
+        elif return_type in interp.struct_types:
+            code.default_return = interp.nil_object
+        else:
+            code.default_return = interp.void_object
+
+        # parameters share one scope with 'ret'; a repeated name reuses its slot
+        code.param_block = {'ret': RET_SLOT}
+        for param_node in func_node.args:
+            param_name = param_node.name
+            if param_name not in code.param_block:
+                code.param_block[param_name] = code.new_slot(param_name)
+            code.params.append((code.param_block[param_name], param_name, param_node.var_type))
+        code.memo = interp.memo_caches.get(code.name)
+        code.memo_slots = tuple(sorted(set(param[0] for param in code.params)))
+        return code
+
+    def compile_function(self, code, is_main):
+        # main runs directly in the global scope; other functions get the
+        # parameter scope below their body scope
+        self.code = code
+        if is_main:
+            self.blocks = [dict()]
+        else:
+            self.blocks = [code.param_block, dict()]
+        self.compile_statements(code.func_node.statements)
+        code.emit(RETURN)
+
+    #####################################################################
+    # scopes
+    #####################################################################
+
+    def resolve(self, var_name):
+        for block in reversed(self.blocks):
+            if var_name in block:
+                return block[var_name]
+        return None
+
+    def compile_block(self, statements):
+        self.blocks.append(dict())
+        self.compile_statements(statements)
+        self.blocks.pop()
+
+    #####################################################################
+    # statements
+    #####################################################################
+
+    def compile_statements(self, statements):
+        if statements == None:
+            return
+        for statement in statements:
+            self.compile_statement(statement)
+
+    def compile_statement(self, statement_node):
+        interp = self.interp
+        elem_type = statement_node.elem_type
+        start = len(self.code.ops)
+        if elem_type == interp.VAR_DEF_NODE:
+            self.compile_definition(statement_node)
+        elif elem_type == '=':
+            self.compile_assignment(statement_node)
+        elif elem_type == interp.FCALL_NODE:
+            self.compile_call(statement_node)
+            self.code.emit(POP)
+        elif elem_type == interp.IF_NODE:
+            self.compile_if(statement_node)
+        elif elem_type == interp.FOR_NODE:
+            self.compile_for(statement_node)
+        elif elem_type == interp.RETURN_NODE:
+            self.compile_return(statement_node)
+        elif elem_type == interp.TRY_NODE:
+            self.compile_try(statement_node)
+        elif elem_type == interp.RAISE_NODE:
+            self.compile_raise(statement_node)
+        if len(self.code.ops) > start:
+            self.code.statements.append((start, len(self.code.ops), statement_node))
+
+    def compile_definition(self, statement_node):
+        interp = self.interp
+        var_name = statement_node.name
+        var_type = statement_node.var_type
+        if var_name in self.blocks[-1]:
+            self.emit_error(ErrorType.NAME_ERROR, f"Variable {var_name} defined more than once")
+            return
+        if var_type == interp.INT_NODE:
+            init_val = interp.int_object
+        elif var_type == interp.STRING_NODE:
+            init_val = interp.string_object
+        elif var_type == interp.BOOL_NODE:
+            init_val = interp.false_object
+        elif var_type in interp.struct_types:
+            init_val = lambda: interp.nil_object(var_type)
+        else:
+            self.emit_error(ErrorType.TYPE_ERROR, f"Unknown/invalid type specified {var_type}")
+            return
+        slot = self.code.new_slot(var_name)
+        self.blocks[-1][var_name] = slot
+        self.code.emit_const(DEFINE, (slot, init_val))
+
+    def compile_assignment(self, statement_node):
+        interp = self.interp
+        full_name = statement_node.name
+        var_name = full_name.split('.')[0]
+        var_fields = statement_node.fields
+        slot = self.resolve(var_name)
+        if slot is None:
+            self.emit_error(ErrorType.NAME_ERROR, f"Variable {var_name} has not been defined")
+            return
+
+        expression = statement_node.expression
+        if expression.elem_type in interp.var_types:
+            self.compile_value(expression)
+        elif expression.elem_type == interp.VAR_NODE:
+            self.compile_variable(expression)
+        elif expression.elem_type == interp.FCALL_NODE:
+            self.compile_call(expression)
+        else:
+            self.compile_expression(expression)
+
+        if var_fields:
+            self.code.emit_const(STORE_FIELD, (slot, var_fields, full_name, statement_node.offsets))
+        else:
+            self.code.emit(STORE_LOCAL, slot)
+
+    def compile_if(self, if_node):
+        code = self.code
+        to_else = self.compile_conditional(if_node.condition)
+        self.compile_block(if_node.statements)
+        if if_node.else_statements == None:
+            code.patch(to_else)
+            return
+        to_end = code.emit(JUMP)
+        code.patch(to_else)
+        self.compile_block(if_node.else_statements)
+        code.patch(to_end)
+
+    def compile_for(self, for_node):
+        code = self.code
+        self.compile_assignment(for_node.init)
+        loop_top = len(code.ops)
+        to_end = self.compile_conditional(for_node.condition)
+        self.compile_block(for_node.statements)
+        self.compile_assignment(for_node.update)
+        code.emit(JUMP, loop_top)
+        code.patch(to_end)
+
+    # the try body runs straight through; only the exception table knows about
+    # the handlers, which follow it and jump to the end
+    def compile_try(self, try_node):
+        code = self.code
+        start = len(code.ops)
+        self.compile_block(try_node.statements)
+        end = len(code.ops)
+        to_end = [code.emit(JUMP)]
+        table = dict()
+        for exception_type, catch_node in try_node.handlers.items():
+            table[exception_type] = len(code.ops)
+            self.compile_block(catch_node.statements)
+            to_end.append(code.emit(JUMP))
+        for at in to_end:
+            code.patch(at)
+        code.handlers.append((start, end, table))
+
+    def compile_raise(self, raise_node):
+        expression = raise_node.exception_type
+        if expression.elem_type == self.interp.NEW_NODE:
+            self.compile_expression(expression)
+        else:
+            self.compile_operand(expression)
+        self.code.emit(RAISE)
+
+    def compile_return(self, return_node):
+        interp = self.interp
+        expression = return_node.expression
+        if expression == None:
+            self.code.emit(RETURN)
+            return
+
+        ret_eval_type = expression.elem_type
+        if ret_eval_type == interp.VAR_NODE:
+            self.compile_variable(expression)
+        elif ret_eval_type in interp.var_types:
+            self.compile_value(expression)
+        elif ret_eval_type in interp.bool_ops or ret_eval_type in interp.arithmetic_ops or ret_eval_type in interp.comparison_ops:
+            self.compile_expression(expression)
+        elif ret_eval_type == interp.FCALL_NODE:
+            self.compile_call(expression)
+        else:
+            self.code.emit(LOAD_NONE)
+        self.code.emit(RETURN_VALUE)
+
+    def emit_error(self, error_type, description):
+        self.code.emit_const(RAISE_ERROR, (error_type, description))
+
+    #####################################################################
+    # function calls
+    #####################################################################
+
+    def compile_call(self, call_node):
+        interp = self.interp
+        code = self.code
+        fcall_name = call_node.name
+        arg_nodes = call_node.args
+        if fcall_name == 'print':
+            self.compile_print(arg_nodes)
+            return
+        elif fcall_name == 'inputi' or fcall_name == 'inputs':
+            self.compile_input(fcall_name, arg_nodes)
+            return
+
+        fcall_dict_key = fcall_name + '_' + str(len(arg_nodes))
+        if fcall_dict_key not in self.codes:
+            self.emit_error(ErrorType.NAME_ERROR, f"Function {fcall_name} was not found")
+            return
+
+        callee = self.codes[fcall_dict_key]
+        code.emit_const(NEW_FRAME, callee)
+        for arg_node, param in zip(arg_nodes, callee.params):
+            if arg_node.elem_type == interp.VAR_NODE:
+                self.compile_variable(arg_node)
+            elif arg_node.elem_type in interp.var_types:
+                self.compile_value(arg_node)
+            elif arg_node.elem_type == interp.FCALL_NODE:
+                self.compile_call(arg_node)
+            else:
+                self.compile_expression(arg_node)
+            code.emit_const(STORE_ARG, param)
+        code.emit_const(CALL, callee)
+
+    def compile_print(self, arg_nodes):
+        interp = self.interp
+        code = self.code
+        for arg in arg_nodes:
+            elem_type = arg.elem_type
+            if elem_type == interp.VAR_NODE:
+                self.compile_variable(arg)
+                code.emit(FORMAT_VAR)
+            elif elem_type == interp.INT_NODE or elem_type == interp.STRING_NODE:
+                code.emit_const(LOAD_CONST, str(arg.val))
+            elif elem_type in interp.arithmetic_ops:
+                self.compile_expression(arg)
+                code.emit(FORMAT_VALUE)
+            elif elem_type in interp.comparison_ops or elem_type in interp.bool_ops:
+                self.compile_expression(arg)
+                code.emit(FORMAT_BOOL)
+            elif elem_type == interp.BOOL_NODE:
+                code.emit_const(LOAD_CONST, 'true' if arg.val else 'false')
+            elif elem_type == interp.FCALL_NODE:
+                self.compile_call(arg)
+                code.emit(FORMAT_CALL)
+            else:
+                code.emit_const(LOAD_CONST, interp.NIL_DEF)
+        code.emit(PRINT, len(arg_nodes))
+
+    def compile_input(self, fcall_name, prompt):
+        if len(prompt) > 2:
+            self.emit_error(ErrorType.NAME_ERROR, f"No {fcall_name}() function found that takes > 1 parameter")
+            return
+        if len(prompt) > 0:
+            self.compile_value(prompt[0])
+        self.code.emit(INPUTI if fcall_name == 'inputi' else INPUTS, 1 if len(prompt) > 0 else 0)
+
+    #####################################################################
+    # expressions
+    #####################################################################
+
+    def compile_expression(self, expression_node):
+        interp = self.interp
+        code = self.code
+        elem_type = expression_node.elem_type
+        if elem_type == interp.NEW_NODE:
+            code.emit_const(NEW, expression_node.var_type)
+            return
+
+        self.compile_operand(expression_node.op1)
+        if interp.short_circuit and (elem_type == '&&' or elem_type == '||'):
+            # the left operand either decides the result and jumps past the
+            # right one, or stays on the stack for the ordinary AND/OR
+            to_end = code.emit(SHORT_AND if elem_type == '&&' else SHORT_OR)
+            self.compile_operand(expression_node.op2)
+            code.emit(BINARY_OPS[elem_type])
+            code.patch(to_end)
+            return
+        if elem_type == interp.NEG_NODE:
+            code.emit(NEG)
+            return
+        elif elem_type == interp.NOT_NODE:
+            code.emit(NOT)
+            return
+
+        self.compile_operand(expression_node.op2)
+        if elem_type in BINARY_OPS:
+            code.emit(BINARY_OPS[elem_type])
+        else:
+            code.emit_const(BINARY_UNKNOWN, elem_type)
+
+    def compile_operand(self, operand_node):
+        interp = self.interp
+        elem_type = operand_node.elem_type
+        if elem_type == interp.VAR_NODE:
+            self.compile_variable(operand_node)
+        elif elem_type in interp.arithmetic_ops or elem_type in interp.bool_ops or elem_type in interp.comparison_ops:
+            self.compile_expression(operand_node)
+        elif elem_type == interp.FCALL_NODE:
+            self.compile_call(operand_node)
+        elif elem_type == interp.NIL_NODE:
+            self.code.emit(LOAD_NIL)
+        else:
+            self.compile_value(operand_node)
+
+    # emits the condition and returns the offset of the jump taken when it is false
+    def compile_conditional(self, condition_node):
+        interp = self.interp
+        condition_type = condition_node.elem_type
+        if condition_type == interp.VAR_NODE:
+            self.compile_variable(condition_node)
+        elif condition_type == interp.BOOL_NODE or condition_type == interp.INT_NODE:
+            self.compile_value(condition_node)
+        elif condition_type in interp.bool_ops or condition_type in interp.comparison_ops or condition_type in interp.arithmetic_ops:
+            self.compile_expression(condition_node)
+        elif condition_type == interp.FCALL_NODE:
+            self.compile_call(condition_node)
+        else:
+            # the walker treats any other condition as false without evaluating it
+            return self.code.emit(JUMP)
+        return self.code.emit(JUMP_IF_FALSE)
+
+    def compile_variable(self, var_node):
+        full_name = var_node.name
+        var_name = full_name.split('.')[0]
+        slot = self.resolve(var_name)
+        if slot is None:
+            self.emit_error(ErrorType.NAME_ERROR, f"Variable {var_name} has not been defined")
+            return
+        self.code.emit(LOAD_LOCAL, slot)
+        if var_node.fields:
+            self.code.emit_const(LOAD_FIELD, (var_node.fields, full_name, var_node.offsets))
+
+    # mirrors evaluate_value, including its handling of non-literal nodes
+    def compile_value(self, val_node):
+        interp = self.interp
+        if val_node.elem_type == interp.NIL_NODE:
+            self.code.emit(LOAD_NIL)
+        elif not hasattr(val_node, 'val'):
+            self.code.emit_const(LOAD_NODE_VALUE, val_node)
+        else:
+            self.code.emit_const(LOAD_CONST, Data_Object(val_node.elem_type, val_node.val))
+
+
+#####################################################################
+# virtual machine
+#####################################################################
+
+class VM:
+    def __init__(self, interpreter, codes):
+        self.interp = interpreter
+        self.codes = codes
+
+    def run_main(self):
+        main_code = self.codes['main_0']
+        frame = [None] * main_code.num_slots
+        self.execute(main_code, frame)
+
+    def disassemble(self):
+        return "\n\n".join(disassemble(code) for code in self.codes.values())
+
+    # Runs code and every call it makes in one dispatch loop. A call suspends the
+    # caller as (code, pc, slots, memo key, stack base) on the heap-allocated
+    # 'frames' stack instead of recursing in Python, so Brewin recursion depth is
+    # bounded by memory only. All frames share one operand stack, since a call
+    # leaves nothing of the callee on it; a frame's stack base is the stack
+    # height it started at, which is all its statements leave behind, so a
+    # handler cuts the stack back to it.
+    def execute(self, code, slots):
+        interp = self.interp
+        error = interp.error
+        struct_types = interp.struct_types
+        # paths the resolver checked against the struct layouts only need nil checks
+        get_verified_struct_member = interp.get_verified_struct_member
+        INT, BOOL, NIL = Data_Object.INT_TYPE, Data_Object.BOOL_TYPE, Data_Object.NIL_TYPE
+        ops = code.ops
+        consts = code.consts
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        frames = []
+        memo_key = None
+        base = 0
+        pc = 0
+        try:
+            while True:
+                opcode = ops[pc]
+                operand = ops[pc + 1]
+                pc += 2
+                if opcode == LOAD_LOCAL:
+                    push(slots[operand])
+                elif opcode == LOAD_CONST:
+                    push(consts[operand])
+                elif opcode == STORE_LOCAL:
+                    result = pop()
+                    cur_val = slots[operand]
+                    interp.check_struct_equivalence(cur_val, result)
+                    if cur_val.val_type != result.val_type:
+                        result = interp.assign_helper(cur_val.val_type, result.val_type, cur_val, result)
+                    slots[operand] = result
+                elif opcode == JUMP_IF_FALSE:
+                    condition = pop()
+                    if condition.val_type == INT:
+                        condition = condition.coerce_i_to_b()
+                    if condition.val_type != BOOL:
+                        error(
+                            ErrorType.TYPE_ERROR,
+                            f"Expression does not evaluate to boolean",
+                        )
+                    if not condition.value:
+                        pc = operand
+                elif opcode == JUMP:
+                    pc = operand
+                elif opcode <= OR:
+                    op2 = pop()
+                    op1 = pop()
+                    if op1.val_type == INT and op2.val_type == INT and opcode <= GE:
+                        # int fast path; skips checks that cannot fail for two ints
+                        if opcode == ADD:
+                            push(make_int(op1.value + op2.value))
+                        elif opcode == SUB:
+                            push(make_int(op1.value - op2.value))
+                        elif opcode == LT:
+                            push(TRUE if op1.value < op2.value else FALSE)
+                        elif opcode == LE:
+                            push(TRUE if op1.value <= op2.value else FALSE)
+                        else:
+                            push(self.binary_op(opcode, op1, op2))
+                    else:
+                        push(self.binary_op(opcode, op1, op2))
+                elif opcode == NEW_FRAME:
+                    callee = consts[operand]
+                    frame = [None] * callee.num_slots
+                    frame[RET_SLOT] = callee.default_return()
+                    push(frame)
+                elif opcode == STORE_ARG:
+                    arg = pop()
+                    param_slot, param_name, param_type = consts[operand]
+                    arg_type = arg.val_type
+                    if param_type != arg_type:
+                        if param_type == BOOL and arg_type == INT:
+                            arg = arg.coerce_i_to_b()
+                        elif not (param_type in struct_types and arg_type == NIL and (arg.struct_type == NIL or arg.struct_type == param_type)):
+                            error(
+                                ErrorType.TYPE_ERROR,
+                                f"Type mismatch on formal parameter {param_name}"
+                            )
+                    stack[-1][param_slot] = arg
+                elif opcode == CALL:
+                    callee = consts[operand]
+                    frame = pop()
+                    callee_memo_key = None
+                    if callee.memo is not None:
+                        callee_memo_key = tuple([frame[slot].value for slot in callee.memo_slots])
+                        func_return = callee.memo.lookup(callee_memo_key)
+                        if func_return is not None:
+                            push(func_return)
+                            continue
+                    frames.append((code, pc, slots, memo_key, base))
+                    code, slots, memo_key, base = callee, frame, callee_memo_key, len(stack)
+                    ops = code.ops
+                    consts = code.consts
+                    pc = 0
+                elif opcode == RETURN_VALUE or opcode == RETURN:
+                    if opcode == RETURN_VALUE:
+                        slots[RET_SLOT] = pop()
+                    if not frames:
+                        return
+                    # the return check fails in the caller's statement, as in invoke
+                    callee, frame, callee_memo_key = code, slots, memo_key
+                    code, pc, slots, memo_key, base = frames.pop()
+                    ops = code.ops
+                    consts = code.consts
+                    push(self.finish_call(callee, frame, callee_memo_key))
+                elif opcode == POP:
+                    pop()
+                elif opcode == DEFINE:
+                    slot, init_val = consts[operand]
+                    slots[slot] = init_val()
+                elif opcode == LOAD_FIELD:
+                    var_fields, full_name, offsets = consts[operand]
+                    if offsets != None:
+                        res_struct, offset = get_verified_struct_member(pop(), var_fields, offsets, full_name)
+                        push(res_struct.values[offset])
+                    else:
+                        res_struct, field_name = interp.get_struct_member(pop(), var_fields, full_name)
+                        push(res_struct.get_field(field_name))
+                elif opcode == STORE_FIELD:
+                    slot, var_fields, full_name, offsets = consts[operand]
+                    result = pop()
+                    cur_val = slots[slot]
+                    interp.check_struct_equivalence(cur_val, result)
+                    if offsets != None:
+                        res_struct, offset = get_verified_struct_member(cur_val, var_fields, offsets, full_name)
+                        field_value = res_struct.values[offset]
+                        res_struct.values[offset] = interp.assign_helper(field_value.val_type, result.val_type, field_value, result)
+                        continue
+                    res_struct, field_name = interp.get_struct_member(cur_val, var_fields, full_name)
+                    result = interp.assign_helper(res_struct.get_field_type(field_name), result.val_type, res_struct.get_field(field_name), result)
+                    res_struct.change_field(field_name, result)
+                elif opcode == LOAD_NIL:
+                    push(interp.nil_object())
+                elif opcode == LOAD_NONE:
+                    push(None)
+                elif opcode == LOAD_NODE_VALUE:
+                    val_node = consts[operand]
+                    push(Data_Object(val_node.elem_type, val_node.val))
+                elif opcode == NEW:
+                    struct_name = consts[operand]
+                    if struct_name not in struct_types:
+                        error(
+                            ErrorType.TYPE_ERROR,
+                            f"Invalid type {struct_name} for new operation"
+                        )
+                    push(interp.init_new_struct(struct_name))
+                elif opcode == NEG:
+                    op1 = pop()
+                    if op1.val_type != INT:
+                        error(
+                            ErrorType.TYPE_ERROR,
+                            f"Incompatible type for neg operation"
+                        )
+                    push(-op1)
+                elif opcode == NOT:
+                    op1 = pop()
+                    if op1.val_type != BOOL and op1.val_type != INT:
+                        error(
+                            ErrorType.TYPE_ERROR,
+                            f"Incompatible type for ! operation"
+                        )
+                    if op1.val_type == INT:
+                        op1 = op1.coerce_i_to_b()
+                    push(op1.logical_not())
+                elif opcode == BINARY_UNKNOWN:
+                    op2 = pop()
+                    op1 = pop()
+                    self.binary_checks(op1, op2)
+                    push(None)
+                elif opcode == FORMAT_VAR:
+                    res = pop()
+                    if res.val_type == BOOL:
+                        push('true' if res.value else 'false')
+                    elif res.val_type == NIL:
+                        push(interp.NIL_DEF)
+                    else:
+                        push(str(res.value))
+                elif opcode == FORMAT_VALUE:
+                    push(str(pop().value))
+                elif opcode == FORMAT_BOOL:
+                    push('true' if pop().value else 'false')
+                elif opcode == FORMAT_CALL:
+                    res = pop()
+                    if res.val_type == BOOL:
+                        push('true' if res.value else 'false')
+                    elif res.val_type == NIL:
+                        push(interp.NIL_DEF)
+                    elif res.val_type == interp.VOID_DEF:
+                        error(
+                            ErrorType.TYPE_ERROR,
+                            f"Cannot print type void"
+                        )
+                    else:
+                        push(str(res.value))
+                elif opcode == PRINT:
+                    if operand:
+                        output = ''.join(stack[-operand:])
+                        del stack[-operand:]
+                    else:
+                        output = ''
+                    interp.output(output)
+                    push(interp.void_object())
+                elif opcode == INPUTI or opcode == INPUTS:
+                    if operand:
+                        interp.output(pop().get_value())
+                    if opcode == INPUTI:
+                        push(Data_Object(interp.INT_NODE, int(interp.get_input())))
+                    else:
+                        push(Data_Object(interp.STRING_NODE, str(interp.get_input())))
+                elif opcode == RAISE_ERROR:
+                    error_type, description = consts[operand]
+                    error(error_type, description)
+                elif opcode == SHORT_AND or opcode == SHORT_OR:
+                    elem_type = '&&' if opcode == SHORT_AND else '||'
+                    interp.check_logical_operand(stack[-1], elem_type)
+                    result = stack[-1].short_circuit(elem_type)
+                    if result is not None:
+                        stack[-1] = result
+                        pc = operand
+                elif opcode == RAISE:
+                    exception_type = pop()
+                    if exception_type.get_type() != interp.STRING_NODE:
+                        error(
+                            ErrorType.TYPE_ERROR,
+                            f"Incompatible type for raise operation"
+                        )
+                    exception_type = exception_type.value
+                    # search the exception tables from the raise outward through the callers
+                    raise_code, raise_pc = code, pc - 2
+                    handler = code.find_handler(pc - 2, exception_type)
+                    while handler is None:
+                        if not frames:
+                            raise_node = raise_code.statement_at(raise_pc)
+                            raise Exception_Object(exception_type, raise_node.lineno if raise_node is not None else None)
+                        code, pc, slots, memo_key, base = frames.pop()
+                        handler = code.find_handler(pc - 2, exception_type)
+                    del stack[base:]
+                    ops = code.ops
+                    consts = code.consts
+                    pc = handler
+        except Exception as exception:
+            # errors are located at the statement of the failing instruction
+            if type(exception) is Exception:
+                interp.locate_error(exception, code.statement_at(pc - 2))
+            raise
+
+    # return type coercion of a finished call, as at the end of do_call
+    def finish_call(self, callee, frame, memo_key):
+        interp = self.interp
+        return_type = callee.return_type
+        func_return = frame[RET_SLOT]
+        ret_type = func_return.get_type()
+        if ret_type != return_type:
+            if ret_type == interp.INT_NODE and return_type == interp.BOOL_NODE:
+                func_return = func_return.coerce_i_to_b()
+            elif ret_type == interp.NIL_NODE and return_type in interp.struct_types and (func_return.struct_type == return_type or func_return.struct_type == interp.NIL_NODE):
+                func_return = interp.nil_object(return_type)
+            else:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Returned value's type {ret_type} is inconsistent with function's return type {return_type}"
+                )
+        if callee.memo is not None:
+            callee.memo.store(memo_key, func_return)
+        return func_return
+
+    #####################################################################
+    # operators
+    #####################################################################
+
+    def binary_checks(self, op1, op2):
+        if op1.val_type == Data_Object.NIL_TYPE and op2.val_type == Data_Object.NIL_TYPE:
+            self.interp.check_struct_equivalence(op1, op2)
+        if op1.val_type == Data_Object.VOID_TYPE or op2.val_type == Data_Object.VOID_TYPE:
+            self.interp.error(
+                ErrorType.TYPE_ERROR,
+                f"Can't compare void type"
+            )
+
+    def binary_op(self, opcode, op1, op2):
+        interp = self.interp
+        self.binary_checks(op1, op2)
+        op1_type = op1.val_type
+        op2_type = op2.val_type
+        INT, BOOL, NIL = Data_Object.INT_TYPE, Data_Object.BOOL_TYPE, Data_Object.NIL_TYPE
+        if opcode == ADD:
+            if interp.check_addition_compatible(op1, op2):
+                return op1 + op2
+            interp.error(
+                ErrorType.TYPE_ERROR,
+                f"Cannot use operator + on non-string and non-integer operators"
+            )
+        elif opcode == SUB or opcode == DIV:
+            if op1_type != INT or op2_type != INT:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Cannot use operator {'-' if opcode == SUB else '/'} on non-integer operators"
+                )
+            return op1 - op2 if opcode == SUB else op1 // op2
+        elif opcode == MUL:
+            if op1_type != op2_type or op1_type != INT:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Incompatible types for {OPERATOR_TEXT[opcode]} operation",
+                )
+            return op1 * op2
+        elif opcode <= GE:
+            if op1_type != op2_type or op1_type != INT:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Incompatible types for {OPERATOR_TEXT[opcode]} operation",
+                )
+            if opcode == LT:
+                return op1 < op2
+            elif opcode == GT:
+                return op1 > op2
+            elif opcode == LE:
+                return op1 <= op2
+            return op1 >= op2
+        elif opcode == EQ or opcode == NE:
+            if op1_type != op2_type:
+                if (op1_type == INT or op1_type == BOOL) and (op2_type == INT or op2_type == BOOL):
+                    op1 = op1.coerce_i_to_b()
+                    op2 = op2.coerce_i_to_b()
+                elif not (op1_type in interp.struct_types and op2_type == NIL or op1_type == NIL and op2_type in interp.struct_types):
+                    interp.error(
+                        ErrorType.TYPE_ERROR,
+                        f"Can't compare unrelated types {op1_type} and {op2_type}"
+                    )
+            return op1 == op2 if opcode == EQ else op1 != op2
+        if op1_type != BOOL and op1_type != INT or op2_type != BOOL and op2_type != INT:
+            interp.error(
+                ErrorType.TYPE_ERROR,
+                f"Invalid types used with operator {OPERATOR_TEXT[opcode]}"
+            )
+        return op1.logical_and(op2) if opcode == AND else op1.logical_or(op2)
+
+
+OPERATOR_TEXT = { opcode: text for text, opcode in BINARY_OPS.items() }
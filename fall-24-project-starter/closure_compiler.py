@@ -0,0 +1,766 @@
+from intbase import ErrorType
+from data_object import Data_Object, make_int
+from resolver import RET_SLOT
+from typechecker import CHECKED_OPERATORS
+from exception_object import Exception_Object
+
+
+# Compiles the Element tree of a loaded program into nested Python closures.
+# Every node is dispatched on its elem_type exactly once, at compile time; the
+# resulting closures take the same resolved frame lists as the tree walker, and
+# each compile_* method mirrors the walker method of the same role so output
+# and errors match it exactly.
+class Closure_Compiler:
+    def __init__(self, interpreter):
+        self.interp = interpreter
+        self.compiled_funcs = dict()
+
+    def compile_program(self):
+        interp = self.interp
+        for func_key, func_node in interp.func_defs_to_node.items():
+            self.compiled_funcs[func_key] = self.compile_body(func_node.statements)
+        return self.compiled_funcs['main_0']
+
+    #####################################################################
+    # statements
+    #####################################################################
+
+    def compile_body(self, statements):
+        if statements == None:
+            return lambda scopes: False
+        interp = self.interp
+        pairs = [(self.compile_statement(s), s) for s in statements]
+        compiled = tuple(statement for statement, _ in pairs if statement is not None)
+        nodes = tuple(node for statement, node in pairs if statement is not None)
+
+        # an error is located at the statement that raised it, as in run_statement
+        def run_body(scopes):
+            try:
+                for statement in compiled:
+                    if statement(scopes):
+                        return True
+            except Exception as exception:
+                if type(exception) is Exception:
+                    interp.locate_error(exception, nodes[compiled.index(statement)])
+                raise
+            return False
+        return run_body
+
+    # returns None for statements the walker silently skips
+    def compile_statement(self, statement_node):
+        interp = self.interp
+        elem_type = statement_node.elem_type
+        if elem_type == interp.VAR_DEF_NODE:
+            return self.compile_definition(statement_node)
+        elif elem_type == '=':
+            return self.compile_assignment(statement_node)
+        elif elem_type == interp.FCALL_NODE:
+            call = self.compile_call(statement_node)
+
+            def run_call(scopes):
+                call(scopes)
+                return False
+            return run_call
+        elif elem_type == interp.IF_NODE:
+            return self.compile_if(statement_node)
+        elif elem_type == interp.FOR_NODE:
+            return self.compile_for(statement_node)
+        elif elem_type == interp.RETURN_NODE:
+            return self.compile_return(statement_node)
+        elif elem_type == interp.TRY_NODE:
+            return self.compile_try(statement_node)
+        elif elem_type == interp.RAISE_NODE:
+            return self.compile_raise(statement_node)
+        return None
+
+    def compile_definition(self, statement_node):
+        interp = self.interp
+        var_name = statement_node.name
+        var_type = statement_node.var_type
+        if statement_node.redefined:
+            def redefinition(scopes):
+                interp.error(
+                    ErrorType.NAME_ERROR,
+                    f"Variable {var_name} defined more than once",
+                )
+            return redefinition
+
+        depth, slot = statement_node.addr
+        if var_type == interp.INT_NODE:
+            init_val = interp.int_object
+        elif var_type == interp.STRING_NODE:
+            init_val = interp.string_object
+        elif var_type == interp.BOOL_NODE:
+            init_val = interp.false_object
+        elif var_type in interp.struct_types:
+            init_val = lambda: interp.nil_object(var_type)
+        else:
+            def init_val():
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Unknown/invalid type specified {var_type}"
+                )
+
+        def run_definition(scopes):
+            scopes[depth][slot] = init_val()
+            return False
+        return run_definition
+
+    def compile_assignment(self, statement_node):
+        interp = self.interp
+        full_name = statement_node.name
+        var_name = full_name.split('.')[0]
+        var_fields = statement_node.fields
+        offsets = statement_node.offsets
+
+        def undefined(scopes):
+            interp.error(
+                ErrorType.NAME_ERROR,
+                f"Variable {var_name} has not been defined",
+            )
+        if statement_node.addr == None:
+            return undefined
+        depth, slot = statement_node.addr
+
+        expression = statement_node.expression
+        if expression.elem_type in interp.var_types:
+            evaluate = self.compile_value(expression)
+        elif expression.elem_type == interp.VAR_NODE:
+            evaluate = self.compile_variable(expression)
+        elif expression.elem_type == interp.FCALL_NODE:
+            evaluate = self.compile_call(expression)
+        else:
+            evaluate = self.compile_expression(expression)
+
+        if statement_node.checked:
+            # the value already has the target's type
+            if offsets != None:
+                get_verified_struct_member = interp.get_verified_struct_member
+
+                def run_checked_field_assignment(scopes):
+                    ref_scope = scopes[depth]
+                    if ref_scope[slot] is None:
+                        undefined(scopes)
+                    result = evaluate(scopes)
+                    res_struct, offset = get_verified_struct_member(ref_scope[slot], var_fields, offsets, full_name)
+                    res_struct.values[offset] = result
+                    return False
+                return run_checked_field_assignment
+
+            def run_checked_assignment(scopes):
+                ref_scope = scopes[depth]
+                if ref_scope[slot] is None:
+                    undefined(scopes)
+                ref_scope[slot] = evaluate(scopes)
+                return False
+            return run_checked_assignment
+
+        def run_assignment(scopes):
+            ref_scope = scopes[depth]
+            if ref_scope[slot] is None:
+                undefined(scopes)
+            result = evaluate(scopes)
+            cur_val = ref_scope[slot]
+            interp.check_struct_equivalence(cur_val, result)
+            if offsets != None:
+                res_struct, offset = interp.get_verified_struct_member(cur_val, var_fields, offsets, full_name)
+                field_value = res_struct.values[offset]
+                res_struct.values[offset] = interp.assign_helper(field_value.val_type, result.val_type, field_value, result)
+                return False
+            if var_fields:
+                res_struct, field_name = interp.get_struct_member(cur_val, var_fields, full_name)
+                result = interp.assign_helper(res_struct.get_field_type(field_name), result.val_type, res_struct.get_field(field_name), result)
+                res_struct.change_field(field_name, result)
+                return False
+            var_type = cur_val.val_type
+            if var_type != result.val_type:
+                result = interp.assign_helper(var_type, result.val_type, cur_val, result)
+            ref_scope[slot] = result
+            return False
+        return run_assignment
+
+    def compile_if(self, if_node):
+        condition = self.compile_conditional(if_node.condition)
+        then_body = self.compile_body(if_node.statements)
+        else_body = self.compile_body(if_node.else_statements)
+        then_size = if_node.frame_size
+        else_size = if_node.else_frame_size
+
+        def run_if(scopes):
+            if condition(scopes).value:
+                scopes.append([None] * then_size)
+                ret = then_body(scopes)
+            else:
+                scopes.append([None] * else_size)
+                ret = else_body(scopes)
+            scopes.pop()
+            return ret
+        return run_if
+
+    def compile_for(self, for_node):
+        init = self.compile_assignment(for_node.init)
+        condition = self.compile_conditional(for_node.condition)
+        update = self.compile_assignment(for_node.update)
+        body = self.compile_body(for_node.statements)
+        body_size = for_node.frame_size
+        if for_node.counted != None:
+            return self.compile_counted_for(for_node, init, condition, body)
+
+        def run_for(scopes):
+            init(scopes)
+            while condition(scopes).value:
+                scopes.append([None] * body_size)
+                ret = body(scopes)
+                scopes.pop()
+                if ret:
+                    return True
+                update(scopes)
+            return False
+        return run_for
+
+    # mirrors Interpreter.do_counted_for
+    def compile_counted_for(self, for_node, init, condition, body):
+        (depth, slot), limit_addr, limit_value, step, inclusive = for_node.counted
+        empty_frame = [None] * for_node.frame_size
+
+        def run_counted_for(scopes):
+            init(scopes)
+            if not condition(scopes).value:
+                return False
+            limit = limit_value if limit_addr == None else scopes[limit_addr[0]][limit_addr[1]].value
+            if inclusive:
+                limit += 1
+            counter_scope = scopes[depth]
+            counter = counter_scope[slot].value
+            body_frame = list(empty_frame)
+            scopes.append(body_frame)
+            ret = False
+            while counter < limit:
+                if body(scopes):
+                    ret = True
+                    break
+                counter += step
+                counter_scope[slot] = make_int(counter)
+                body_frame[:] = empty_frame
+            scopes.pop()
+            return ret
+        return run_counted_for
+
+    # mirrors Interpreter.do_try
+    def compile_try(self, try_node):
+        body = self.compile_body(try_node.statements)
+        body_size = try_node.frame_size
+        depth = try_node.depth
+        handlers = {
+            exception_type: (self.compile_body(catch_node.statements), catch_node.frame_size)
+            for exception_type, catch_node in try_node.handlers.items()
+        }
+
+        def run_try(scopes):
+            scopes.append([None] * body_size)
+            try:
+                ret = body(scopes)
+            except Exception_Object as exception:
+                handler = handlers.get(exception.exception_type)
+                if handler is None:
+                    raise
+            else:
+                scopes.pop()
+                return ret
+            catch_body, catch_size = handler
+            del scopes[depth:]
+            scopes.append([None] * catch_size)
+            ret = catch_body(scopes)
+            scopes.pop()
+            return ret
+        return run_try
+
+    def compile_raise(self, raise_node):
+        interp = self.interp
+        expression = raise_node.exception_type
+        if expression.elem_type == interp.NEW_NODE:
+            evaluate = self.compile_expression(expression)
+        else:
+            evaluate = self.compile_operand(expression)
+        STRING_NODE = interp.STRING_NODE
+        line = raise_node.lineno
+
+        def run_raise(scopes):
+            exception_type = evaluate(scopes)
+            if exception_type.get_type() != STRING_NODE:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Incompatible type for raise operation"
+                )
+            raise Exception_Object(exception_type.value, line)
+        return run_raise
+
+    def compile_return(self, return_node):
+        interp = self.interp
+        expression = return_node.expression
+        if expression == None:
+            return lambda scopes: True
+
+        ret_eval_type = expression.elem_type
+        if ret_eval_type == interp.VAR_NODE:
+            evaluate = self.compile_variable(expression)
+        elif ret_eval_type in interp.var_types:
+            evaluate = self.compile_value(expression)
+        elif ret_eval_type in interp.bool_ops or ret_eval_type in interp.arithmetic_ops or ret_eval_type in interp.comparison_ops:
+            evaluate = self.compile_expression(expression)
+        elif ret_eval_type == interp.FCALL_NODE:
+            evaluate = self.compile_call(expression)
+        else:
+            evaluate = lambda scopes: None
+
+        def run_return(scopes):
+            scopes[0][RET_SLOT] = evaluate(scopes)
+            return True
+        return run_return
+
+    #####################################################################
+    # function calls
+    #####################################################################
+
+    def compile_call(self, call_node):
+        interp = self.interp
+        fcall_name = call_node.name
+        arg_nodes = call_node.args
+        if fcall_name == 'print':
+            return self.compile_print(arg_nodes)
+        elif fcall_name == 'inputi' or fcall_name == 'inputs':
+            return self.compile_input(fcall_name, arg_nodes)
+
+        fcall_dict_key = fcall_name + '_' + str(len(arg_nodes))
+        if fcall_dict_key not in interp.func_defs_to_node:
+            def missing_function(scopes):
+                interp.error(
+                    ErrorType.NAME_ERROR,
+                    f"Function {fcall_name} was not found",
+                )
+            return missing_function
+
+        func_node = interp.func_defs_to_node[fcall_dict_key]
+        return_type = func_node.return_type
+        if return_type == interp.INT_NODE:
+            default_return = interp.int_object
+        elif return_type == interp.BOOL_NODE:
+            default_return = interp.false_object
+        elif return_type == interp.STRING_NODE:
+            default_return = interp.string_object
+        elif return_type in interp.struct_types:
+            default_return = interp.nil_object
+        else:
+            default_return = interp.void_object
+
+        params = []
+        for arg_node, param_node in zip(arg_nodes, func_node.args):
+            if arg_node.elem_type == interp.VAR_NODE:
+                evaluate = self.compile_variable(arg_node)
+            elif arg_node.elem_type in interp.var_types:
+                evaluate = self.compile_value(arg_node)
+            elif arg_node.elem_type == interp.FCALL_NODE:
+                evaluate = self.compile_call(arg_node)
+            else:
+                evaluate = self.compile_expression(arg_node)
+            params.append((evaluate, param_node.slot, param_node.name, param_node.var_type))
+        params = tuple(params)
+
+        struct_types = interp.struct_types
+        compiled_funcs = self.compiled_funcs
+        param_frame_size = func_node.param_frame_size
+        body_frame_size = func_node.frame_size
+        INT_NODE, BOOL_NODE, NIL_NODE = interp.INT_NODE, interp.BOOL_NODE, interp.NIL_NODE
+
+        memo = interp.memo_caches.get(fcall_dict_key)
+        memo_slots = tuple(sorted(set(param[1] for param in params)))
+
+        if call_node.checked:
+            # arguments and return value already have the declared types
+            param_slots = tuple((evaluate, param_slot) for evaluate, param_slot, param_name, param_type in params)
+
+            def run_checked_call(scopes):
+                new_scope = [None] * param_frame_size
+                new_scope[RET_SLOT] = default_return()
+                for evaluate, param_slot in param_slots:
+                    new_scope[param_slot] = evaluate(scopes)
+                if memo is not None:
+                    memo_key = tuple([new_scope[slot].value for slot in memo_slots])
+                    func_return = memo.lookup(memo_key)
+                    if func_return is not None:
+                        return func_return
+                compiled_funcs[fcall_dict_key]([new_scope, [None] * body_frame_size])
+                if memo is not None:
+                    memo.store(memo_key, new_scope[RET_SLOT])
+                return new_scope[RET_SLOT]
+            return run_checked_call
+
+        def run_call(scopes):
+            new_scope = [None] * param_frame_size
+            new_scope[RET_SLOT] = default_return()
+            for evaluate, param_slot, param_name, param_type in params:
+                arg = evaluate(scopes)
+                arg_type = arg.val_type
+                if param_type != arg_type:
+                    if param_type == BOOL_NODE and arg_type == INT_NODE:
+                        arg = arg.coerce_i_to_b()
+                    elif not (param_type in struct_types and arg_type == NIL_NODE and (arg.struct_type == NIL_NODE or arg.struct_type == param_type)):
+                        interp.error(
+                            ErrorType.TYPE_ERROR,
+                            f"Type mismatch on formal parameter {param_name}"
+                        )
+                new_scope[param_slot] = arg
+            if memo is not None:
+                memo_key = tuple([new_scope[slot].value for slot in memo_slots])
+                cached = memo.lookup(memo_key)
+                if cached is not None:
+                    return cached
+            compiled_funcs[fcall_dict_key]([new_scope, [None] * body_frame_size])
+
+            func_return = new_scope[RET_SLOT]
+            ret_type = func_return.get_type()
+            if ret_type != return_type:
+                if ret_type == INT_NODE and return_type == BOOL_NODE:
+                    func_return = func_return.coerce_i_to_b()
+                elif ret_type == NIL_NODE and return_type in struct_types and (func_return.struct_type == return_type or func_return.struct_type == NIL_NODE):
+                    func_return = interp.nil_object(return_type)
+                else:
+                    interp.error(
+                        ErrorType.TYPE_ERROR,
+                        f"Returned value's type {ret_type} is inconsistent with function's return type {return_type}"
+                    )
+            if memo is not None:
+                memo.store(memo_key, func_return)
+            return func_return
+        return run_call
+
+    def compile_print(self, arg_nodes):
+        interp = self.interp
+        parts = tuple(self.compile_print_arg(arg) for arg in arg_nodes)
+
+        def run_print(scopes):
+            interp.output(''.join([part(scopes) for part in parts]))
+            return interp.void_object()
+        return run_print
+
+    def compile_print_arg(self, arg):
+        interp = self.interp
+        elem_type = arg.elem_type
+        BOOL_NODE, NIL_NODE, VOID_DEF, NIL_DEF = interp.BOOL_NODE, interp.NIL_NODE, interp.VOID_DEF, interp.NIL_DEF
+        if elem_type == interp.VAR_NODE:
+            evaluate = self.compile_variable(arg)
+
+            def print_var(scopes):
+                res = evaluate(scopes)
+                if res.val_type == BOOL_NODE:
+                    return 'true' if res.value else 'false'
+                elif res.val_type == NIL_NODE:
+                    return NIL_DEF
+                return str(res.value)
+            return print_var
+        elif elem_type == interp.INT_NODE or elem_type == interp.STRING_NODE:
+            text = str(arg.val)
+            return lambda scopes: text
+        elif elem_type in interp.arithmetic_ops:
+            evaluate = self.compile_expression(arg)
+            return lambda scopes: str(evaluate(scopes).value)
+        elif elem_type in interp.comparison_ops or elem_type in interp.bool_ops:
+            evaluate = self.compile_expression(arg)
+            return lambda scopes: 'true' if evaluate(scopes).value else 'false'
+        elif elem_type == interp.BOOL_NODE:
+            text = 'true' if arg.val else 'false'
+            return lambda scopes: text
+        elif elem_type == interp.FCALL_NODE:
+            evaluate = self.compile_call(arg)
+
+            def print_call(scopes):
+                res = evaluate(scopes)
+                if res.val_type == BOOL_NODE:
+                    return 'true' if res.value else 'false'
+                elif res.val_type == NIL_NODE:
+                    return NIL_DEF
+                elif res.val_type == VOID_DEF:
+                    interp.error(
+                        ErrorType.TYPE_ERROR,
+                        f"Cannot print type void"
+                    )
+                return str(res.value)
+            return print_call
+        return lambda scopes: NIL_DEF
+
+    def compile_input(self, fcall_name, prompt):
+        interp = self.interp
+        if len(prompt) > 2:
+            def too_many_args(scopes):
+                interp.error(
+                    ErrorType.NAME_ERROR,
+                    f"No {fcall_name}() function found that takes > 1 parameter",
+                )
+            return too_many_args
+        evaluate_prompt = self.compile_value(prompt[0]) if len(prompt) > 0 else None
+        if fcall_name == 'inputi':
+            convert, result_type = int, interp.INT_NODE
+        else:
+            convert, result_type = str, interp.STRING_NODE
+
+        def run_input(scopes):
+            if evaluate_prompt is not None:
+                interp.output(evaluate_prompt(scopes).get_value())
+            return Data_Object(result_type, convert(interp.get_input()))
+        return run_input
+
+    #####################################################################
+    # expressions
+    #####################################################################
+
+    def compile_expression(self, expression_node):
+        interp = self.interp
+        elem_type = expression_node.elem_type
+        if elem_type == interp.NEW_NODE:
+            struct_name = expression_node.var_type
+
+            def run_new(scopes):
+                if struct_name not in interp.struct_types:
+                    interp.error(
+                        ErrorType.TYPE_ERROR,
+                        f"Invalid type {struct_name} for new operation"
+                    )
+                return interp.init_new_struct(struct_name)
+            return run_new
+
+        INT_NODE, BOOL_NODE = interp.INT_NODE, interp.BOOL_NODE
+        operand_1 = self.compile_operand(expression_node.op1)
+        if interp.short_circuit and (elem_type == '&&' or elem_type == '||'):
+            return self.compile_short_circuit(expression_node, operand_1)
+        if expression_node.checked:
+            operator = CHECKED_OPERATORS[elem_type]
+            if elem_type == interp.NEG_NODE or elem_type == interp.NOT_NODE:
+                return lambda scopes: operator(operand_1(scopes))
+            operand_2 = self.compile_operand(expression_node.op2)
+            return lambda scopes: operator(operand_1(scopes), operand_2(scopes))
+        if elem_type == interp.NEG_NODE:
+            def run_neg(scopes):
+                op1 = operand_1(scopes)
+                if op1.val_type != INT_NODE:
+                    interp.error(
+                        ErrorType.TYPE_ERROR,
+                        f"Incompatible type for neg operation"
+                    )
+                return -op1
+            return run_neg
+        elif elem_type == interp.NOT_NODE:
+            def run_not(scopes):
+                op1 = operand_1(scopes)
+                op1_type = op1.val_type
+                if op1_type != BOOL_NODE and op1_type != INT_NODE:
+                    interp.error(
+                        ErrorType.TYPE_ERROR,
+                        f"Incompatible type for ! operation"
+                    )
+                if op1_type == INT_NODE:
+                    op1 = op1.coerce_i_to_b()
+                return op1.logical_not()
+            return run_not
+
+        operand_2 = self.compile_operand(expression_node.op2)
+        apply = self.compile_binary_op(elem_type)
+        NIL_NODE, VOID_DEF = interp.NIL_NODE, interp.VOID_DEF
+
+        def run_binary(scopes):
+            op1 = operand_1(scopes)
+            op2 = operand_2(scopes)
+            op1_type = op1.val_type
+            op2_type = op2.val_type
+            if op1_type == NIL_NODE and op2_type == NIL_NODE:
+                interp.check_struct_equivalence(op1, op2)
+            if op1_type == VOID_DEF or op2_type == VOID_DEF:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Can't compare void type"
+                )
+            return apply(op1, op2, op1_type, op2_type)
+        return run_binary
+
+    # mirrors Interpreter.evaluate_short_circuit
+    def compile_short_circuit(self, expression_node, operand_1):
+        interp = self.interp
+        elem_type = expression_node.elem_type
+        operand_2 = self.compile_operand(expression_node.op2)
+        if expression_node.checked:
+            def run_checked_short_circuit(scopes):
+                result = operand_1(scopes).short_circuit(elem_type)
+                if result is not None:
+                    return result
+                return operand_2(scopes).coerce_i_to_b()
+            return run_checked_short_circuit
+
+        check_logical_operand = interp.check_logical_operand
+
+        def run_short_circuit(scopes):
+            op1 = operand_1(scopes)
+            check_logical_operand(op1, elem_type)
+            result = op1.short_circuit(elem_type)
+            if result is not None:
+                return result
+            op2 = operand_2(scopes)
+            check_logical_operand(op2, elem_type)
+            return op2.coerce_i_to_b()
+        return run_short_circuit
+
+    # returns the operator body that runs after the shared struct/void checks
+    def compile_binary_op(self, elem_type):
+        interp = self.interp
+        INT_NODE, BOOL_NODE, NIL_NODE = interp.INT_NODE, interp.BOOL_NODE, interp.NIL_NODE
+        struct_types = interp.struct_types
+
+        def type_error(description):
+            interp.error(ErrorType.TYPE_ERROR, description)
+
+        if elem_type == '+':
+            def apply(op1, op2, op1_type, op2_type):
+                if interp.check_addition_compatible(op1, op2):
+                    return op1 + op2
+                type_error(f"Cannot use operator + on non-string and non-integer operators")
+        elif elem_type == '-':
+            def apply(op1, op2, op1_type, op2_type):
+                if op1_type != INT_NODE or op2_type != INT_NODE:
+                    type_error(f"Cannot use operator - on non-integer operators")
+                return op1 - op2
+        elif elem_type == '/':
+            def apply(op1, op2, op1_type, op2_type):
+                if op1_type != INT_NODE or op2_type != INT_NODE:
+                    type_error(f"Cannot use operator / on non-integer operators")
+                return op1 // op2
+        elif elem_type in ('*', '<', '>', '<=', '>='):
+            operator = {
+                '*': Data_Object.__mul__,
+                '<': Data_Object.__lt__,
+                '>': Data_Object.__gt__,
+                '<=': Data_Object.__le__,
+                '>=': Data_Object.__ge__,
+            }[elem_type]
+
+            def apply(op1, op2, op1_type, op2_type):
+                if op1_type != op2_type or op1_type != INT_NODE:
+                    type_error(f"Incompatible types for {elem_type} operation")
+                return operator(op1, op2)
+        elif elem_type == '==' or elem_type == '!=':
+            compare = (lambda a, b: a == b) if elem_type == '==' else (lambda a, b: a != b)
+
+            def apply(op1, op2, op1_type, op2_type):
+                if op1_type != op2_type:
+                    if (op1_type == INT_NODE or op1_type == BOOL_NODE) and (op2_type == INT_NODE or op2_type == BOOL_NODE):
+                        op1 = op1.coerce_i_to_b()
+                        op2 = op2.coerce_i_to_b()
+                    elif not (op1_type in struct_types and op2_type == NIL_NODE or op1_type == NIL_NODE and op2_type in struct_types):
+                        type_error(f"Can't compare unrelated types {op1_type} and {op2_type}")
+                return compare(op1, op2)
+        elif elem_type == '||' or elem_type == '&&':
+            combine = Data_Object.logical_or if elem_type == '||' else Data_Object.logical_and
+
+            def apply(op1, op2, op1_type, op2_type):
+                if op1_type != BOOL_NODE and op1_type != INT_NODE or op2_type != BOOL_NODE and op2_type != INT_NODE:
+                    type_error(f"Invalid types used with operator {elem_type}")
+                return combine(op1, op2)
+        else:
+            def apply(op1, op2, op1_type, op2_type):
+                return None
+        return apply
+
+    def compile_operand(self, operand_node):
+        interp = self.interp
+        elem_type = operand_node.elem_type
+        if elem_type == interp.VAR_NODE:
+            return self.compile_variable(operand_node)
+        elif elem_type in interp.arithmetic_ops or elem_type in interp.bool_ops or elem_type in interp.comparison_ops:
+            return self.compile_expression(operand_node)
+        elif elem_type == interp.FCALL_NODE:
+            return self.compile_call(operand_node)
+        elif elem_type == interp.NIL_NODE:
+            return lambda scopes: interp.nil_object()
+        return self.compile_value(operand_node)
+
+    def compile_conditional(self, condition_node):
+        interp = self.interp
+        condition_type = condition_node.elem_type
+        if condition_type == interp.VAR_NODE:
+            evaluate = self.compile_variable(condition_node)
+        elif condition_type == interp.BOOL_NODE or condition_type == interp.INT_NODE:
+            evaluate = self.compile_value(condition_node)
+        elif condition_type in interp.bool_ops or condition_type in interp.comparison_ops or condition_type in interp.arithmetic_ops:
+            evaluate = self.compile_expression(condition_node)
+        elif condition_type == interp.FCALL_NODE:
+            evaluate = self.compile_call(condition_node)
+        else:
+            evaluate = lambda scopes: interp.false_object()
+
+        INT_NODE, BOOL_NODE = interp.INT_NODE, interp.BOOL_NODE
+
+        def run_conditional(scopes):
+            condition_eval = evaluate(scopes)
+            if condition_eval.val_type == INT_NODE:
+                condition_eval = condition_eval.coerce_i_to_b()
+            if condition_eval.val_type != BOOL_NODE:
+                interp.error(
+                    ErrorType.TYPE_ERROR,
+                    f"Expression does not evaluate to boolean",
+                )
+            return condition_eval
+        return run_conditional
+
+    def compile_variable(self, var_node):
+        interp = self.interp
+        full_name = var_node.name
+        var_name = full_name.split('.')[0]
+        var_fields = var_node.fields
+        offsets = var_node.offsets
+
+        def undefined(scopes):
+            interp.error(
+                ErrorType.NAME_ERROR,
+                f"Variable {var_name} has not been defined",
+            )
+        if var_node.addr == None:
+            return undefined
+        depth, slot = var_node.addr
+
+        if offsets != None:
+            get_verified_struct_member = interp.get_verified_struct_member
+            def read_verified_field(scopes):
+                value = scopes[depth][slot]
+                if value is None:
+                    undefined(scopes)
+                res_struct, offset = get_verified_struct_member(value, var_fields, offsets, full_name)
+                return res_struct.values[offset]
+            return read_verified_field
+
+        if var_fields:
+            def read_field(scopes):
+                value = scopes[depth][slot]
+                if value is None:
+                    undefined(scopes)
+                res_struct, field_name = interp.get_struct_member(value, var_fields, full_name)
+                return res_struct.get_field(field_name)
+            return read_field
+
+        def read_variable(scopes):
+            value = scopes[depth][slot]
+            if value is None:
+                undefined(scopes)
+            return value
+        return read_variable
+
+    # mirrors evaluate_value, including its handling of non-literal nodes
+    def compile_value(self, val_node):
+        interp = self.interp
+        if val_node.elem_type == interp.BOOL_NODE:
+            if val_node.val == interp.TRUE_DEF:
+                return lambda scopes: interp.true_object()
+            elif val_node.val == interp.FALSE_DEF:
+                return lambda scopes: interp.false_object()
+        elif val_node.elem_type == interp.NIL_NODE:
+            return lambda scopes: interp.nil_object()
+        if not hasattr(val_node, 'val'):
+            return lambda scopes: Data_Object(val_node.elem_type, val_node.val)
+        constant = Data_Object(val_node.elem_type, val_node.val)
+        return lambda scopes: constant
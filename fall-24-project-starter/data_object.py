@@ -1,5 +1,10 @@
 
+# Values are immutable: assignment replaces the Data_Object held by a variable
+# or field, it never changes one in place. That lets true, false, void, the
+# empty string and small ints be shared singletons (see the bottom of the file).
 class Data_Object:
+    __slots__ = ('val_type', 'value')
+
     INT_TYPE = 'int'
     STRING_TYPE = 'string'
     BOOL_TYPE = 'bool'
@@ -16,9 +21,6 @@ class Data_Object:
     
     def get_value(self):
         return self.value
-    
-    def set_value(self, val):
-        self.value = val
 
     # Representation and Coercion
     def __str__(self):
@@ -30,79 +32,108 @@ class Data_Object:
     def coerce_i_to_b(self):
         if self.val_type == self.BOOL_TYPE:
             return self
-        return Data_Object(self.BOOL_TYPE, self.value != 0)
+        return TRUE if self.value != 0 else FALSE
     
     # ARITHMETIC
     def __add__(self, other):
         if other.val_type == self.STRING_TYPE or self.val_type == self.STRING_TYPE:
             return Data_Object(self.STRING_TYPE, str(self.value) + str(other.value))
-        return Data_Object(self.INT_TYPE, self.value + other.value)
+        return make_int(self.value + other.value)
     
     def __sub__(self, other):
-        return Data_Object(self.INT_TYPE, self.value - other.value)
+        return make_int(self.value - other.value)
     
     def __floordiv__(self, other):
-        return Data_Object(self.INT_TYPE, self.value // other.value)
+        return make_int(self.value // other.value)
     
     def __mul__(self, other):
-        return Data_Object(self.INT_TYPE, self.value * other.value)
+        return make_int(self.value * other.value)
     
     def __neg__(self):
-        return Data_Object(self.INT_TYPE, -1 * self.value)
+        return make_int(-1 * self.value)
     
     
     # COMPARISON
     def __gt__(self, other):
-        return Data_Object(self.BOOL_TYPE, self.value > other.value)
+        return TRUE if self.value > other.value else FALSE
     
     def __lt__(self, other):
-        return Data_Object(self.BOOL_TYPE, self.value < other.value)
+        return TRUE if self.value < other.value else FALSE
     
     def __eq__(self, other):
-        return Data_Object(self.BOOL_TYPE, self.value == other.value)
+        return TRUE if self.value == other.value else FALSE
     
     def __le__(self, other):
-        return Data_Object(self.BOOL_TYPE, self.value <= other.value)
+        return TRUE if self.value <= other.value else FALSE
     
     def __ge__(self, other):
-        return Data_Object(self.BOOL_TYPE, self.value >= other.value)
+        return TRUE if self.value >= other.value else FALSE
     
     def __ne__(self, other):
-        return Data_Object(self.BOOL_TYPE, self.value != other.value)
+        return TRUE if self.value != other.value else FALSE
     
     def __not__(self):
-        return Data_Object(self.BOOL_TYPE, not self.value)
+        return FALSE if self.value else TRUE
     
     # BOOLEAN
     def logical_and(self, other):
         res = self.coerce_i_to_b().get_value() and other.coerce_i_to_b().get_value()
-        return Data_Object(self.BOOL_TYPE, res)
+        return TRUE if res else FALSE
     
     def logical_or(self, other):
         res = self.coerce_i_to_b().get_value() or other.coerce_i_to_b().get_value()
-        return Data_Object(self.BOOL_TYPE, res)
+        return TRUE if res else FALSE
     
+    # result of "self && ..." or "self || ..." when self alone decides it, otherwise None
+    def short_circuit(self, operator):
+        if self.coerce_i_to_b().value:
+            return TRUE if operator == '||' else None
+        return FALSE if operator == '&&' else None
+
     def logical_not(self):
         res = self.coerce_i_to_b()
-        return Data_Object(self.BOOL_TYPE, not res.get_value())
+        return FALSE if res.get_value() else TRUE
     
     # DEFAULTS
+    # the type arguments are kept for the existing callers; every default is shared
     @staticmethod
     def void_object(VOID_TYPE):
-        return Data_Object(VOID_TYPE, None)
+        return VOID
     
     @staticmethod
     def true_object(BOOL_TYPE):
-        return Data_Object(BOOL_TYPE, True)
+        return TRUE
     
     @staticmethod
     def false_object(BOOL_TYPE):
-        return Data_Object(BOOL_TYPE, False)
+        return FALSE
     
     @staticmethod
     def int_object(INT_TYPE):
-        return Data_Object(INT_TYPE, 0)
+        return SMALL_INTS[-SMALL_INT_MIN]
     
     @staticmethod
     def string_object(STRING_TYPE):
-        return Data_Object(STRING_TYPE, "")
\ No newline at end of file
+        return EMPTY_STRING
+
+
+#####################################################################
+# shared values
+#####################################################################
+
+TRUE = Data_Object(Data_Object.BOOL_TYPE, True)
+FALSE = Data_Object(Data_Object.BOOL_TYPE, False)
+VOID = Data_Object(Data_Object.VOID_TYPE, None)
+EMPTY_STRING = Data_Object(Data_Object.STRING_TYPE, "")
+
+SMALL_INT_MIN = -128
+SMALL_INT_MAX = 1024
+SMALL_INTS = [Data_Object(Data_Object.INT_TYPE, v) for v in range(SMALL_INT_MIN, SMALL_INT_MAX)]
+
+def make_int(value):
+    if SMALL_INT_MIN <= value < SMALL_INT_MAX:
+        return SMALL_INTS[value - SMALL_INT_MIN]
+    return Data_Object(Data_Object.INT_TYPE, value)
+
+def make_bool(value):
+    return TRUE if value else FALSE
\ No newline at end of file
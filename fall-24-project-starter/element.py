@@ -1,14 +1,55 @@
+from collections.abc import MutableMapping
+
+from intbase import InterpreterBase
+
+
+# A node of the AST. Element(elem_type, **kwargs) builds an instance of the
+# slotted class for elem_type (see NODE_CLASSES), so every node type keeps its
+# fields in attributes: node.name instead of a per-node dict. FIELDS are the
+# syntax fields, in the order the parser passes them; ANNOTATIONS are the
+# attributes the analysis passes write (addr, frame_size, checked, ...), None
+# until they do. Unknown node types get a Generic_Node, which keeps a dict.
+#
+# node.dict is a mapping view of the fields and the annotations that are set,
+# for code written against the dict-per-node Element.
+#
+# position is where the node starts in the source, the line and lexpos of its
+# first token (an operator's for binary operations) packed into one int by
+# pack_position; None for nodes the parser didn't build
 class Element:
-    def __init__(self, elem_type, **kwargs):
+    __slots__ = ('elem_type', 'position')
+    FIELDS = ()
+    ANNOTATIONS = ()
+
+    def __new__(cls, elem_type=None, **kwargs):
+        if cls is Element:
+            cls = NODE_CLASSES.get(elem_type, Generic_Node)
+        return object.__new__(cls)
+
+    def __init__(self, elem_type, position=None, **kwargs):
         self.elem_type = elem_type
-        self.dict = {}
+        self.position = position
+        for key in self.FIELDS:
+            setattr(self, key, None)
+        for key in self.ANNOTATIONS:
+            setattr(self, key, None)
         for key, value in kwargs.items():
-            self.dict[key] = value
+            setattr(self, key, value)
+
+    @property
+    def dict(self):
+        return Node_Dict(self)
+
+    @property
+    def lineno(self):
+        return None if self.position is None else self.position >> POSITION_BITS
+
+    @property
+    def lexpos(self):
+        return None if self.position is None else self.position & LEXPOS_MASK
 
     def get(self, key):
-        if key not in self.dict:
-            return None
-        return self.dict[key]
+        return getattr(self, key, None)
 
     def __str__(self):
         s = f"{self.elem_type}: "
@@ -27,3 +68,196 @@ class Element:
                 return "[" + s[0:-2] + "]"
             return "[" + s + "]"
         return str(v)
+
+
+# fields and annotations of a node as a dict; fields can be reassigned but
+# not removed, deleting an annotation resets it to None
+class Node_Dict(MutableMapping):
+    __slots__ = ('node',)
+
+    def __init__(self, node):
+        self.node = node
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return getattr(self.node, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.node.FIELDS and key not in self.node.ANNOTATIONS:
+            raise KeyError(f"{self.node.elem_type} nodes have no {key}")
+        setattr(self.node, key, value)
+
+    def __delitem__(self, key):
+        if key not in self.node.ANNOTATIONS or key not in self:
+            raise KeyError(key)
+        setattr(self.node, key, None)
+
+    def __contains__(self, key):
+        return key in self.node.FIELDS or (key in self.node.ANNOTATIONS and getattr(self.node, key) is not None)
+
+    def __iter__(self):
+        yield from self.node.FIELDS
+        for key in self.node.ANNOTATIONS:
+            if getattr(self.node, key) is not None:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+# a node of a type Element doesn't know, with its fields in a dict as before
+class Generic_Node(Element):
+    dict = None
+
+    def __init__(self, elem_type, position=None, **kwargs):
+        self.elem_type = elem_type
+        self.position = position
+        self.dict = dict(kwargs)
+
+    def __getattr__(self, key):
+        try:
+            return self.__dict__['dict'][key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def get(self, key):
+        return self.dict.get(key)
+
+
+# a source position as one int: the line above the low POSITION_BITS bits,
+# the lexpos in them
+POSITION_BITS = 32
+LEXPOS_MASK = (1 << POSITION_BITS) - 1
+
+def pack_position(lineno, lexpos):
+    return lineno << POSITION_BITS | lexpos
+
+
+#####################################################################
+# node types
+#####################################################################
+
+# annotations of variables and assignments, written by the Slot_Resolver
+VARIABLE_ANNOTATIONS = ('addr', 'fields', 'offsets', 'static_type')
+
+class Program_Node(Element):
+    FIELDS = ('structs', 'functions')
+    __slots__ = FIELDS
+
+class Struct_Node(Element):
+    FIELDS = ('name', 'fields')
+    __slots__ = FIELDS
+
+class Field_Def_Node(Element):
+    FIELDS = ('name', 'var_type')
+    __slots__ = FIELDS
+
+class Func_Node(Element):
+    FIELDS = ('name', 'args', 'return_type', 'statements')
+    ANNOTATIONS = ('param_frame_size', 'frame_size')
+    __slots__ = FIELDS + ANNOTATIONS
+
+class Arg_Node(Element):
+    FIELDS = ('name', 'var_type')
+    ANNOTATIONS = ('slot',)
+    __slots__ = FIELDS + ANNOTATIONS
+
+class Var_Def_Node(Element):
+    FIELDS = ('name', 'var_type')
+    ANNOTATIONS = ('redefined', 'addr')
+    __slots__ = FIELDS + ANNOTATIONS
+
+class Assign_Node(Element):
+    FIELDS = ('name', 'expression')
+    ANNOTATIONS = VARIABLE_ANNOTATIONS + ('checked',)
+    __slots__ = FIELDS + ANNOTATIONS
+
+class If_Node(Element):
+    FIELDS = ('condition', 'statements', 'else_statements')
+    ANNOTATIONS = ('frame_size', 'else_frame_size')
+    __slots__ = FIELDS + ANNOTATIONS
+
+class For_Node(Element):
+    FIELDS = ('init', 'condition', 'update', 'statements')
+    ANNOTATIONS = ('frame_size', 'counted')
+    __slots__ = FIELDS + ANNOTATIONS
+
+class Try_Node(Element):
+    FIELDS = ('statements', 'catchers')
+    ANNOTATIONS = ('depth', 'frame_size', 'handlers')
+    __slots__ = FIELDS + ANNOTATIONS
+
+class Catch_Node(Element):
+    FIELDS = ('exception_type', 'statements')
+    ANNOTATIONS = ('frame_size',)
+    __slots__ = FIELDS + ANNOTATIONS
+
+class Raise_Node(Element):
+    FIELDS = ('exception_type',)
+    __slots__ = FIELDS
+
+class Return_Node(Element):
+    FIELDS = ('expression',)
+    __slots__ = FIELDS
+
+class Fcall_Node(Element):
+    FIELDS = ('name', 'args')
+    ANNOTATIONS = ('checked', 'call_cache')
+    __slots__ = FIELDS + ANNOTATIONS
+
+class Var_Node(Element):
+    FIELDS = ('name',)
+    ANNOTATIONS = VARIABLE_ANNOTATIONS
+    __slots__ = FIELDS + ANNOTATIONS
+
+# int, string and bool constants
+class Value_Node(Element):
+    FIELDS = ('val',)
+    __slots__ = FIELDS
+
+class Nil_Node(Element):
+    __slots__ = ()
+
+class New_Node(Element):
+    FIELDS = ('var_type',)
+    __slots__ = FIELDS
+
+class Unary_Node(Element):
+    FIELDS = ('op1',)
+    ANNOTATIONS = ('checked',)
+    __slots__ = FIELDS + ANNOTATIONS
+
+class Binary_Node(Element):
+    FIELDS = ('op1', 'op2')
+    ANNOTATIONS = ('checked',)
+    __slots__ = FIELDS + ANNOTATIONS
+
+
+# elem_type -> node class, for every node type brewparse builds
+NODE_CLASSES = {
+    InterpreterBase.PROGRAM_NODE: Program_Node,
+    InterpreterBase.STRUCT_NODE: Struct_Node,
+    InterpreterBase.FIELD_DEF_NODE: Field_Def_Node,
+    InterpreterBase.FUNC_NODE: Func_Node,
+    InterpreterBase.ARG_NODE: Arg_Node,
+    InterpreterBase.VAR_DEF_NODE: Var_Def_Node,
+    "=": Assign_Node,
+    InterpreterBase.IF_NODE: If_Node,
+    InterpreterBase.FOR_NODE: For_Node,
+    InterpreterBase.TRY_NODE: Try_Node,
+    InterpreterBase.CATCH_NODE: Catch_Node,
+    InterpreterBase.RAISE_NODE: Raise_Node,
+    InterpreterBase.RETURN_NODE: Return_Node,
+    InterpreterBase.FCALL_NODE: Fcall_Node,
+    InterpreterBase.VAR_NODE: Var_Node,
+    InterpreterBase.INT_NODE: Value_Node,
+    InterpreterBase.STRING_NODE: Value_Node,
+    InterpreterBase.BOOL_NODE: Value_Node,
+    InterpreterBase.NIL_NODE: Nil_Node,
+    InterpreterBase.NEW_NODE: New_Node,
+    InterpreterBase.NEG_NODE: Unary_Node,
+    InterpreterBase.NOT_NODE: Unary_Node,
+}
+for operator in ['+', '-', '*', '/', '==', '!=', '<', '<=', '>', '>=', '&&', '||']:
+    NODE_CLASSES[operator] = Binary_Node
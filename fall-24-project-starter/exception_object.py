@@ -0,0 +1,14 @@
+# A Brewin exception in flight, raised by a raise statement and caught by the
+# nearest enclosing try with a catch for its type. It is a Python exception so
+# that entering a try costs nothing: the engines use Python's own try/except,
+# and the VM looks handlers up in its exception tables only once raised.
+# line is the line of the raise statement, for the error if nothing catches it.
+class Exception_Object(Exception):
+    __slots__ = ('exception_type', 'line')
+
+    def __init__(self, exception_type, line=None):
+        self.exception_type = exception_type
+        self.line = line
+
+    def __str__(self):
+        return f"exception: {self.exception_type}"
@@ -0,0 +1,153 @@
+import re
+
+from array_lexer import EOF, tokenize
+from brewparse import Parser, LALR_PARSER, precedence
+from element import Element, POSITION_BITS
+from intbase import InterpreterBase
+from pratt_parser import Pratt_Parser
+
+# The tokens that decide where top-level definitions start: names (for 'func'
+# and 'struct'), comments and strings (which hide both) and braces. Each
+# alternative only matches where brewlex starts a token too (the tokens this
+# skips over can't contain a match), so scanning finds the same keywords and
+# braces the lexer produces
+DEFINITION_SCANNER = re.compile(r'[A-Za-z_]\w*|/\*(?:.|\n)*?\*/|".*?"|[{}]')
+
+
+# Parses programs that change a definition at a time, as in an editor session.
+# The source is split where each top-level 'func' and 'struct' starts, and the
+# tree of every definition is kept under its text (everything up to the next
+# definition). A parse only parses the definitions whose text is new and
+# rebuilds the program node around the kept ones. A kept tree whose text is
+# where it was is shared with the trees earlier parses returned; one whose
+# text moved is copied with the positions of its new place, so the trees
+# earlier parses returned keep theirs.
+#
+# The trees, positions, errors and lineno are those of a full parse. Anything
+# that isn't a well-formed sequence of structs followed by functions (syntax
+# errors, stray tokens between definitions) is left to a full parse with
+# method, which reports the errors as usual. Definitions are parsed with the
+# Pratt parser, which builds the same trees as the LALR parser. reparsed is
+# the number of definitions the last parse had to parse.
+class Incremental_Parser:
+    def __init__(self, method=LALR_PARSER):
+        self.method = method
+        self.parser = Parser()
+        # a definition that doesn't parse is left to the full parse, which reports it
+        self.definition_parser = Pratt_Parser(precedence, lambda token: None)
+        # definition text -> (definition node, position delta applied to it)
+        self.definitions = dict()
+        self.lineno = 1
+        self.reparsed = 0
+
+    def parse(self, program):
+        starts = split_definitions(program)
+        if starts is None or tokenize(program[:starts[0]]).types[0] != EOF:
+            return self.full_parse(program)
+        self.reparsed = 0
+        definitions = dict()
+        structs, functions = [], []
+        # newlines before the definition, and where counting them stopped
+        line, counted = 0, 0
+        for start, end in zip(starts, starts[1:] + [len(program)]):
+            line += program.count("\n", counted, start)
+            counted = start
+            text = program[start:end]
+            delta = (line << POSITION_BITS) + start
+            kept = self.definitions.get(text)
+            if kept is None or text in definitions:
+                # a definition whose text appears twice gets a tree of its own
+                definition = self.definition_parser.parse_definition(text)
+                if definition is None:
+                    self.definitions.update(definitions)
+                    return self.full_parse(program)
+                self.reparsed += 1
+                if delta:
+                    shift_positions(definition, delta)
+            else:
+                definition, old_delta = kept
+                if old_delta != delta:
+                    definition = shifted_copy(definition, delta - old_delta)
+            definitions.setdefault(text, (definition, delta))
+            if definition.elem_type == InterpreterBase.STRUCT_NODE:
+                if functions:
+                    # structs must come first; the full parse reports it
+                    self.definitions.update(definitions)
+                    return self.full_parse(program)
+                structs.append(definition)
+            else:
+                functions.append(definition)
+        if not functions:
+            self.definitions.update(definitions)
+            return self.full_parse(program)
+        # definitions the program no longer has are dropped
+        self.definitions = definitions
+        self.lineno = program.count("\n") + 1
+        first = structs[0] if structs else functions[0]
+        return Element(InterpreterBase.PROGRAM_NODE, structs=structs, functions=functions, position=first.position)
+
+    def full_parse(self, program):
+        self.reparsed = 0
+        try:
+            return self.parser.parse(program, self.method)
+        finally:
+            self.lineno = self.parser.lineno
+
+
+# the offsets where the top-level definitions of program start, or None if
+# there are none or the braces don't balance
+def split_definitions(program):
+    starts = []
+    depth = 0
+    for match in DEFINITION_SCANNER.finditer(program):
+        token = match.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth < 0:
+                return None
+        elif depth == 0 and (token == 'func' or token == 'struct'):
+            starts.append(match.start())
+    if depth != 0 or not starts:
+        return None
+    return starts
+
+
+# adds delta to the position of every node in a tree no other tree shares
+def shift_positions(node, delta):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.position is not None:
+            node.position += delta
+        for key in node.FIELDS:
+            value = getattr(node, key)
+            if isinstance(value, Element):
+                stack.append(value)
+            elif isinstance(value, list):
+                stack.extend(value)
+
+
+# a copy of the tree with delta added to every position. Only the syntax
+# fields are copied, so the copy is the tree parsing the moved text builds
+def shifted_copy(node, delta):
+    stack = []
+
+    def copy(node):
+        position = node.position
+        node_copy = Element(node.elem_type, position=None if position is None else position + delta)
+        stack.append((node, node_copy))
+        return node_copy
+
+    root = copy(node)
+    while stack:
+        node, node_copy = stack.pop()
+        for key in node.FIELDS:
+            value = getattr(node, key)
+            if isinstance(value, Element):
+                value = copy(value)
+            elif isinstance(value, list):
+                value = [copy(item) if isinstance(item, Element) else item for item in value]
+            setattr(node_copy, key, value)
+    return root
@@ -1,24 +1,103 @@
 from intbase import InterpreterBase, ErrorType
-from brewparse import parse_program
-from data_object import Data_Object
-from struct_object import Struct_Object
+from brewparse import parse_program, LALR_PARSER, PARSERS
+from data_object import Data_Object, make_bool, make_int
+from struct_object import Struct_Object, Struct_Layout
+from closure_compiler import Closure_Compiler
+from brewvm import Bytecode_Compiler, VM
+from resolver import Slot_Resolver, RET_SLOT
+from typechecker import Type_Checker, CHECKED_OPERATORS
+from memoizer import Memo_Cache, Purity_Analysis
+from exception_object import Exception_Object
+from optimizer import AST_Optimizer, Invariant_Hoister
+from jit_compiler import Jit_Compiler
+from program_cache import Program_Cache
+
+
+# Everything do_call needs about a resolved user function, built once per call
+# site and cached on the fcall node. The frame template holds the default
+# return value in RET_SLOT; each parameter carries its coercion rules.
+class Call_Target:
+    def __init__(self, interp, func_key, func_node):
+        self.func_node = func_node
+        self.return_type = func_node.return_type
+        self.returns_struct = self.return_type in interp.struct_types
+        default_return = interp.void_object()
+        if self.return_type == interp.INT_NODE:
+            default_return = interp.int_object()
+        elif self.return_type == interp.BOOL_NODE:
+            default_return = interp.false_object()
+        elif self.return_type == interp.STRING_NODE:
+            default_return = interp.string_object()
+        elif self.returns_struct:
+            default_return = interp.nil_object()
+        self.frame_template = [None] * func_node.param_frame_size
+        self.frame_template[RET_SLOT] = default_return
+        self.frame_size = func_node.frame_size
+        # (slot, name, type, int coerces to it, nil of any/this struct type accepted)
+        self.params = tuple(
+            (p.slot, p.name, p.var_type, p.var_type == interp.BOOL_NODE, p.var_type in interp.struct_types)
+            for p in func_node.args
+        )
+        # results of a pure function are cached on the values in its parameter slots
+        self.memo = interp.memo_caches.get(func_key)
+        self.memo_slots = tuple(sorted(set(p[0] for p in self.params)))
+        # calls are counted on the function's entry until it is compiled
+        self.jit_entry = interp.jit_compiler.entry(func_key) if interp.jit_compiler != None else None
+        self.param_slots = tuple(p[0] for p in self.params)
 
 
 # returns of any kind must be a data object
 class Interpreter(InterpreterBase):
+    TREE_ENGINE = "tree"
+    CLOSURE_ENGINE = "closure"
+    VM_ENGINE = "vm"
+    ENGINES = [ TREE_ENGINE, CLOSURE_ENGINE, VM_ENGINE ]
+    MEMO_CACHE_SIZE = 4096
+    JIT_THRESHOLD = 50
     
     #####################################################################
     # Init functions
     #####################################################################
     
-    def __init__(self, console_output=True, inp=None, trace_output=False):
+    # typecheck reports provable type errors before the program runs, instead of
+    # when the offending code is reached; memoize caches the results of pure
+    # functions (see get_memo_stats); short_circuit skips the right operand of
+    # && and || when the left one decides the result, and type checks only the
+    # operands that were evaluated; optimize folds constants and drops dead
+    # code before the program runs (see get_nodes_removed); licm moves loop
+    # invariant expressions out of for loops (see get_hoisted_count); jit
+    # compiles functions the tree walker has called JIT_THRESHOLD times to
+    # Python (see get_jit_functions), dump_jit prints the generated source;
+    # cache_dir keeps analyzed programs on disk there (see get_cache_stats), and
+    # must be a directory only this user can write; the key that signs its
+    # files is kept in it too (see Program_Cache);
+    # parser picks the parser in brewparse.PARSERS that reads the program
+    def __init__(self, console_output=True, inp=None, trace_output=False, engine=TREE_ENGINE, typecheck=False, memoize=False, short_circuit=False, optimize=False, licm=False, jit=False, dump_jit=False, cache_dir=None, parser=LALR_PARSER):
         super().__init__(console_output, inp)
         self.trace_output = trace_output
+        self.typecheck = typecheck
+        self.memoize = memoize
+        self.short_circuit = short_circuit
+        self.optimize = optimize
+        self.nodes_removed = 0
+        self.licm = licm
+        self.hoisted_count = 0
+        self.jit = jit
+        self.dump_jit = dump_jit
+        self.jit_compiler = None
+        self.program_cache = Program_Cache(cache_dir) if cache_dir != None else None
+        self.memo_caches = dict()
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine {engine}, expected one of {self.ENGINES}")
+        self.engine = engine
+        if parser not in PARSERS:
+            raise ValueError(f"Unknown parser {parser}, expected one of {PARSERS}")
+        self.parser = parser
 
     def get_main_func_node(self, ast):
         if ast.elem_type == self.PROGRAM_NODE:
-            for f in ast.dict['functions']:
-                func_name = f.dict['name'] + '_' + str(len(f.dict['args']))
+            for f in ast.functions:
+                func_name = f.name + '_' + str(len(f.args))
                 self.func_defs_to_node[func_name] = f
         if 'main_0' in self.func_defs_to_node:
             return self.func_defs_to_node['main_0']
@@ -30,35 +109,90 @@ class Interpreter(InterpreterBase):
     def verify_all_func_types(self):
         for func_key in self.func_defs_to_node.keys():
             cur_func_node = self.func_defs_to_node[func_key]
-            func_ret_type = cur_func_node.dict['return_type']
+            func_ret_type = cur_func_node.return_type
             if func_ret_type not in self.var_types and func_ret_type not in self.struct_types and func_ret_type != self.VOID_DEF:
                 super().error(
                     ErrorType.TYPE_ERROR,
-                    f"Invalid return type {func_ret_type} in function {cur_func_node.dict['name']}"
+                    f"Invalid return type {func_ret_type} in function {cur_func_node.name}",
+                    cur_func_node.lineno,
                 )
 
     def verify_all_struct_fields(self):
         for struct_key in self.struct_types.keys():
             struct_fields = self.struct_types[struct_key]
             for field in struct_fields:
-                field_type = field.dict['var_type']
+                field_type = field.var_type
                 if field_type not in self.var_types and field_type not in self.struct_types:
                     super().error(
                         ErrorType.TYPE_ERROR,
-                        f"Invalid type when defining struct {struct_key}"
+                        f"Invalid type when defining struct {struct_key}",
+                        field.lineno,
                     )
 
     def run(self, program):
-        self.ast = parse_program(program)
-        if self.trace_output:
-            print(self.ast)
+        main_func_node, type_errors = self.load_program(program)
+        if self.typecheck and type_errors:
+            description, line = type_errors[0]
+            super().error(ErrorType.TYPE_ERROR, description, line)
+
+        self.memo_caches = dict()
+        if self.memoize:
+            for func_key in Purity_Analysis(self).pure_functions():
+                self.memo_caches[func_key] = Memo_Cache(self.MEMO_CACHE_SIZE)
+
+        # compiled code runs untraced, so tracing keeps every call in the walker
+        self.jit_compiler = None
+        if self.jit and self.engine == self.TREE_ENGINE and not self.trace_output:
+            self.jit_compiler = Jit_Compiler(self, self.dump_jit)
+
+        # main's 'ret' slot stays empty, so reading 'ret' in main is a NAME_ERROR
+        self.global_scope = [ [None] * main_func_node.param_frame_size, [None] * main_func_node.frame_size ]
+
+        try:
+            self.run_engine(main_func_node)
+        except Exception_Object as exception:
+            super().error(
+                ErrorType.FAULT_ERROR,
+                f"Exception {exception.exception_type} was not caught",
+                exception.line,
+            )
+
+    # Parses and analyzes program, or takes the analyzed tree from the program
+    # cache. The tables below are rebuilt from the tree either way, and the
+    # checks that can fail run again, so a cached program fails the same way.
+    # Returns main's node and the provable type errors
+    def load_program(self, program):
+        cache_key, cached = None, None
+        if self.program_cache != None and not self.trace_output:
+            cache_key = self.program_cache.key(program, self.optimize, self.licm)
+            cached = self.program_cache.load(cache_key)
+        if cached != None:
+            self.ast, type_errors, self.nodes_removed, self.hoisted_count = cached
+        else:
+            self.ast = parse_program(program, self.parser)
+            if self.optimize:
+                optimizer = AST_Optimizer()
+                self.ast = optimizer.optimize_program(self.ast)
+                self.nodes_removed = optimizer.nodes_removed
+            if self.trace_output:
+                print(self.ast)
 
-        self.var_name_to_val = dict()
         self.func_defs_to_node = dict()
         self.valid_coercions = { self.INT_NODE: [self.BOOL_NODE] }
-        self.struct_types = {s.dict['name'] : s.dict['fields'] for s in self.ast.dict['structs']}
+        self.struct_types = {s.name : s.fields for s in self.ast.structs}
+        self.struct_layouts = {name : Struct_Layout(name, fields) for name, fields in self.struct_types.items()}
+        if cached == None:
+            Slot_Resolver(self.struct_layouts).resolve_program(self.ast)
+        if cached == None and self.licm:
+            # the hoister needs the addresses, and the rewritten tree needs
+            # its own (try handlers point at catch nodes)
+            hoister = Invariant_Hoister()
+            hoisted_ast = hoister.hoist_program(self.ast)
+            self.hoisted_count = hoister.hoisted
+            if hoister.hoisted:
+                self.ast = hoisted_ast
+                Slot_Resolver(self.struct_layouts).resolve_program(self.ast)
 
-        self.global_scope = [ self.var_name_to_val ]
         self.var_types = [ self.INT_NODE, self.BOOL_NODE, self.STRING_NODE, self.NIL_NODE ]
         self.arithmetic_ops = ['+', '-', '*', '/', self.NEG_NODE]
         self.comparison_ops = ['<', '>', '<=', '>=', '==', '!=']
@@ -68,6 +202,25 @@ class Interpreter(InterpreterBase):
         self.verify_all_func_types()
         self.verify_all_struct_fields()
 
+        if cached == None:
+            type_errors = Type_Checker(self).check_program(self.ast)
+            # stored before the run adds its inline caches to the tree
+            if cache_key != None:
+                self.program_cache.store(cache_key, (self.ast, type_errors, self.nodes_removed, self.hoisted_count))
+        return main_func_node, type_errors
+
+    def run_engine(self, main_func_node):
+        if self.engine == self.CLOSURE_ENGINE:
+            # statement tracing is a tree walker feature; compiled code runs untraced
+            run_main = Closure_Compiler(self).compile_program()
+            run_main(self.global_scope)
+            return
+        if self.engine == self.VM_ENGINE:
+            self.vm = VM(self, Bytecode_Compiler(self).compile_program())
+            if self.trace_output:
+                print(self.vm.disassemble())
+            self.vm.run_main()
+            return
         self.run_func(main_func_node, self.global_scope)
 
     #####################################################################
@@ -76,9 +229,9 @@ class Interpreter(InterpreterBase):
     
     def run_func(self, func_node, scopes):
         if self.trace_output:
-            print("Running function: " + func_node.dict['name'])
+            print("Running function: " + func_node.name)
             print(scopes)
-        for statement in func_node.dict['statements']:
+        for statement in func_node.statements:
             ret = self.run_statement(statement, scopes)
             if ret or statement.elem_type == self.RETURN_NODE:
                 return
@@ -99,37 +252,61 @@ class Interpreter(InterpreterBase):
             print(scopes)
         elem_type = statement_node.elem_type
         ret = False
-        if elem_type == self.VAR_DEF_NODE:
-            self.do_definition(statement_node, scopes)
-        elif elem_type == '=':
-            self.do_assignment(statement_node, scopes)
-        elif elem_type == self.FCALL_NODE:
-            self.do_call(statement_node, scopes)
-        elif elem_type == self.IF_NODE:
-            ret = self.do_if(statement_node, scopes)
-        elif elem_type == self.FOR_NODE:
-            ret = self.do_for(statement_node, scopes)
-        elif elem_type == self.RETURN_NODE:
-            ret = self.do_return(statement_node, scopes)
+        try:
+            if elem_type == self.VAR_DEF_NODE:
+                self.do_definition(statement_node, scopes)
+            elif elem_type == '=':
+                self.do_assignment(statement_node, scopes)
+            elif elem_type == self.FCALL_NODE:
+                self.do_call(statement_node, scopes)
+            elif elem_type == self.IF_NODE:
+                ret = self.do_if(statement_node, scopes)
+            elif elem_type == self.FOR_NODE:
+                ret = self.do_for(statement_node, scopes)
+            elif elem_type == self.RETURN_NODE:
+                ret = self.do_return(statement_node, scopes)
+            elif elem_type == self.TRY_NODE:
+                ret = self.do_try(statement_node, scopes)
+            elif elem_type == self.RAISE_NODE:
+                self.do_raise(statement_node, scopes)
+        except Exception as exception:
+            if type(exception) is Exception:
+                self.locate_error(exception, statement_node)
+            raise
         return ret
 
+    # Adds the line of the innermost statement that was running to an error
+    # raised without one, rewriting its message to what error() would have
+    # raised with that line_num. Entering a try costs nothing, so lines are only
+    # looked up once an error is on its way out
+    def locate_error(self, exception, statement_node):
+        if self.error_type is None or self.error_line is not None:
+            return
+        line = statement_node.lineno if statement_node is not None else None
+        prefix = f"{self.error_type}"
+        message = exception.args[0] if exception.args else None
+        if line is None or not isinstance(message, str) or not message.startswith(prefix):
+            return
+        self.error_line = line
+        exception.args = (f"{prefix} on line {line}{message[len(prefix):]}",)
+
     #####################################################################
     # statement behaviors
     #####################################################################
     
     def do_definition(self, statement_node, scopes):
         if self.trace_output:
-            print("Running definition: " + statement_node.dict['name'])
+            print("Running definition: " + statement_node.name)
             print(scopes)
-        local_scope = scopes[-1]
-        var_name = statement_node.dict['name']
-        if var_name in local_scope:
+        depth, slot = statement_node.addr
+        var_name = statement_node.name
+        if statement_node.redefined:
             super().error(
                 ErrorType.NAME_ERROR,
                 f"Variable {var_name} defined more than once",
             )
 
-        var_type = statement_node.dict['var_type']
+        var_type = statement_node.var_type
         init_val = self.nil_object()
         if var_type == self.INT_NODE:
             init_val = self.int_object()
@@ -144,28 +321,26 @@ class Interpreter(InterpreterBase):
                 ErrorType.TYPE_ERROR,
                 f"Unknown/invalid type specified {var_type}"
             )
-        local_scope[var_name] = init_val
+        scopes[depth][slot] = init_val
         return
     
     def do_assignment(self, statement_node, scopes):
         if self.trace_output:
-            print("Running assignment: " + statement_node.dict['name'])
+            print("Running assignment: " + statement_node.name)
             print(scopes)
         ref_scope = None
-        var_segments = statement_node.dict['name'].split('.')
-        var_name = var_segments[0]
-        var_fields = var_segments[1:]
-        for scope in reversed(scopes):
-            if var_name in scope:
-                ref_scope = scope
-                break
+        var_fields = statement_node.fields
+        addr = statement_node.addr
+        if addr != None and scopes[addr[0]][addr[1]] is not None:
+            ref_scope, slot = scopes[addr[0]], addr[1]
         if ref_scope == None:
+            var_name = statement_node.name.split('.')[0]
             super().error(
                 ErrorType.NAME_ERROR,
                 f"Variable {var_name} has not been defined",
             )
 
-        expression = statement_node.dict['expression']
+        expression = statement_node.expression
         result = self.nil_object()
         if expression.elem_type in self.var_types:
             result = self.evaluate_value(expression, scopes)
@@ -178,19 +353,35 @@ class Interpreter(InterpreterBase):
         else:
             result = self.evaluate_expression(expression, scopes)
             
-        var_type = ref_scope[var_name].get_type()
+        if statement_node.checked:
+            # the value already has the target's type
+            if len(var_fields) == 0:
+                ref_scope[slot] = result
+                return
+            res_struct, offset = self.get_verified_struct_member(ref_scope[slot], var_fields, statement_node.offsets, statement_node.name)
+            res_struct.values[offset] = result
+            return
+
+        var_type = ref_scope[slot].get_type()
         assign_type = result.get_type()
 
-        self.check_struct_equivalence(ref_scope[var_name], result)
+        self.check_struct_equivalence(ref_scope[slot], result)
 
         if len(var_fields) > 0:
-            res_struct, field_name = self.get_struct_member(ref_scope[var_name], var_fields, statement_node.dict['name'])
+            offsets = statement_node.offsets
+            if offsets != None:
+                res_struct, offset = self.get_verified_struct_member(ref_scope[slot], var_fields, offsets, statement_node.name)
+                field_value = res_struct.values[offset]
+                result = self.assign_helper(field_value.get_type(), assign_type, field_value, result)
+                res_struct.values[offset] = result
+                return
+            res_struct, field_name = self.get_struct_member(ref_scope[slot], var_fields, statement_node.name)
             var_type = res_struct.get_field_type(field_name)
             result = self.assign_helper(var_type, assign_type, res_struct.get_field(field_name), result)
             res_struct.change_field(field_name, result)
             return 
-        result = self.assign_helper(var_type, assign_type, ref_scope[var_name], result)
-        ref_scope[var_name] = result
+        result = self.assign_helper(var_type, assign_type, ref_scope[slot], result)
+        ref_scope[slot] = result
         return
     
     def check_struct_equivalence(self, obj_1, obj_2):
@@ -220,43 +411,36 @@ class Interpreter(InterpreterBase):
     
     def do_call(self, statement_node, scopes):
         if self.trace_output:
-            print('Running call: ' + statement_node.dict['name'])
+            print('Running call: ' + statement_node.name)
             print(scopes)
-        fcall_name = statement_node.dict['name']
+        fcall_name = statement_node.name
 
         if fcall_name == 'print':
-            return self.fcall_print(statement_node.dict['args'], scopes)
+            return self.fcall_print(statement_node.args, scopes)
         elif fcall_name == 'inputi':
-            return self.fcall_inputi(scopes, statement_node.dict['args'])
+            return self.fcall_inputi(scopes, statement_node.args)
         elif fcall_name == 'inputs':
-            return self.fcall_inputs(scopes, statement_node.dict['args'])
+            return self.fcall_inputs(scopes, statement_node.args)
         
-        fcall_dict_key = fcall_name + '_' + str(len(statement_node.dict['args']))
-        if fcall_dict_key not in self.func_defs_to_node:
+        # inline cache of the resolved target, valid while func_defs_to_node is
+        # the table it was resolved against
+        call_cache = statement_node.call_cache
+        if call_cache == None or call_cache[0] is not self.func_defs_to_node:
+            call_cache = (self.func_defs_to_node, self.resolve_call_target(statement_node))
+            statement_node.call_cache = call_cache
+        target = call_cache[1]
+        if target == None:
             super().error(
                 ErrorType.NAME_ERROR,
                 f"Function {fcall_name} was not found",
             )
 
-        new_scope = dict()
-        default_return = self.void_object()
-        return_type = self.func_defs_to_node[fcall_dict_key].dict['return_type']
-        if return_type == self.INT_NODE:
-            default_return = self.int_object()
-        elif return_type == self.BOOL_NODE:
-            default_return = self.false_object()
-        elif return_type == self.STRING_NODE:
-            default_return = self.string_object()
-        elif return_type in self.struct_types:
-            default_return = self.nil_object()
-        new_scope['ret'] = default_return
-
-        fcall_arg_param_list = self.func_defs_to_node[fcall_dict_key].dict['args']
-        fcall_arg_list = statement_node.dict['args']
+        new_scope = list(target.frame_template)
+        checked = statement_node.checked
+        fcall_arg_list = statement_node.args
         for i in range(len(fcall_arg_list)):
             cur_arg_node = fcall_arg_list[i]
-            cur_param_name = fcall_arg_param_list[i].dict['name']
-            cur_param_type = fcall_arg_param_list[i].dict['var_type']
+            param_slot, cur_param_name, cur_param_type, coerces_int, accepts_nil = target.params[i]
             arg = None
             if cur_arg_node.elem_type == self.VAR_NODE:
                 arg = self.evaluate_variable_node(cur_arg_node, scopes)
@@ -267,44 +451,101 @@ class Interpreter(InterpreterBase):
             else:
                 arg = self.evaluate_expression(cur_arg_node, scopes)
 
-            if cur_param_type != arg.get_type():
-                if cur_param_type == self.BOOL_NODE and arg.get_type() == self.INT_NODE:
+            if not checked and cur_param_type != arg.get_type():
+                if coerces_int and arg.get_type() == self.INT_NODE:
                     arg = arg.coerce_i_to_b()
-                elif cur_param_type in self.struct_types and arg.get_type() == self.NIL_NODE and (arg.struct_type == self.NIL_NODE or arg.struct_type == cur_param_type):
+                elif accepts_nil and arg.get_type() == self.NIL_NODE and (arg.struct_type == self.NIL_NODE or arg.struct_type == cur_param_type):
                     arg = arg
                 else:
                     super().error(
                         ErrorType.TYPE_ERROR,
                         f"Type mismatch on formal parameter {cur_param_name}"
                     )
-            new_scope[cur_param_name] = arg
-        func_context = [new_scope, dict()]
-        self.run_func(self.func_defs_to_node[fcall_dict_key], func_context)
+            new_scope[param_slot] = arg
+        return self.invoke(target, new_scope, checked)
 
-        func_return = func_context[0]['ret']
-        if func_return.get_type() != return_type:
+    # runs target on its filled parameter frame; checked skips the return check
+    def invoke(self, target, new_scope, checked):
+        return_type = target.return_type
+        memo = target.memo
+        if memo is not None:
+            memo_key = tuple([new_scope[slot].value for slot in target.memo_slots])
+            func_return = memo.lookup(memo_key)
+            if func_return is not None:
+                return func_return
+
+        jit_entry = target.jit_entry
+        if jit_entry is not None and jit_entry.function is None:
+            jit_entry.calls += 1
+            if jit_entry.calls == self.JIT_THRESHOLD:
+                self.jit_compiler.compile(jit_entry)
+        if jit_entry is not None and jit_entry.function is not None:
+            func_return = Jit_Compiler.wrap(return_type, jit_entry.function(*[new_scope[slot].value for slot in target.param_slots]))
+        else:
+            func_context = [new_scope, [None] * target.frame_size]
+            self.run_func(target.func_node, func_context)
+            func_return = func_context[0][RET_SLOT]
+
+        if not checked and func_return.get_type() != return_type:
             if func_return.get_type() == self.INT_NODE and return_type == self.BOOL_NODE:
                 func_return = func_return.coerce_i_to_b()
-            elif func_return.get_type() == self.NIL_NODE and return_type in self.struct_types and (func_return.struct_type == return_type or func_return.struct_type == self.NIL_NODE):
+            elif func_return.get_type() == self.NIL_NODE and target.returns_struct and (func_return.struct_type == return_type or func_return.struct_type == self.NIL_NODE):
                 func_return = self.nil_object(return_type)
             else:
                 super().error(
                     ErrorType.TYPE_ERROR,
                     f"Returned value's type {func_return.get_type()} is inconsistent with function's return type {return_type}"
                 )
+        if memo is not None:
+            memo.store(memo_key, func_return)
         return func_return
     
+    # AST nodes the optimizer removed in the last run
+    def get_nodes_removed(self):
+        return self.nodes_removed
+
+    # expressions moved out of loops in the last run
+    def get_hoisted_count(self):
+        return self.hoisted_count
+
+    # (hits, misses) of the program cache over every run so far
+    def get_cache_stats(self):
+        if self.program_cache == None:
+            return (0, 0)
+        return (self.program_cache.hits, self.program_cache.misses)
+
+    # keys of the functions the last run compiled
+    def get_jit_functions(self):
+        if self.jit_compiler == None:
+            return []
+        return self.jit_compiler.compiled_functions()
+
+    # {function key: (hits, misses)} for every memoized function of the last run
+    def get_memo_stats(self):
+        return {func_key: (memo.hits, memo.misses) for func_key, memo in self.memo_caches.items()}
+
+    def resolve_call_target(self, call_node):
+        return self.resolve_call_target_key(call_node.name + '_' + str(len(call_node.args)))
+
+    def resolve_call_target_key(self, fcall_dict_key):
+        if fcall_dict_key not in self.func_defs_to_node:
+            return None
+        return Call_Target(self, fcall_dict_key, self.func_defs_to_node[fcall_dict_key])
+
     def do_if(self, if_node, scopes):
         if self.trace_output:
             print("Running if node")
             print(scopes)
-        condition_node = if_node.dict['condition']
+        condition_node = if_node.condition
         condition_result = self.evaluate_conditional(condition_node, scopes)
-        new_scopes = scopes + [dict()]
+        # a block pushes its frame onto the function's frame list and pops it on exit
         if condition_result.get_value(): 
-            ret = self.run_body(if_node.dict['statements'], new_scopes)
+            scopes.append([None] * if_node.frame_size)
+            ret = self.run_body(if_node.statements, scopes)
         else:
-            ret = self.run_body(if_node.dict['else_statements'], new_scopes)
+            scopes.append([None] * if_node.else_frame_size)
+            ret = self.run_body(if_node.else_statements, scopes)
+        scopes.pop()
 
         if ret:
             return True
@@ -314,36 +555,108 @@ class Interpreter(InterpreterBase):
         if self.trace_output:
             print("Running for_loop")
             print(scopes)
-        self.do_assignment(for_node.dict['init'], scopes)
-        condition_node = for_node.dict['condition']
+        self.do_assignment(for_node.init, scopes)
+        condition_node = for_node.condition
         condition_eval = self.evaluate_conditional(condition_node, scopes)
+        if for_node.counted != None and not self.trace_output:
+            return self.do_counted_for(for_node, scopes)
         while condition_eval.get_value():
-            new_scope = scopes + [dict()]
-            ret = self.run_body(for_node.dict['statements'], new_scope)
+            scopes.append([None] * for_node.frame_size)
+            ret = self.run_body(for_node.statements, scopes)
+            scopes.pop()
             if ret:
                 return True
-            self.do_assignment(for_node.dict['update'], scopes)
+            self.do_assignment(for_node.update, scopes)
             condition_eval = self.evaluate_conditional(condition_node, scopes)
         return False
     
+    # for (i = a; i < n; i = i + k) with i and n untouched by the body: counts
+    # over Python ints and reuses one body frame, cleared on every iteration.
+    # The first test has already run through evaluate_conditional, so an
+    # undefined counter or limit was reported there.
+    def do_counted_for(self, for_node, scopes):
+        (depth, slot), limit_addr, limit, step, inclusive = for_node.counted
+        if limit_addr != None:
+            limit = scopes[limit_addr[0]][limit_addr[1]].value
+        if inclusive:
+            limit += 1
+        counter_scope = scopes[depth]
+        counter = counter_scope[slot].value
+        statements = for_node.statements
+        empty_frame = [None] * for_node.frame_size
+        body_frame = list(empty_frame)
+        scopes.append(body_frame)
+        ret = False
+        while counter < limit:
+            if self.run_body(statements, scopes):
+                ret = True
+                break
+            counter += step
+            counter_scope[slot] = make_int(counter)
+            body_frame[:] = empty_frame
+        scopes.pop()
+        return ret
+
+    # Entering a try only pushes its frame. A raise unwinds as a Python
+    # exception to the nearest try whose handler table has its type; the
+    # handler cuts the frame list back to the try's depth, since the blocks
+    # it unwound through did not pop their frames.
+    def do_try(self, try_node, scopes):
+        if self.trace_output:
+            print("Running try")
+            print(scopes)
+        scopes.append([None] * try_node.frame_size)
+        try:
+            ret = self.run_body(try_node.statements, scopes)
+        except Exception_Object as exception:
+            catch_node = try_node.handlers.get(exception.exception_type)
+            if catch_node == None:
+                raise
+        else:
+            scopes.pop()
+            return ret
+        # the catch block runs outside the except clause, so a raise in it
+        # goes to the enclosing try
+        del scopes[try_node.depth:]
+        scopes.append([None] * catch_node.frame_size)
+        ret = self.run_body(catch_node.statements, scopes)
+        scopes.pop()
+        return ret
+
+    def do_raise(self, raise_node, scopes):
+        if self.trace_output:
+            print("Running raise")
+            print(scopes)
+        expression = raise_node.exception_type
+        if expression.elem_type == self.NEW_NODE:
+            exception_type = self.evaluate_expression(expression, scopes)
+        else:
+            exception_type = self.evaluate_operand(expression, scopes)
+        if exception_type.get_type() != self.STRING_NODE:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Incompatible type for raise operation"
+            )
+        raise Exception_Object(exception_type.get_value(), raise_node.lineno)
+
     def do_return(self, return_node, scopes):
         if self.trace_output:
             print("Running return")
             print(scopes)
         ret_val = None
-        if return_node.dict['expression'] == None:
+        if return_node.expression == None:
             return True
         
-        ret_eval_type = return_node.dict['expression'].elem_type
+        ret_eval_type = return_node.expression.elem_type
         if ret_eval_type == self.VAR_NODE:
-            ret_val = self.evaluate_variable_node(return_node.dict['expression'], scopes)
+            ret_val = self.evaluate_variable_node(return_node.expression, scopes)
         elif ret_eval_type in self.var_types:
-            ret_val = self.evaluate_value(return_node.dict['expression'], scopes)
+            ret_val = self.evaluate_value(return_node.expression, scopes)
         elif ret_eval_type in self.bool_ops or ret_eval_type in self.arithmetic_ops or ret_eval_type in self.comparison_ops:
-            ret_val = self.evaluate_expression(return_node.dict['expression'], scopes)
+            ret_val = self.evaluate_expression(return_node.expression, scopes)
         elif ret_eval_type == self.FCALL_NODE:
-            ret_val = self.do_call(return_node.dict['expression'], scopes)
-        scopes[0]['ret'] = ret_val
+            ret_val = self.do_call(return_node.expression, scopes)
+        scopes[0][RET_SLOT] = ret_val
         return True
 
     #####################################################################
@@ -356,7 +669,7 @@ class Interpreter(InterpreterBase):
             print(scopes)
         elem_type = expression_node.elem_type
         if elem_type == self.NEW_NODE:
-            struct_name = expression_node.dict['var_type']
+            struct_name = expression_node.var_type
             if struct_name not in self.struct_types:
                 super().error(
                     ErrorType.TYPE_ERROR,
@@ -364,7 +677,17 @@ class Interpreter(InterpreterBase):
                 )
             return self.init_new_struct(struct_name)
 
-        elem_1 = expression_node.dict['op1']
+        if self.short_circuit and (elem_type == '&&' or elem_type == '||'):
+            return self.evaluate_short_circuit(expression_node, scopes)
+
+        if expression_node.checked:
+            operator = CHECKED_OPERATORS[elem_type]
+            operand_1 = self.evaluate_operand(expression_node.op1, scopes)
+            if elem_type == self.NEG_NODE or elem_type == self.NOT_NODE:
+                return operator(operand_1)
+            return operator(operand_1, self.evaluate_operand(expression_node.op2, scopes))
+
+        elem_1 = expression_node.op1
         operand_1 = self.evaluate_operand(elem_1, scopes)
         op1_type = operand_1.get_type()
 
@@ -385,7 +708,7 @@ class Interpreter(InterpreterBase):
                 operand_1 = operand_1.coerce_i_to_b()
             return operand_1.logical_not()
         
-        elem_2 = expression_node.dict['op2']
+        elem_2 = expression_node.op2
         operand_2 = self.evaluate_operand(elem_2, scopes)
         op2_type = operand_2.get_type()
 
@@ -479,8 +802,38 @@ class Interpreter(InterpreterBase):
                 )
             return operand_1.logical_and(operand_2)
 
+    # the same checks as the eager operator, in the same order, but for each
+    # operand only once it has been evaluated
+    def evaluate_short_circuit(self, expression_node, scopes):
+        elem_type = expression_node.elem_type
+        checked = expression_node.checked
+        operand_1 = self.evaluate_operand(expression_node.op1, scopes)
+        if not checked:
+            self.check_logical_operand(operand_1, elem_type)
+        result = operand_1.short_circuit(elem_type)
+        if result is not None:
+            return result
+        operand_2 = self.evaluate_operand(expression_node.op2, scopes)
+        if not checked:
+            self.check_logical_operand(operand_2, elem_type)
+        # the left operand did not decide, so the result is the right one as a bool
+        return operand_2.coerce_i_to_b()
+
+    def check_logical_operand(self, operand, elem_type):
+        op_type = operand.get_type()
+        if op_type == self.VOID_DEF:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Can't compare void type"
+            )
+        if op_type != self.BOOL_NODE and op_type != self.INT_NODE:
+            super().error(
+                ErrorType.TYPE_ERROR,
+                f"Invalid types used with operator {elem_type}"
+            )
+
     def init_new_struct(self, struct_type):
-        return Struct_Object(struct_type, struct_type, self.struct_types[struct_type])
+        return self.struct_layouts[struct_type].new_instance()
 
     #####################################################################
     # variable node evaluation 
@@ -488,17 +841,22 @@ class Interpreter(InterpreterBase):
     
     def evaluate_variable_node(self, var_node, scopes):
         if self.trace_output:
-            print("Running retrieval: " + var_node.dict['name'])
+            print("Running retrieval: " + var_node.name)
             print(scopes)
-        var_segments = var_node.dict['name'].split('.')
-        var_name = var_segments[0]
-        var_fields = var_segments[1:]
-        for scope in reversed(scopes):
-            if var_name in scope:
+        var_fields = var_node.fields
+        addr = var_node.addr
+        if addr != None:
+            value = scopes[addr[0]][addr[1]]
+            if value is not None:
                 if len(var_fields) == 0:
-                    return scope[var_name]
-                res_struct, field_name = self.get_struct_member(scope[var_name], var_fields, var_node.dict['name'])
+                    return value
+                offsets = var_node.offsets
+                if offsets != None:
+                    res_struct, offset = self.get_verified_struct_member(value, var_fields, offsets, var_node.name)
+                    return res_struct.values[offset]
+                res_struct, field_name = self.get_struct_member(value, var_fields, var_node.name)
                 return res_struct.get_field(field_name)
+        var_name = var_node.name.split('.')[0]
         super().error(
             ErrorType.NAME_ERROR,
             f"Variable {var_name} has not been defined",
@@ -513,13 +871,16 @@ class Interpreter(InterpreterBase):
             print("Running constant_type: " + val_node.elem_type)
             print(scopes)
         if val_node.elem_type == self.BOOL_NODE:
-            if val_node.dict['val'] == self.TRUE_DEF:
+            if val_node.val == self.TRUE_DEF:
                 return self.true_object()
-            elif val_node.dict['val'] == self.FALSE_DEF:
+            elif val_node.val == self.FALSE_DEF:
                 return self.false_object()
+            return make_bool(val_node.val)
         elif val_node.elem_type == self.NIL_NODE:
             return self.nil_object()
-        return Data_Object(val_node.elem_type, val_node.dict['val'])
+        elif val_node.elem_type == self.INT_NODE:
+            return make_int(val_node.val)
+        return Data_Object(val_node.elem_type, val_node.val)
 
     #####################################################################
     # operand node evaluation 
@@ -591,7 +952,7 @@ class Interpreter(InterpreterBase):
                 res = self.evaluate_expression(arg, scopes)
                 res = self.fcall_print_bool_helper(res)
             elif arg.elem_type == self.BOOL_NODE:
-                res = self.fcall_print_bool_helper(Data_Object(self.BOOL_NODE, arg.dict['val']))
+                res = self.fcall_print_bool_helper(Data_Object(self.BOOL_NODE, arg.val))
             elif arg.elem_type == self.FCALL_NODE:
                 res = self.do_call(arg, scopes)
                 if res.get_type() == self.BOOL_NODE:
@@ -627,7 +988,7 @@ class Interpreter(InterpreterBase):
             )
         elif len(prompt) > 0:
             super().output(self.evaluate_value(prompt[0], scopes).get_value())
-        return Data_Object(self.INT_NODE, int(super().get_input()))
+        return make_int(int(super().get_input()))
 
     def fcall_inputs(self, scopes, prompt = None):
         if self.trace_output:
@@ -681,7 +1042,7 @@ class Interpreter(InterpreterBase):
     #  Constant Data Nodes
     #####################################################################
     def nil_object(self, struct_type = 'nil'):
-        return Struct_Object(self.NIL_NODE, struct_type, [])
+        return Struct_Object(self.NIL_NODE, struct_type)
     
     def void_object(self):
         return Data_Object.void_object(self.VOID_DEF)
@@ -715,6 +1076,18 @@ class Interpreter(InterpreterBase):
         n_var_fields = var_fields[1:]
         return self.get_struct_member(n_ref_struct, n_var_fields, full_name)
     
+    # for a path the resolver already checked against the struct layouts; only a
+    # nil dereference can fail along it. Returns the owning struct and the offset
+    # of the last field in its values
+    def get_verified_struct_member(self, ref_struct, var_fields, offsets, full_name):
+        last = len(offsets) - 1
+        for i, offset in enumerate(offsets):
+            if ref_struct.val_type == self.NIL_NODE:
+                self.verify_dot_operation(self.NIL_NODE, var_fields[i], full_name)
+            if i == last:
+                return ref_struct, offset
+            ref_struct = ref_struct.values[offset]
+
     def verify_dot_operation(self, var_type, var_name, full_name):
         if var_type == self.NIL_NODE:
             super().error(
@@ -0,0 +1,274 @@
+from intbase import InterpreterBase
+from data_object import Data_Object, make_int, make_bool, VOID
+from resolver import RET_SLOT
+from typechecker import CHECKED_OPERATORS
+
+
+class Untranslatable(Exception):
+    pass
+
+
+# Per-function tiering state: calls counted by the tree walker until the
+# function is hot, then the compiled Python function once there is one
+class Jit_Entry:
+    def __init__(self, func_key, func_node):
+        self.func_key = func_key
+        self.func_node = func_node
+        self.calls = 0
+        self.function = None
+        self.target = None
+
+
+# Translates hot functions of a loaded program into Python source, compiles
+# it and hands the tree walker the resulting function. Only functions whose
+# every statement and operand is statically typed int, bool or string are
+# translated, so the generated code runs on plain Python values and can't
+# fail any check the walker would make (only a division by zero, which the
+# walker raises as the same Python error). Anything else stays in the walker:
+#   structs, nil, new, try/raise, inputi/inputs, redefined variables,
+#   unchecked operators/assignments/calls, memoized functions
+#
+# A variable at (depth, slot) becomes the local v<depth>_<slot>; every block
+# defines its variables before using them, so sharing a local between sibling
+# blocks is safe. A user function is called through the global f_<key>, which
+# is the compiled function once there is one and a stub back into the walker
+# before that. Generated code is cached on its source, across runs.
+class Jit_Compiler:
+    CODE_CACHE = dict()
+    CODE_CACHE_SIZE = 256
+    JIT_TYPES = [ InterpreterBase.INT_NODE, InterpreterBase.BOOL_NODE, InterpreterBase.STRING_NODE ]
+    DEFAULTS = { InterpreterBase.INT_NODE: '0', InterpreterBase.BOOL_NODE: 'False', InterpreterBase.STRING_NODE: "''", InterpreterBase.VOID_DEF: 'None' }
+
+    def __init__(self, interpreter, dump=False):
+        self.interp = interpreter
+        self.dump = dump
+        self.entries = dict()
+        self.namespace = { '_output': interpreter.output }
+
+    def entry(self, func_key):
+        if func_key not in self.entries:
+            self.entries[func_key] = Jit_Entry(func_key, self.interp.func_defs_to_node[func_key])
+        return self.entries[func_key]
+
+    # keys of the functions compiled so far
+    def compiled_functions(self):
+        return [func_key for func_key, entry in self.entries.items() if entry.function is not None]
+
+    def compile(self, entry):
+        try:
+            source = self.translate_function(entry.func_key, entry.func_node)
+        except Untranslatable:
+            return
+        if self.dump:
+            print(source)
+        code = self.CODE_CACHE.get(source)
+        if code == None:
+            if len(self.CODE_CACHE) >= self.CODE_CACHE_SIZE:
+                self.CODE_CACHE.clear()
+            code = compile(source, f"<jit {entry.func_key}>", "exec")
+            self.CODE_CACHE[source] = code
+        exec(code, self.namespace)
+        entry.function = self.namespace['f_' + entry.func_key]
+
+    # converts the native result of a compiled function back to a value
+    @staticmethod
+    def wrap(return_type, result):
+        if return_type == InterpreterBase.INT_NODE:
+            return make_int(result)
+        if return_type == InterpreterBase.BOOL_NODE:
+            return make_bool(result)
+        if return_type == InterpreterBase.STRING_NODE:
+            return Data_Object(return_type, result)
+        return VOID
+
+    # the function generated code calls until func_key is compiled: runs the
+    # call in the walker (where it is counted) with the arguments as values
+    def stub(self, func_key):
+        interp = self.interp
+        entry = self.entry(func_key)
+
+        def call(*args):
+            if entry.target == None:
+                entry.target = interp.resolve_call_target_key(func_key)
+            target = entry.target
+            new_scope = list(target.frame_template)
+            for (slot, _, param_type, _, _), arg in zip(target.params, args):
+                new_scope[slot] = self.wrap(param_type, arg)
+            return interp.invoke(target, new_scope, True).value
+        return call
+
+    #####################################################################
+    # functions and statements
+    #####################################################################
+
+    def translate_function(self, func_key, func_node):
+        interp = self.interp
+        self.return_type = func_node.return_type
+        if func_key in interp.memo_caches or (self.return_type not in self.JIT_TYPES and self.return_type != interp.VOID_DEF):
+            raise Untranslatable()
+        params = []
+        for arg_node in func_node.args:
+            param = self.local((0, arg_node.slot))
+            if arg_node.var_type not in self.JIT_TYPES or param in params:
+                raise Untranslatable()
+            if arg_node.slot == RET_SLOT and arg_node.var_type != self.return_type:
+                raise Untranslatable()
+            params.append(param)
+        self.callees = set()
+        lines = [f"def f_{func_key}({', '.join(params)}):"]
+        # a parameter named ret takes the return value's slot
+        if self.local((0, RET_SLOT)) not in params:
+            lines.append(f"    {self.local((0, RET_SLOT))} = {self.DEFAULTS[self.return_type]}")
+        lines.extend(self.translate_block(func_node.statements, 1))
+        lines.append(f"    return {self.local((0, RET_SLOT))}")
+        for callee in self.callees:
+            if 'f_' + callee not in self.namespace:
+                self.namespace['f_' + callee] = self.stub(callee)
+        return "\n".join(lines) + "\n"
+
+    def local(self, addr):
+        return f"v{addr[0]}_{addr[1]}"
+
+    def translate_block(self, statements, indent):
+        lines = []
+        for statement in statements or []:
+            lines.extend(self.translate_statement(statement, indent))
+        return lines or ["    " * indent + "pass"]
+
+    def translate_statement(self, statement_node, indent):
+        interp = self.interp
+        pad = "    " * indent
+        elem_type = statement_node.elem_type
+        if elem_type == interp.VAR_DEF_NODE:
+            var_type = statement_node.var_type
+            if statement_node.redefined or var_type not in self.JIT_TYPES:
+                raise Untranslatable()
+            return [f"{pad}{self.local(statement_node.addr)} = {self.DEFAULTS[var_type]}"]
+        elif elem_type == '=':
+            return [pad + self.translate_assignment(statement_node)]
+        elif elem_type == interp.FCALL_NODE:
+            if statement_node.name == 'print':
+                return [pad + self.translate_print(statement_node)]
+            return [pad + self.translate_call(statement_node, statement=True)[0]]
+        elif elem_type == interp.IF_NODE:
+            lines = [f"{pad}if {self.translate_condition(statement_node.condition)}:"]
+            lines.extend(self.translate_block(statement_node.statements, indent + 1))
+            if statement_node.else_statements != None:
+                lines.append(f"{pad}else:")
+                lines.extend(self.translate_block(statement_node.else_statements, indent + 1))
+            return lines
+        elif elem_type == interp.FOR_NODE:
+            lines = [pad + self.translate_assignment(statement_node.init)]
+            lines.append(f"{pad}while {self.translate_condition(statement_node.condition)}:")
+            lines.extend(self.translate_block(statement_node.statements, indent + 1))
+            lines.append(pad + "    " + self.translate_assignment(statement_node.update))
+            return lines
+        elif elem_type == interp.RETURN_NODE:
+            expression = statement_node.expression
+            if expression == None:
+                return [f"{pad}return {self.local((0, RET_SLOT))}"]
+            code, code_type = self.translate_expression(expression)
+            if code_type != self.return_type:
+                raise Untranslatable()
+            return [f"{pad}return {code}"]
+        raise Untranslatable()
+
+    def translate_assignment(self, statement_node):
+        if not statement_node.checked or statement_node.addr == None or statement_node.fields:
+            raise Untranslatable()
+        code, _ = self.translate_expression(statement_node.expression)
+        return f"{self.local(statement_node.addr)} = {code}"
+
+    # int conditions are coerced to bool, anything else stays in the walker
+    def translate_condition(self, condition_node):
+        interp = self.interp
+        code, code_type = self.translate_expression(condition_node)
+        if code_type == interp.INT_NODE:
+            return f"({code} != 0)"
+        if code_type != interp.BOOL_NODE:
+            raise Untranslatable()
+        return code
+
+    # the arguments are formatted as fcall_print does for each operand kind
+    def translate_print(self, call_node):
+        interp = self.interp
+        parts = []
+        for arg in call_node.args:
+            code, code_type = self.translate_expression(arg)
+            if code_type == interp.BOOL_NODE:
+                parts.append(f"('true' if {code} else 'false')")
+            elif code_type == interp.INT_NODE:
+                parts.append(f"str({code})")
+            elif code_type == interp.STRING_NODE:
+                parts.append(code)
+            else:
+                raise Untranslatable()
+        return f"_output({' + '.join(parts) or repr('')})"
+
+    #####################################################################
+    # expressions, as (Python source, static type)
+    #####################################################################
+
+    def translate_call(self, call_node, statement=False):
+        interp = self.interp
+        func_key = call_node.name + '_' + str(len(call_node.args))
+        if func_key not in interp.func_defs_to_node or not call_node.checked:
+            raise Untranslatable()
+        return_type = interp.func_defs_to_node[func_key].return_type
+        if return_type not in self.JIT_TYPES and not statement:
+            raise Untranslatable()
+        args = [self.translate_expression(arg)[0] for arg in call_node.args]
+        self.callees.add(func_key)
+        return f"f_{func_key}({', '.join(args)})", return_type
+
+    def translate_expression(self, node):
+        interp = self.interp
+        elem_type = node.elem_type
+        if elem_type == interp.INT_NODE:
+            return repr(node.val), interp.INT_NODE
+        elif elem_type == interp.STRING_NODE:
+            return repr(node.val), interp.STRING_NODE
+        elif elem_type == interp.BOOL_NODE:
+            return repr(bool(node.val)), interp.BOOL_NODE
+        elif elem_type == interp.VAR_NODE:
+            static_type = node.static_type
+            if node.addr == None or node.fields or static_type not in self.JIT_TYPES:
+                raise Untranslatable()
+            return self.local(node.addr), static_type
+        elif elem_type == interp.FCALL_NODE:
+            if node.name in ('print', 'inputi', 'inputs'):
+                raise Untranslatable()
+            return self.translate_call(node)
+        if elem_type not in CHECKED_OPERATORS or not node.checked:
+            raise Untranslatable()
+
+        op1, op1_type = self.translate_expression(node.op1)
+        if elem_type == interp.NEG_NODE:
+            return f"(-{op1})", interp.INT_NODE
+        if elem_type == interp.NOT_NODE:
+            return f"(not {op1})", interp.BOOL_NODE
+        op2, op2_type = self.translate_expression(node.op2)
+        if elem_type == '+':
+            if op1_type == op2_type:
+                return f"({op1} + {op2})", op1_type
+            if op1_type == interp.INT_NODE:
+                op1 = f"str({op1})"
+            else:
+                op2 = f"str({op2})"
+            return f"({op1} + {op2})", interp.STRING_NODE
+        elif elem_type == '/':
+            return f"({op1} // {op2})", interp.INT_NODE
+        elif elem_type == '-' or elem_type == '*':
+            return f"({op1} {elem_type} {op2})", interp.INT_NODE
+        elif elem_type == '&&' or elem_type == '||':
+            if op1_type == interp.INT_NODE:
+                op1 = f"({op1} != 0)"
+            if op2_type == interp.INT_NODE:
+                op2 = f"({op2} != 0)"
+            # eager operators evaluate both sides, as the walker does
+            if interp.short_circuit:
+                operator = 'and' if elem_type == '&&' else 'or'
+            else:
+                operator = '&' if elem_type == '&&' else '|'
+            return f"({op1} {operator} {op2})", interp.BOOL_NODE
+        return f"({op1} {elem_type} {op2})", interp.BOOL_NODE
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+
+from intbase import InterpreterBase
+
+
+# Bounded least-recently-used cache of one function's results, keyed on the
+# argument values. Results are immutable Data_Objects, so a hit can hand back
+# the stored object itself.
+class Memo_Cache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return result
+
+    def store(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+# Finds the functions whose result depends only on their argument values:
+# no print/inputi/inputs, no struct field assignment, no new, and only calls to
+# other pure functions. Parameters and the return value must be int, bool or
+# string, so no struct can reach the function and its arguments are values.
+# Raising is allowed: an exception leaves before the result is stored.
+# Anything unrecognised makes a function impure.
+class Purity_Analysis:
+    VALUE_TYPES = [ InterpreterBase.INT_NODE, InterpreterBase.BOOL_NODE, InterpreterBase.STRING_NODE ]
+    STATEMENT_TYPES = [ InterpreterBase.VAR_DEF_NODE, '=', InterpreterBase.FCALL_NODE, InterpreterBase.IF_NODE, InterpreterBase.FOR_NODE, InterpreterBase.RETURN_NODE, InterpreterBase.TRY_NODE, InterpreterBase.RAISE_NODE ]
+
+    def __init__(self, interpreter):
+        self.interp = interpreter
+
+    # returns the func_defs_to_node keys of the pure functions
+    def pure_functions(self):
+        callees = dict()
+        for func_key, func_node in self.interp.func_defs_to_node.items():
+            if func_key == 'main_0' or not self.has_value_signature(func_node):
+                continue
+            self.callees = set()
+            if self.check_block(func_node.statements):
+                callees[func_key] = self.callees
+
+        # drop functions that call an impure one until nothing changes
+        pure = set(callees.keys())
+        changed = True
+        while changed:
+            changed = False
+            for func_key in list(pure):
+                if not callees[func_key] <= pure:
+                    pure.discard(func_key)
+                    changed = True
+        return pure
+
+    def has_value_signature(self, func_node):
+        if func_node.return_type not in self.VALUE_TYPES:
+            return False
+        return all(arg.var_type in self.VALUE_TYPES for arg in func_node.args)
+
+    def check_block(self, statements):
+        if statements == None:
+            return True
+        return all(self.check_statement(statement) for statement in statements)
+
+    def check_statement(self, statement_node):
+        interp = self.interp
+        elem_type = statement_node.elem_type
+        if elem_type not in self.STATEMENT_TYPES:
+            return False
+        if elem_type == interp.VAR_DEF_NODE:
+            return True
+        elif elem_type == '=':
+            return '.' not in statement_node.name and self.check_expression(statement_node.expression)
+        elif elem_type == interp.IF_NODE:
+            return self.check_expression(statement_node.condition) and self.check_block(statement_node.statements) and self.check_block(statement_node.else_statements)
+        elif elem_type == interp.FOR_NODE:
+            return self.check_statement(statement_node.init) and self.check_expression(statement_node.condition) and self.check_block(statement_node.statements) and self.check_statement(statement_node.update)
+        elif elem_type == interp.RETURN_NODE:
+            return statement_node.expression == None or self.check_expression(statement_node.expression)
+        elif elem_type == interp.TRY_NODE:
+            return self.check_block(statement_node.statements) and all(self.check_block(catch_node.statements) for catch_node in statement_node.catchers)
+        elif elem_type == interp.RAISE_NODE:
+            return self.check_expression(statement_node.exception_type)
+        return self.check_expression(statement_node)
+
+    def check_expression(self, expression_node):
+        interp = self.interp
+        elem_type = expression_node.elem_type
+        if elem_type == interp.NEW_NODE:
+            return False
+        if elem_type == interp.FCALL_NODE:
+            fcall_name = expression_node.name
+            if fcall_name == 'print' or fcall_name == 'inputi' or fcall_name == 'inputs':
+                return False
+            fcall_dict_key = fcall_name + '_' + str(len(expression_node.args))
+            if fcall_dict_key not in interp.func_defs_to_node:
+                return False
+            self.callees.add(fcall_dict_key)
+            return all(self.check_expression(arg) for arg in expression_node.args)
+        for key in ('op1', 'op2'):
+            if hasattr(expression_node, key) and not self.check_expression(getattr(expression_node, key)):
+                return False
+        return True
@@ -0,0 +1,386 @@
+from intbase import InterpreterBase
+from element import Element
+from resolver import RET_SLOT, assigned_addresses
+
+
+# AST optimization between parsing and resolution: folds operators whose
+# operands are int/string/bool literals and drops code that can never run.
+# Only folds an operator the runtime would evaluate without an error, so a
+# TYPE_ERROR or a division by zero is still raised where it was. Changed nodes
+# are copied, so the parsed tree itself is left as it was.
+#
+# Folding respects where the walker reads an expression differently from a
+# literal:
+#   conditions:      a string or nil literal is silently false, but a string
+#                    valued operator is a TYPE_ERROR, so a condition is never
+#                    folded to a string
+#   inputi/inputs:   the prompt is read as a value without being evaluated,
+#                    so nothing under it is touched
+#
+# Dead code:
+#   if (c) with a literal condition keeps only the branch taken (string, nil
+#   and new conditions are false without being evaluated); the branch is
+#   spliced into the enclosing block when it defines no variables of its own
+#   for (init; c; update) with a condition that is false on entry is its init
+#   statements after a return in the same block are dropped
+class AST_Optimizer:
+    FOLDABLE_TYPES = [ InterpreterBase.INT_NODE, InterpreterBase.STRING_NODE, InterpreterBase.BOOL_NODE ]
+    FALSE_CONDITIONS = [ InterpreterBase.STRING_NODE, InterpreterBase.NIL_NODE, InterpreterBase.NEW_NODE ]
+
+    def __init__(self):
+        self.nodes_removed = 0
+
+    def optimize_program(self, ast):
+        before = count_nodes(ast)
+        functions = [self.optimize_function(func_node) for func_node in ast.functions]
+        optimized = copy_node(ast, functions=functions)
+        self.nodes_removed = before - count_nodes(optimized)
+        return optimized
+
+    def optimize_function(self, func_node):
+        return copy_node(func_node, statements=self.optimize_block(func_node.statements))
+
+    #####################################################################
+    # statements
+    #####################################################################
+
+    def optimize_block(self, statements):
+        if statements == None:
+            return None
+        optimized = []
+        for statement in statements:
+            optimized.extend(self.optimize_statement(statement))
+            # also catches a return at the end of a spliced branch
+            if optimized and optimized[-1].elem_type == InterpreterBase.RETURN_NODE:
+                break
+        return optimized
+
+    # returns the statements that replace statement_node
+    def optimize_statement(self, statement_node):
+        elem_type = statement_node.elem_type
+        if elem_type == '=':
+            return [copy_node(statement_node, expression=self.fold(statement_node.expression))]
+        elif elem_type == InterpreterBase.FCALL_NODE:
+            return [self.fold(statement_node)]
+        elif elem_type == InterpreterBase.IF_NODE:
+            return self.optimize_if(statement_node)
+        elif elem_type == InterpreterBase.FOR_NODE:
+            return self.optimize_for(statement_node)
+        elif elem_type == InterpreterBase.RETURN_NODE:
+            if statement_node.expression == None:
+                return [statement_node]
+            return [copy_node(statement_node, expression=self.fold(statement_node.expression))]
+        elif elem_type == InterpreterBase.TRY_NODE:
+            catchers = [copy_node(catch_node, statements=self.optimize_block(catch_node.statements)) for catch_node in statement_node.catchers]
+            return [copy_node(statement_node, statements=self.optimize_block(statement_node.statements), catchers=catchers)]
+        elif elem_type == InterpreterBase.RAISE_NODE:
+            return [copy_node(statement_node, exception_type=self.fold(statement_node.exception_type))]
+        return [statement_node]
+
+    def optimize_if(self, if_node):
+        condition = self.fold_condition(if_node.condition)
+        statements = self.optimize_block(if_node.statements)
+        else_statements = self.optimize_block(if_node.else_statements)
+        taken = condition_value(condition)
+        if taken == None:
+            return [copy_node(if_node, condition=condition, statements=statements, else_statements=else_statements)]
+        branch = statements if taken else else_statements
+        if branch == None:
+            return []
+        if not any(statement.elem_type == InterpreterBase.VAR_DEF_NODE for statement in branch):
+            return branch
+        # the branch keeps its own scope
+        return [copy_node(if_node, condition=Element(InterpreterBase.BOOL_NODE, val=True), statements=branch, else_statements=None)]
+
+    def optimize_for(self, for_node):
+        init = self.optimize_statement(for_node.init)[0]
+        condition = self.fold_condition(for_node.condition)
+        if condition_value(condition) == False:
+            return [init]
+        update = self.optimize_statement(for_node.update)[0]
+        return [copy_node(for_node, init=init, condition=condition, update=update, statements=self.optimize_block(for_node.statements))]
+
+    #####################################################################
+    # expressions
+    #####################################################################
+
+    def fold_condition(self, condition_node):
+        folded = self.fold(condition_node)
+        if folded.elem_type == InterpreterBase.STRING_NODE and condition_node.elem_type != InterpreterBase.STRING_NODE:
+            return condition_node
+        return folded
+
+    # returns expression_node with every foldable operator below it folded
+    def fold(self, expression_node):
+        elem_type = expression_node.elem_type
+        if elem_type == InterpreterBase.FCALL_NODE:
+            if expression_node.name == 'inputi' or expression_node.name == 'inputs':
+                return expression_node
+            return copy_node(expression_node, args=[self.fold(arg) for arg in expression_node.args])
+        if not hasattr(expression_node, 'op1'):
+            return expression_node
+
+        op1 = self.fold(expression_node.op1)
+        if not hasattr(expression_node, 'op2'):
+            folded = fold_unary(elem_type, op1)
+            return folded if folded != None else copy_node(expression_node, op1=op1)
+        op2 = self.fold(expression_node.op2)
+        folded = fold_binary(elem_type, op1, op2)
+        return folded if folded != None else copy_node(expression_node, op1=op1, op2=op2)
+
+
+# Loop-invariant code motion, run on a resolved tree. An operator expression
+# inside a for loop (condition, update or body) is moved in front of the loop
+# into a fresh variable when it can neither fail nor change value while the
+# loop runs:
+#   operands:   literals, and variables declared int/bool/string outside the
+#               loop body that the loop never assigns (a called function can't
+#               reach them)
+#   operators:  only the cases the runtime evaluates without an error, so the
+#               moved expression can't raise earlier than it did; '/' only by
+#               a nonzero literal
+# Field reads, calls, new and input prompts are never moved: a nil
+# dereference or a raise would then happen before the loop instead of inside
+# it. The largest invariant expressions move, identical ones share a variable,
+# and the loop is then rewritten as it would be without them. The names start
+# with '@', which no program can use. The tree must be resolved again after.
+class Invariant_Hoister:
+    HOISTED_TYPES = [ InterpreterBase.INT_NODE, InterpreterBase.BOOL_NODE, InterpreterBase.STRING_NODE ]
+    HOISTED_PREFIX = '@licm'
+
+    def __init__(self):
+        self.hoisted = 0
+
+    def hoist_program(self, ast):
+        functions = [copy_node(func_node, statements=self.hoist_block(func_node.statements, 1)) for func_node in ast.functions]
+        return copy_node(ast, functions=functions)
+
+    # depth is the frame depth of the block, 1 for a function body
+    def hoist_block(self, statements, depth):
+        if statements == None:
+            return None
+        hoisted = []
+        for statement in statements:
+            hoisted.extend(self.hoist_statement(statement, depth))
+        return hoisted
+
+    def hoist_statement(self, statement_node, depth):
+        elem_type = statement_node.elem_type
+        if elem_type == InterpreterBase.IF_NODE:
+            return [copy_node(statement_node, statements=self.hoist_block(statement_node.statements, depth + 1),
+                              else_statements=self.hoist_block(statement_node.else_statements, depth + 1))]
+        elif elem_type == InterpreterBase.FOR_NODE:
+            return self.hoist_loop(statement_node, depth)
+        elif elem_type == InterpreterBase.TRY_NODE:
+            catchers = [copy_node(catch_node, statements=self.hoist_block(catch_node.statements, depth + 1)) for catch_node in statement_node.catchers]
+            return [copy_node(statement_node, statements=self.hoist_block(statement_node.statements, depth + 1), catchers=catchers)]
+        return [statement_node]
+
+    # returns the definitions of the hoisted variables followed by the loop;
+    # loops nested in the body are handled after the outer one
+    def hoist_loop(self, for_node, depth):
+        self.depth = depth
+        self.loop_position = for_node.position
+        self.assigned = assigned_addresses([for_node.init, for_node.update]) | assigned_addresses(for_node.statements)
+        self.invariants = dict()
+        self.definitions = []
+        condition = self.rewrite(for_node.condition)
+        update = self.rewrite_statement(for_node.update)
+        statements = self.rewrite_block(for_node.statements)
+        definitions = self.definitions
+        return definitions + [copy_node(for_node, condition=condition, update=update, statements=self.hoist_block(statements, depth + 1))]
+
+    #####################################################################
+    # rewriting a loop
+    #####################################################################
+
+    def rewrite_block(self, statements):
+        if statements == None:
+            return None
+        return [self.rewrite_statement(statement) for statement in statements]
+
+    def rewrite_statement(self, statement_node):
+        elem_type = statement_node.elem_type
+        if elem_type == '=':
+            return copy_node(statement_node, expression=self.rewrite(statement_node.expression))
+        elif elem_type == InterpreterBase.FCALL_NODE:
+            return self.rewrite(statement_node)
+        elif elem_type == InterpreterBase.IF_NODE:
+            return copy_node(statement_node, condition=self.rewrite(statement_node.condition),
+                             statements=self.rewrite_block(statement_node.statements),
+                             else_statements=self.rewrite_block(statement_node.else_statements))
+        elif elem_type == InterpreterBase.FOR_NODE:
+            return copy_node(statement_node, init=self.rewrite_statement(statement_node.init),
+                             condition=self.rewrite(statement_node.condition),
+                             update=self.rewrite_statement(statement_node.update),
+                             statements=self.rewrite_block(statement_node.statements))
+        elif elem_type == InterpreterBase.RETURN_NODE:
+            if statement_node.expression == None:
+                return statement_node
+            return copy_node(statement_node, expression=self.rewrite(statement_node.expression))
+        elif elem_type == InterpreterBase.TRY_NODE:
+            catchers = [copy_node(catch_node, statements=self.rewrite_block(catch_node.statements)) for catch_node in statement_node.catchers]
+            return copy_node(statement_node, statements=self.rewrite_block(statement_node.statements), catchers=catchers)
+        elif elem_type == InterpreterBase.RAISE_NODE:
+            return copy_node(statement_node, exception_type=self.rewrite(statement_node.exception_type))
+        return statement_node
+
+    # returns expression_node with its largest invariant operators replaced
+    # by the variables holding them
+    def rewrite(self, expression_node):
+        elem_type = expression_node.elem_type
+        if elem_type == InterpreterBase.FCALL_NODE:
+            if expression_node.name == 'inputi' or expression_node.name == 'inputs':
+                return expression_node
+            return copy_node(expression_node, args=[self.rewrite(arg) for arg in expression_node.args])
+        if not hasattr(expression_node, 'op1'):
+            return expression_node
+        static_type = self.invariant_type(expression_node)
+        if static_type != None:
+            return self.hoist(expression_node, static_type)
+        if not hasattr(expression_node, 'op2'):
+            return copy_node(expression_node, op1=self.rewrite(expression_node.op1))
+        return copy_node(expression_node, op1=self.rewrite(expression_node.op1), op2=self.rewrite(expression_node.op2))
+
+    def hoist(self, expression_node, static_type):
+        key = str(expression_node)
+        if key not in self.invariants:
+            name = self.HOISTED_PREFIX + str(self.hoisted)
+            self.hoisted += 1
+            self.invariants[key] = name
+            # the hoisted statements run where the loop starts
+            self.definitions.append(Element(InterpreterBase.VAR_DEF_NODE, name=name, var_type=static_type, position=self.loop_position))
+            self.definitions.append(Element('=', name=name, expression=expression_node, position=self.loop_position))
+        return Element(InterpreterBase.VAR_NODE, name=self.invariants[key], position=expression_node.position)
+
+    # the type an invariant expression always evaluates to without an error,
+    # or None when it isn't one
+    def invariant_type(self, expression_node):
+        elem_type = expression_node.elem_type
+        if elem_type in self.HOISTED_TYPES:
+            return elem_type
+        if elem_type == InterpreterBase.VAR_NODE:
+            addr = expression_node.addr
+            if addr == None or expression_node.fields or addr == (0, RET_SLOT):
+                return None
+            if addr[0] > self.depth or addr in self.assigned:
+                return None
+            static_type = expression_node.static_type
+            return static_type if static_type in self.HOISTED_TYPES else None
+        if not hasattr(expression_node, 'op1'):
+            return None
+        op1_type = self.invariant_type(expression_node.op1)
+        if op1_type == None:
+            return None
+        if not hasattr(expression_node, 'op2'):
+            if elem_type == InterpreterBase.NEG_NODE and op1_type == InterpreterBase.INT_NODE:
+                return InterpreterBase.INT_NODE
+            if elem_type == InterpreterBase.NOT_NODE and op1_type == InterpreterBase.BOOL_NODE:
+                return InterpreterBase.BOOL_NODE
+            return None
+        op2 = expression_node.op2
+        if self.invariant_type(op2) != op1_type:
+            return None
+        if elem_type == '+' and op1_type != InterpreterBase.BOOL_NODE:
+            return op1_type
+        if op1_type == InterpreterBase.INT_NODE:
+            if elem_type == '-' or elem_type == '*':
+                return InterpreterBase.INT_NODE
+            if elem_type == '/':
+                return InterpreterBase.INT_NODE if op2.elem_type == InterpreterBase.INT_NODE and op2.val != 0 else None
+            if elem_type in ['<', '>', '<=', '>=']:
+                return InterpreterBase.BOOL_NODE
+        if elem_type == '==' or elem_type == '!=':
+            return InterpreterBase.BOOL_NODE
+        if (elem_type == '&&' or elem_type == '||') and op1_type == InterpreterBase.BOOL_NODE:
+            return InterpreterBase.BOOL_NODE
+        return None
+
+
+#####################################################################
+# folding rules, each one a case the runtime evaluates without an error
+#####################################################################
+
+def literal(val):
+    if isinstance(val, bool):
+        return Element(InterpreterBase.BOOL_NODE, val=val)
+    if isinstance(val, int):
+        return Element(InterpreterBase.INT_NODE, val=val)
+    return Element(InterpreterBase.STRING_NODE, val=val)
+
+
+def truth(node):
+    return node.val != 0 if node.elem_type == InterpreterBase.INT_NODE else node.val
+
+
+def fold_unary(elem_type, op1):
+    op1_type = op1.elem_type
+    if elem_type == InterpreterBase.NEG_NODE and op1_type == InterpreterBase.INT_NODE:
+        return literal(-op1.val)
+    if elem_type == InterpreterBase.NOT_NODE and (op1_type == InterpreterBase.INT_NODE or op1_type == InterpreterBase.BOOL_NODE):
+        return literal(not truth(op1))
+    return None
+
+
+def fold_binary(elem_type, op1, op2):
+    INT_NODE, BOOL_NODE, STRING_NODE = InterpreterBase.INT_NODE, InterpreterBase.BOOL_NODE, InterpreterBase.STRING_NODE
+    op1_type, op2_type = op1.elem_type, op2.elem_type
+    if op1_type not in AST_Optimizer.FOLDABLE_TYPES or op2_type not in AST_Optimizer.FOLDABLE_TYPES:
+        return None
+    a, b = op1.val, op2.val
+    both_int = op1_type == INT_NODE and op2_type == INT_NODE
+    if elem_type == '+':
+        if both_int:
+            return literal(a + b)
+        if op1_type != BOOL_NODE and op2_type != BOOL_NODE:
+            return literal(str(a) + str(b))
+    elif both_int:
+        if elem_type == '-':
+            return literal(a - b)
+        elif elem_type == '*':
+            return literal(a * b)
+        elif elem_type == '/':
+            return literal(a // b) if b != 0 else None
+        elif elem_type == '<':
+            return literal(a < b)
+        elif elem_type == '>':
+            return literal(a > b)
+        elif elem_type == '<=':
+            return literal(a <= b)
+        elif elem_type == '>=':
+            return literal(a >= b)
+    if elem_type == '==' or elem_type == '!=':
+        if op1_type == op2_type:
+            equal = a == b
+        elif op1_type != STRING_NODE and op2_type != STRING_NODE:
+            equal = truth(op1) == truth(op2)
+        else:
+            return None
+        return literal(equal if elem_type == '==' else not equal)
+    if (elem_type == '&&' or elem_type == '||') and op1_type != STRING_NODE and op2_type != STRING_NODE:
+        return literal(truth(op1) and truth(op2) if elem_type == '&&' else truth(op1) or truth(op2))
+    return None
+
+
+# True/False for a condition decided without running anything, otherwise None
+def condition_value(condition_node):
+    elem_type = condition_node.elem_type
+    if elem_type == InterpreterBase.BOOL_NODE or elem_type == InterpreterBase.INT_NODE:
+        return bool(truth(condition_node))
+    if elem_type in AST_Optimizer.FALSE_CONDITIONS:
+        return False
+    return None
+
+
+def copy_node(node, **changes):
+    copy = Element(node.elem_type, position=node.position, **node.dict)
+    copy.dict.update(changes)
+    return copy
+
+
+def count_nodes(value):
+    if isinstance(value, Element):
+        return 1 + sum(count_nodes(child) for child in value.dict.values())
+    if isinstance(value, list):
+        return sum(count_nodes(child) for child in value)
+    return 0
@@ -0,0 +1,356 @@
+from array_lexer import TOKEN_IDS, EOF, tokenize
+from element import Element, POSITION_BITS
+from intbase import InterpreterBase
+
+# token type ids
+(VAR, FUNC, IF, ELSE, FOR, RETURN, TRUE, FALSE, NIL, STRUCT, NEW, TRY, CATCH, RAISE,
+ LPAREN, RPAREN, LBRACE, RBRACE, COMMA, COLON, SEMI, ASSIGN, MINUS, NUMBER, NAME, STRING, NOT, DOT) = (
+    TOKEN_IDS[token_type] for token_type in
+    ['VAR', 'FUNC', 'IF', 'ELSE', 'FOR', 'RETURN', 'TRUE', 'FALSE', 'NIL', 'STRUCT', 'NEW', 'TRY', 'CATCH', 'RAISE',
+     'LPAREN', 'RPAREN', 'LBRACE', 'RBRACE', 'COMMA', 'COLON', 'SEMI', 'ASSIGN', 'MINUS', 'NUMBER', 'NAME', 'STRING', 'NOT', 'DOT'])
+
+
+class Pratt_Syntax_Error(Exception):
+    pass
+
+
+# Recursive-descent parser for the Brewin grammar in brewparse.py, with Pratt
+# parsing for expressions. It reads the token arrays array_lexer produces
+# (the same tokens the PLY lexer produces) and builds the same Element trees
+# (keyword order included) as the LALR parser, taking operator binding powers
+# from the same precedence table: an operator after an operand is taken into
+# it exactly when the LALR parser would shift it rather than reduce.
+#
+# Every decision needs only the current token, and a token is rejected as soon
+# as no program can continue with it, which is where the LALR parser detects
+# errors too, so error_func is called with the same token. PLY's recovery
+# (the grammar has no error rules) is followed as well:
+#   the offending token is dropped, and tokens are skipped up to the next
+#   'struct' or 'func' (end of input gives None)
+#   parsing starts over there as a new program, and a program that completes
+#   is the result
+#   error_func is only called again once three tokens have been consumed since
+#   the last error
+class Pratt_Parser:
+    BINARY_OPERATORS = [ 'OR', 'AND', 'EQ', 'NOT_EQ', 'GREATER', 'GREATER_EQ', 'LESS', 'LESS_EQ', 'PLUS', 'MINUS', 'MULTIPLY', 'DIVIDE' ]
+    EXPRESSION_START = [ NOT, MINUS, NEW, LPAREN, NUMBER, TRUE, FALSE, NIL, STRING, NAME ]
+    # consumed tokens before error_func is called again (PLY's error_count)
+    ERROR_COUNT = 3
+
+    def __init__(self, precedence, error_func):
+        self.error_func = error_func
+        # token type -> (level, right associative); a higher level binds tighter
+        levels = dict()
+        for level, (associativity, *token_types) in enumerate(precedence, 1):
+            for token_type in token_types:
+                levels[token_type] = (level, associativity == 'right')
+        self.binary_levels = {TOKEN_IDS[token_type]: levels[token_type] for token_type in self.BINARY_OPERATORS}
+        self.not_level = levels['NOT'][0]
+        self.uminus_level = levels['UMINUS'][0]
+
+    # parses program, returning the tree (None if nothing could be recovered)
+    # and the line the lexer ended on
+    def parse(self, program):
+        stream = self.load(program)
+        try:
+            while True:
+                try:
+                    return self.parse_program(), stream.lineno
+                except Pratt_Syntax_Error:
+                    pass
+                # drop the offending token and look for the next program start
+                types = self.types
+                index = self.index
+                while types[index] != EOF:
+                    index += 1
+                    if types[index] == STRUCT or types[index] == FUNC:
+                        break
+                if types[index] == EOF:
+                    return None, stream.lineno
+                self.index = index
+        finally:
+            self.unload()
+
+    # parses program as a single struct or func definition, for the
+    # incremental parser: returns its node, or None if program is anything
+    # else. There is no recovery; error_func is called for the first error
+    def parse_definition(self, program):
+        self.load(program)
+        try:
+            if self.types[0] == STRUCT:
+                definition = self.parse_struct()
+            else:
+                definition = self.parse_func()
+            if self.types[self.index] != EOF:
+                self.error()
+            return definition
+        except Pratt_Syntax_Error:
+            return None
+        finally:
+            self.unload()
+
+    def load(self, program):
+        stream = tokenize(program)
+        self.stream = stream
+        self.types = stream.types
+        self.values = stream.values
+        self.lines = stream.lines
+        self.positions = stream.positions
+        self.index = 0
+        self.error_count = 0
+        return stream
+
+    def unload(self):
+        self.stream, self.types, self.values = None, None, None
+        self.lines, self.positions = None, None
+
+    #####################################################################
+    # tokens
+    #####################################################################
+
+    def error(self):
+        if self.error_count == 0:
+            self.error_func(self.stream.token(self.index))
+        self.error_count = self.ERROR_COUNT
+        raise Pratt_Syntax_Error()
+
+    # consumes the current token and returns its value
+    def advance(self):
+        if self.error_count:
+            self.error_count -= 1
+        self.index += 1
+        return self.values[self.index - 1]
+
+    # the source position of the token at index, packed as pack_position does
+    def position(self, index):
+        return self.lines[index] << POSITION_BITS | self.positions[index]
+
+    # consumes a token of token_type and returns its value
+    def expect(self, token_type):
+        if self.types[self.index] != token_type:
+            self.error()
+        return self.advance()
+
+    #####################################################################
+    # program, structs and functions
+    #####################################################################
+
+    def parse_program(self):
+        structs = []
+        while self.types[self.index] == STRUCT:
+            structs.append(self.parse_struct())
+        functions = [self.parse_func()]
+        while self.types[self.index] == FUNC:
+            functions.append(self.parse_func())
+        if self.types[self.index] != EOF:
+            self.error()
+        first = structs[0] if structs else functions[0]
+        return Element(InterpreterBase.PROGRAM_NODE, structs=structs, functions=functions, position=first.position)
+
+    def parse_struct(self):
+        position = self.position(self.index)
+        self.advance()
+        name = self.expect(NAME)
+        self.expect(LBRACE)
+        fields = [self.parse_field()]
+        while self.types[self.index] != RBRACE:
+            fields.append(self.parse_field())
+        self.advance()
+        return Element(InterpreterBase.STRUCT_NODE, name=name, fields=fields, position=position)
+
+    def parse_field(self):
+        position = self.position(self.index)
+        name = self.expect(NAME)
+        self.expect(COLON)
+        var_type = self.expect(NAME)
+        self.expect(SEMI)
+        return Element(InterpreterBase.FIELD_DEF_NODE, name=name, var_type=var_type, position=position)
+
+    def parse_func(self):
+        position = self.position(self.index)
+        self.expect(FUNC)
+        name = self.expect(NAME)
+        self.expect(LPAREN)
+        args = []
+        if self.types[self.index] != RPAREN:
+            args.append(self.parse_formal_arg())
+            while self.types[self.index] == COMMA:
+                self.advance()
+                args.append(self.parse_formal_arg())
+        self.expect(RPAREN)
+        return_type = None
+        if self.types[self.index] == COLON:
+            self.advance()
+            return_type = self.expect(NAME)
+        statements = self.parse_block()
+        return Element(InterpreterBase.FUNC_NODE, name=name, args=args, return_type=return_type, statements=statements, position=position)
+
+    def parse_formal_arg(self):
+        position = self.position(self.index)
+        name = self.expect(NAME)
+        var_type = None
+        if self.types[self.index] == COLON:
+            self.advance()
+            var_type = self.expect(NAME)
+        return Element(InterpreterBase.ARG_NODE, name=name, var_type=var_type, position=position)
+
+    #####################################################################
+    # statements
+    #####################################################################
+
+    # LBRACE statements RBRACE, with at least one statement
+    def parse_block(self):
+        self.expect(LBRACE)
+        statements = [self.parse_statement()]
+        while self.types[self.index] != RBRACE:
+            statements.append(self.parse_statement())
+        self.advance()
+        return statements
+
+    def parse_statement(self):
+        token_type = self.types[self.index]
+        position = self.position(self.index)
+        if token_type == NAME:
+            # an assignment, or an expression starting with a call or a variable
+            name = self.advance()
+            if self.types[self.index] == LPAREN:
+                statement = self.parse_expression(0, self.parse_call(name, position))
+            else:
+                name = self.parse_dotted_name(name)
+                if self.types[self.index] == ASSIGN:
+                    statement = self.parse_assign(name, position)
+                else:
+                    statement = self.parse_expression(0, Element(InterpreterBase.VAR_NODE, name=name, position=position))
+            self.expect(SEMI)
+            return statement
+        elif token_type == VAR:
+            self.advance()
+            name = self.expect(NAME)
+            var_type = None
+            if self.types[self.index] == COLON:
+                self.advance()
+                var_type = self.expect(NAME)
+            self.expect(SEMI)
+            return Element(InterpreterBase.VAR_DEF_NODE, name=name, var_type=var_type, position=position)
+        elif token_type == IF:
+            self.advance()
+            self.expect(LPAREN)
+            condition = self.parse_expression(0)
+            self.expect(RPAREN)
+            statements = self.parse_block()
+            else_statements = None
+            if self.types[self.index] == ELSE:
+                self.advance()
+                else_statements = self.parse_block()
+            return Element(InterpreterBase.IF_NODE, condition=condition, statements=statements, else_statements=else_statements, position=position)
+        elif token_type == FOR:
+            self.advance()
+            self.expect(LPAREN)
+            init = self.parse_assign(self.expect(NAME), self.position(self.index - 1))
+            self.expect(SEMI)
+            condition = self.parse_expression(0)
+            self.expect(SEMI)
+            update = self.parse_assign(self.expect(NAME), self.position(self.index - 1))
+            self.expect(RPAREN)
+            statements = self.parse_block()
+            return Element(InterpreterBase.FOR_NODE, init=init, condition=condition, update=update, statements=statements, position=position)
+        elif token_type == RETURN:
+            self.advance()
+            expression = None
+            if self.types[self.index] != SEMI:
+                expression = self.parse_expression(0)
+            self.expect(SEMI)
+            return Element(InterpreterBase.RETURN_NODE, expression=expression, position=position)
+        elif token_type == TRY:
+            self.advance()
+            statements = self.parse_block()
+            catchers = [self.parse_catch()]
+            while self.types[self.index] == CATCH:
+                catchers.append(self.parse_catch())
+            return Element(InterpreterBase.TRY_NODE, statements=statements, catchers=catchers, position=position)
+        elif token_type == RAISE:
+            self.advance()
+            exception_type = self.parse_expression(0)
+            self.expect(SEMI)
+            return Element(InterpreterBase.RAISE_NODE, exception_type=exception_type, position=position)
+        statement = self.parse_expression(0)
+        self.expect(SEMI)
+        return statement
+
+    # variable_w_dot ASSIGN expression, with the first NAME (at position) consumed
+    def parse_assign(self, name, position):
+        name = self.parse_dotted_name(name)
+        self.expect(ASSIGN)
+        return Element("=", name=name, expression=self.parse_expression(0), position=position)
+
+    def parse_catch(self):
+        position = self.position(self.index)
+        self.expect(CATCH)
+        exception_type = self.expect(STRING)
+        statements = self.parse_block()
+        return Element(InterpreterBase.CATCH_NODE, exception_type=exception_type, statements=statements, position=position)
+
+    #####################################################################
+    # expressions
+    #####################################################################
+
+    # Parses an expression whose operators all bind tighter than level (or as
+    # tight, for a right associative level); left is an operand already parsed
+    def parse_expression(self, level, left=None):
+        if left is None:
+            left = self.parse_operand()
+        binary_levels = self.binary_levels
+        while self.types[self.index] in binary_levels:
+            operator_level, right_associative = binary_levels[self.types[self.index]]
+            if operator_level < level or (operator_level == level and not right_associative):
+                break
+            position = self.position(self.index)
+            operator = self.advance()
+            left = Element(operator, op1=left, op2=self.parse_expression(operator_level), position=position)
+        return left
+
+    def parse_operand(self):
+        token_type = self.types[self.index]
+        if token_type not in self.EXPRESSION_START:
+            self.error()
+        position = self.position(self.index)
+        value = self.advance()
+        if token_type == NAME:
+            if self.types[self.index] == LPAREN:
+                return self.parse_call(value, position)
+            return Element(InterpreterBase.VAR_NODE, name=self.parse_dotted_name(value), position=position)
+        elif token_type == NUMBER:
+            return Element(InterpreterBase.INT_NODE, val=value, position=position)
+        elif token_type == STRING:
+            return Element(InterpreterBase.STRING_NODE, val=value, position=position)
+        elif token_type == TRUE or token_type == FALSE:
+            return Element(InterpreterBase.BOOL_NODE, val=value == InterpreterBase.TRUE_DEF, position=position)
+        elif token_type == NIL:
+            return Element(InterpreterBase.NIL_NODE, position=position)
+        elif token_type == NOT:
+            return Element(InterpreterBase.NOT_NODE, op1=self.parse_expression(self.not_level), position=position)
+        elif token_type == MINUS:
+            return Element(InterpreterBase.NEG_NODE, op1=self.parse_expression(self.uminus_level), position=position)
+        elif token_type == NEW:
+            return Element(InterpreterBase.NEW_NODE, var_type=self.expect(NAME), position=position)
+        expression = self.parse_expression(0)
+        self.expect(RPAREN)
+        return expression
+
+    # NAME LPAREN [args] RPAREN, with the NAME (at position) consumed
+    def parse_call(self, name, position):
+        self.advance()
+        args = []
+        if self.types[self.index] != RPAREN:
+            args.append(self.parse_expression(0))
+            while self.types[self.index] == COMMA:
+                self.advance()
+                args.append(self.parse_expression(0))
+        self.expect(RPAREN)
+        return Element(InterpreterBase.FCALL_NODE, name=name, args=args, position=position)
+
+    def parse_dotted_name(self, name):
+        while self.types[self.index] == DOT:
+            self.advance()
+            name = name + "." + self.expect(NAME)
+        return name
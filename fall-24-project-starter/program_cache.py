@@ -0,0 +1,137 @@
+import hashlib
+import hmac
+import os
+import pickle
+import threading
+import zlib
+
+import parsetab
+
+
+# On-disk cache of analyzed programs, one file per program. An entry holds the
+# tree as it is after parsing, optimization, resolution and type checking, so
+# a hit skips all of them, yacc.parse included. Entries are keyed on a hash of
+# the source, the options that change the tree and FORMAT_VERSION (bump it
+# when an analysis pass changes what it writes on the nodes), and each file
+# records the grammar signature it was parsed with; a file from another
+# grammar, or one that can't be read back, is a miss.
+#
+# Files are zlib-compressed pickles, written to a temporary name and renamed
+# into place, so concurrent runs never see half-written entries.
+#
+# Loading an entry unpickles it, which can run arbitrary code, so the
+# directory must be trusted: only the user running the interpreter may be
+# able to write to it. The cache creates it with mode 0o700, ignores files
+# owned by anyone else, and signs every file with an HMAC-SHA256 of its
+# compressed bytes under secret. Unless one is passed in, secret is the key
+# in the KEY_NAME file of the directory, created with random bytes on first
+# use and readable by its owner only; runs that share the directory share
+# it. A file whose HMAC doesn't match is a miss and is never unpickled. If no
+# key can be read or created, nothing is cached.
+class Program_Cache:
+    FORMAT_VERSION = 4
+    SUFFIX = '.ast'
+    KEY_NAME = 'secret.key'
+    KEY_BYTES = 32
+
+    def __init__(self, directory, secret=None):
+        self.directory = directory
+        if secret == None:
+            secret = load_secret(os.path.join(directory, self.KEY_NAME), self.KEY_BYTES)
+        self.secret = secret
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, program, *options):
+        digest = hashlib.sha256()
+        for part in (str(self.FORMAT_VERSION), parsetab._lr_signature, repr(options), program):
+            digest.update(part.encode())
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def sign(self, data):
+        return hmac.new(self.secret, data, hashlib.sha256).digest()
+
+    def load(self, key):
+        if self.secret == None:
+            self.misses += 1
+            return None
+        try:
+            with open(self.path(key), 'rb') as cache_file:
+                owner = os.fstat(cache_file.fileno()).st_uid
+                data = cache_file.read()
+            mac_size = hashlib.sha256().digest_size
+            mac, data = data[:mac_size], data[mac_size:]
+            signature, entry = None, None
+            # a file another user owns, or one we didn't sign, is never unpickled
+            if owner == os.getuid() and hmac.compare_digest(mac, self.sign(data)):
+                signature, entry = pickle.loads(zlib.decompress(data))
+        except Exception:
+            # missing, damaged, untrusted or written by an incompatible version
+            signature, entry = None, None
+        if signature != parsetab._lr_signature:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    # an entry that can't be pickled (a tree nested deeper than the recursion
+    # limit) or written is simply not cached
+    def store(self, key, entry):
+        if self.secret == None:
+            return
+        temp_path = temporary_path(self.path(key))
+        try:
+            data = zlib.compress(pickle.dumps((parsetab._lr_signature, entry), pickle.HIGHEST_PROTOCOL))
+            with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as cache_file:
+                cache_file.write(self.sign(data) + data)
+            os.replace(temp_path, self.path(key))
+        except (OSError, RecursionError, pickle.PicklingError):
+            return
+        finally:
+            # still there only if the write or the rename failed
+            remove_file(temp_path)
+
+
+# the key at path, created with size random bytes (and its directory with
+# mode 0o700) if there is none yet, or None if it can't be read or created
+# or another user owns it. A new key is written to a temporary file and
+# linked into place, so concurrent runs agree on one key
+def load_secret(path, size):
+    if not os.path.exists(path):
+        temp_path = temporary_path(path)
+        try:
+            os.makedirs(os.path.dirname(path) or '.', mode=0o700, exist_ok=True)
+            with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as key_file:
+                key_file.write(os.urandom(size))
+            os.link(temp_path, path)
+        except OSError:
+            # another run created it first, or it can't be created; reading tells
+            pass
+        finally:
+            remove_file(temp_path)
+    try:
+        with open(path, 'rb') as key_file:
+            owner = os.fstat(key_file.fileno()).st_uid
+            secret = key_file.read()
+    except OSError:
+        return None
+    # a truncated key would make the signatures easy to forge
+    if owner != os.getuid() or len(secret) < size:
+        return None
+    return secret
+
+
+# a name next to path that no other process or thread writes to
+def temporary_path(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
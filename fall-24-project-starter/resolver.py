@@ -0,0 +1,223 @@
+from intbase import InterpreterBase
+
+# slot of the return value in every function's parameter frame
+RET_SLOT = 0
+
+
+# Static lexical-address resolution. Runs once after parsing and annotates
+# the AST so the interpreter can use list-indexed frames instead of probing a
+# chain of dicts:
+#   var / = nodes:   'addr' -> (frame depth, slot) of the base variable, or
+#                    None when no definition is visible at that point
+#                    'fields' -> tuple of the dotted field names after the base
+#                    'offsets' -> field offsets along the path when every
+#                    field was found in the struct layouts following the
+#                    declared types, so at run time only a nil dereference can
+#                    fail along it; None otherwise
+#                    'static_type' -> declared type of the variable, or of the
+#                    last field when 'offsets' is known; None otherwise
+#   vardef nodes:    'addr' and 'redefined' (already defined in the same block)
+#   arg nodes:       'slot' in the parameter frame
+#   func nodes:      'param_frame_size' and 'frame_size' (body frame)
+#   if nodes:        'frame_size' and 'else_frame_size'
+#   for nodes:       'frame_size' (body frame, fresh on every iteration)
+#                    'counted' -> (counter addr, limit addr, limit, step,
+#                    inclusive) for loops of the form
+#                    for (i = a; i < n; i = i + k) where i and n are int
+#                    variables the body never assigns (or n is a literal,
+#                    with limit addr None) and k is a positive literal;
+#                    None otherwise
+#   try nodes:       'frame_size', 'depth' (frames in use at the try, which
+#                    a handler cuts the frame list back to) and 'handlers'
+#                    -> {exception type: catch node}, first catch wins
+#   catch nodes:     'frame_size'
+#
+# A function runs with frames [parameter frame, body frame, nested blocks...],
+# so the depth is an absolute index into that list. Since every block runs its
+# statements in order, a name resolves to the nearest definition that
+# textually precedes it, which is exactly what the dynamic lookup finds.
+class Slot_Resolver:
+    PRIMITIVE_TYPES = [ InterpreterBase.INT_NODE, InterpreterBase.BOOL_NODE, InterpreterBase.STRING_NODE ]
+
+    def __init__(self, struct_layouts):
+        self.struct_layouts = struct_layouts
+
+    def resolve_program(self, ast):
+        for func_node in ast.functions:
+            self.resolve_function(func_node)
+
+    def resolve_function(self, func_node):
+        # parameters share one frame with 'ret'; a repeated name reuses its slot.
+        # frames map each name to its (slot, declared type)
+        # reading 'ret' in the top-level main is a NAME_ERROR, so it gets no type
+        ret_type = func_node.return_type
+        if func_node.name == 'main' and len(func_node.args) == 0:
+            ret_type = None
+        param_frame = {'ret': (RET_SLOT, ret_type)}
+        for arg_node in func_node.args:
+            param_name = arg_node.name
+            slot = param_frame[param_name][0] if param_name in param_frame else len(param_frame)
+            param_frame[param_name] = (slot, arg_node.var_type)
+            arg_node.slot = slot
+        func_node.param_frame_size = len(param_frame)
+
+        self.frames = [param_frame]
+        func_node.frame_size = self.resolve_block(func_node.statements)
+
+    #####################################################################
+    # blocks and statements
+    #####################################################################
+
+    def resolve_block(self, statements):
+        self.frames.append(dict())
+        if statements != None:
+            for statement in statements:
+                self.resolve_statement(statement)
+        return len(self.frames.pop())
+
+    def resolve_statement(self, statement_node):
+        elem_type = statement_node.elem_type
+        if elem_type == InterpreterBase.VAR_DEF_NODE:
+            local_frame = self.frames[-1]
+            var_name = statement_node.name
+            statement_node.redefined = var_name in local_frame
+            if var_name not in local_frame:
+                local_frame[var_name] = (len(local_frame), statement_node.var_type)
+            statement_node.addr = (len(self.frames) - 1, local_frame[var_name][0])
+        elif elem_type == '=':
+            self.resolve_variable(statement_node)
+            self.resolve_expression(statement_node.expression)
+        elif elem_type == InterpreterBase.IF_NODE:
+            self.resolve_expression(statement_node.condition)
+            statement_node.frame_size = self.resolve_block(statement_node.statements)
+            statement_node.else_frame_size = self.resolve_block(statement_node.else_statements)
+        elif elem_type == InterpreterBase.FOR_NODE:
+            self.resolve_statement(statement_node.init)
+            self.resolve_expression(statement_node.condition)
+            statement_node.frame_size = self.resolve_block(statement_node.statements)
+            self.resolve_statement(statement_node.update)
+            statement_node.counted = self.resolve_counted_loop(statement_node)
+        elif elem_type == InterpreterBase.TRY_NODE:
+            statement_node.depth = len(self.frames)
+            statement_node.frame_size = self.resolve_block(statement_node.statements)
+            handlers = dict()
+            for catch_node in statement_node.catchers:
+                catch_node.frame_size = self.resolve_block(catch_node.statements)
+                handlers.setdefault(catch_node.exception_type, catch_node)
+            statement_node.handlers = handlers
+        elif elem_type == InterpreterBase.RAISE_NODE:
+            self.resolve_expression(statement_node.exception_type)
+        elif elem_type == InterpreterBase.RETURN_NODE:
+            self.resolve_expression(statement_node.expression)
+        else:
+            self.resolve_expression(statement_node)
+
+    def resolve_expression(self, expression_node):
+        if expression_node == None:
+            return
+        if expression_node.elem_type == InterpreterBase.VAR_NODE:
+            self.resolve_variable(expression_node)
+            return
+        for key in ('op1', 'op2'):
+            if hasattr(expression_node, key):
+                self.resolve_expression(getattr(expression_node, key))
+        if expression_node.elem_type == InterpreterBase.FCALL_NODE:
+            for arg in expression_node.args:
+                self.resolve_expression(arg)
+
+    # Only variables declared int qualify, since those always hold an int. The
+    # body can only change a variable of this function through an assignment
+    # to its address, so scanning the body for those is enough.
+    def resolve_counted_loop(self, for_node):
+        init = for_node.init
+        condition = for_node.condition
+        update = for_node.update
+        counter = init.addr
+        if counter == None or init.fields or init.static_type != InterpreterBase.INT_NODE:
+            return None
+        if condition.elem_type != '<' and condition.elem_type != '<=':
+            return None
+        if not self.is_int_variable(condition.op1, counter):
+            return None
+        limit_node = condition.op2
+        limit_addr, limit = None, None
+        if limit_node.elem_type == InterpreterBase.INT_NODE:
+            limit = limit_node.val
+        elif self.is_int_variable(limit_node, getattr(limit_node, 'addr', None)) and limit_node.addr != counter:
+            limit_addr = limit_node.addr
+        else:
+            return None
+        if update.addr != counter or update.fields:
+            return None
+        step = update.expression
+        if step.elem_type != '+' or not self.is_int_variable(step.op1, counter):
+            return None
+        if step.op2.elem_type != InterpreterBase.INT_NODE or step.op2.val <= 0:
+            return None
+        assigned = assigned_addresses(for_node.statements)
+        if counter in assigned or limit_addr in assigned:
+            return None
+        return (counter, limit_addr, limit, step.op2.val, condition.elem_type == '<=')
+
+    def is_int_variable(self, node, addr):
+        if node.elem_type != InterpreterBase.VAR_NODE or addr == None:
+            return False
+        return node.addr == addr and not node.fields and node.static_type == InterpreterBase.INT_NODE
+
+    #####################################################################
+    # variables and field paths
+    #####################################################################
+
+    def resolve_variable(self, node):
+        var_segments = node.name.split('.')
+        var_name = var_segments[0]
+        fields = tuple(var_segments[1:])
+        node.addr = None
+        node.fields = fields
+        node.offsets = None
+        node.static_type = None
+        for depth in range(len(self.frames) - 1, -1, -1):
+            if var_name in self.frames[depth]:
+                slot, var_type = self.frames[depth][var_name]
+                node.addr = (depth, slot)
+                if len(fields) == 0:
+                    node.static_type = var_type
+                else:
+                    node.offsets, node.static_type = self.resolve_path(var_type, fields)
+                return
+
+    # a struct-typed variable or field only ever holds nil or a struct of its
+    # declared type, so a path that type-checks here can only fail on nil.
+    # Returns the field offsets and the declared type of the last field
+    def resolve_path(self, var_type, fields):
+        offsets = []
+        for field_name in fields:
+            if var_type in self.PRIMITIVE_TYPES or var_type not in self.struct_layouts:
+                return None, None
+            layout = self.struct_layouts[var_type]
+            if field_name not in layout.offsets:
+                return None, None
+            offsets.append(layout.offsets[field_name])
+            var_type = layout.field_types[field_name]
+        return tuple(offsets), var_type
+
+
+# addresses of the variables assigned anywhere in statements, nested blocks
+# included; only meaningful on resolved statements
+def assigned_addresses(statements):
+    assigned = set()
+    for statement in statements or []:
+        elem_type = statement.elem_type
+        if elem_type == '=':
+            assigned.add(statement.addr)
+        elif elem_type == InterpreterBase.IF_NODE:
+            assigned |= assigned_addresses(statement.statements)
+            assigned |= assigned_addresses(statement.else_statements)
+        elif elem_type == InterpreterBase.FOR_NODE:
+            assigned |= assigned_addresses([statement.init, statement.update])
+            assigned |= assigned_addresses(statement.statements)
+        elif elem_type == InterpreterBase.TRY_NODE:
+            assigned |= assigned_addresses(statement.statements)
+            for catch_node in statement.catchers:
+                assigned |= assigned_addresses(catch_node.statements)
+    return assigned
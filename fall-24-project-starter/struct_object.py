@@ -1,30 +1,50 @@
-from data_object import Data_Object
+from data_object import Data_Object, TRUE, FALSE
 
-class Struct_Object(Data_Object):
-    def __init__(self, init_type, struct_type, field_nodes):
-        super().__init__(init_type, None)
+# Field offsets and default values of one struct type, built once per run.
+# Every instance is cloned from the layout's template, so 'new' is a list copy.
+class Struct_Layout:
+    def __init__(self, struct_type, field_nodes):
         self.struct_type = struct_type
-        self.fields = dict()
+        self.field_types = dict()
+        defaults = dict()
         for field in field_nodes:
-            field_name = field.dict['name']
-            field_type = field.dict['var_type']
-            if field_type == self.INT_TYPE:
-                self.fields[field_name] = self.int_object(self.INT_TYPE)
-            elif field_type == self.BOOL_TYPE:
-                self.fields[field_name] = self.false_object(self.BOOL_TYPE)
-            elif field_type == self.STRING_TYPE:
-                self.fields[field_name] = self.string_object(self.STRING_TYPE)
+            field_name = field.name
+            field_type = field.var_type
+            self.field_types[field_name] = field_type
+            if field_type == Data_Object.INT_TYPE:
+                defaults[field_name] = Data_Object.int_object(Data_Object.INT_TYPE)
+            elif field_type == Data_Object.BOOL_TYPE:
+                defaults[field_name] = Data_Object.false_object(Data_Object.BOOL_TYPE)
+            elif field_type == Data_Object.STRING_TYPE:
+                defaults[field_name] = Data_Object.string_object(Data_Object.STRING_TYPE)
             else:
-                self.fields[field_name] = Struct_Object(self.NIL_TYPE, field_type, [])
+                defaults[field_name] = Struct_Object(Data_Object.NIL_TYPE, field_type)
+        # a repeated field name keeps its first offset and its last type
+        self.offsets = {field_name: i for i, field_name in enumerate(defaults)}
+        self.template = list(defaults.values())
+
+    # field values are never mutated in place, so clones can share the defaults
+    def new_instance(self):
+        return Struct_Object(self.struct_type, self.struct_type, self)
+
+
+class Struct_Object(Data_Object):
+    __slots__ = ('struct_type', 'layout', 'values')
+
+    def __init__(self, init_type, struct_type, layout=None):
+        super().__init__(init_type, None)
+        self.struct_type = struct_type
+        self.layout = EMPTY_LAYOUT if layout is None else layout
+        self.values = list(self.layout.template)
 
     def __str__(self):
         return f"Struct {self.struct_type}"
 
     def __repr__(self):
         res = f"({self.val_type} {self.struct_type} "
-        for f_name in self.fields.keys():
+        for f_name, offset in self.layout.offsets.items():
             res += f_name + ":"
-            f_val = self.fields[f_name]
+            f_val = self.values[offset]
             res += repr(f_val)
             res += ", "
         res += ")"
@@ -32,24 +52,26 @@ class Struct_Object(Data_Object):
 
     def __eq__(self, other):
         if self.val_type == self.NIL_TYPE and other.val_type == self.NIL_TYPE:
-            return self.true_object(self.BOOL_TYPE)
-        return Data_Object(self.BOOL_TYPE, self is other)
+            return TRUE
+        return TRUE if self is other else FALSE
     
     def __ne__(self, other):
         if self.val_type == self.NIL_TYPE and other.val_type == self.NIL_TYPE:
-            return self.false_object(self.BOOL_TYPE)
-        return Data_Object(self.BOOL_TYPE, self is not other)
+            return FALSE
+        return FALSE if self is other else TRUE
     
     def change_field(self, field_name, field_data):
-        self.fields[field_name] = field_data
+        self.values[self.layout.offsets[field_name]] = field_data
     
     def get_field(self, field_name):
-        return self.fields[field_name]
+        return self.values[self.layout.offsets[field_name]]
     
     def field_exists(self, field_name):
-        return field_name in self.fields
+        return field_name in self.layout.offsets
     
     def get_field_type(self, field_name):
         return self.get_field(field_name).get_type()
-    
-    
\ No newline at end of file
+
+
+# layout of nil structs, which have no fields
+EMPTY_LAYOUT = Struct_Layout(Data_Object.NIL_TYPE, [])
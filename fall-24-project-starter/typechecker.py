@@ -0,0 +1,275 @@
+from intbase import InterpreterBase
+from data_object import Data_Object
+
+
+# Operator bodies for expressions marked 'checked'. Both operands are known to
+# have types the operator accepts, so none of the runtime checks can fail.
+CHECKED_OPERATORS = {
+    '+': Data_Object.__add__,
+    '-': Data_Object.__sub__,
+    '*': Data_Object.__mul__,
+    '/': Data_Object.__floordiv__,
+    '<': Data_Object.__lt__,
+    '>': Data_Object.__gt__,
+    '<=': Data_Object.__le__,
+    '>=': Data_Object.__ge__,
+    '==': Data_Object.__eq__,
+    '!=': Data_Object.__ne__,
+    '&&': Data_Object.logical_and,
+    '||': Data_Object.logical_or,
+    InterpreterBase.NEG_NODE: Data_Object.__neg__,
+    InterpreterBase.NOT_NODE: Data_Object.logical_not,
+}
+
+
+# Static type inference over the resolved AST. A variable, parameter, field or
+# call result declared int, bool, string or void always holds a value of exactly
+# that type at run time (assignment and parameter passing coerce or fail), so
+# those "exact" types are enough to decide most runtime checks ahead of time.
+# Struct types are not exact since the value may be nil; anything involving
+# them, or an unknown type, keeps the dynamic checks.
+#
+# Annotations:
+#   operator nodes:  'checked' -> operand types are exact and valid, so the
+#                    result is CHECKED_OPERATORS[elem_type] applied directly
+#   = nodes:         'checked' -> the value already has the target's type, so
+#                    it is stored without check_struct_equivalence/assign_helper
+#   fcall nodes:     'checked' -> every argument has its parameter's type and
+#                    every return in the callee has the return type
+#
+# Provable TYPE_ERRORs are collected in 'errors' as (message, line), with the
+# message the runtime check would raise and the line of the statement that
+# breaks the rule; the interpreter only reports them when asked to.
+class Type_Checker:
+    EXACT_TYPES = [ InterpreterBase.INT_NODE, InterpreterBase.BOOL_NODE, InterpreterBase.STRING_NODE, InterpreterBase.VOID_DEF ]
+
+    def __init__(self, interpreter):
+        self.interp = interpreter
+        self.errors = []
+        self.statement_node = None
+        self.calls = []
+        self.returns_checked = dict()
+
+    def check_program(self, ast):
+        for func_node in ast.functions:
+            self.check_function(func_node)
+        # a call can only skip the return check once its callee has been seen
+        for call_node, func_node, args_checked in self.calls:
+            call_node.checked = args_checked and self.returns_checked[id(func_node)]
+        return self.errors
+
+    def check_function(self, func_node):
+        self.func_node = func_node
+        self.returns_checked[id(func_node)] = func_node.return_type in self.EXACT_TYPES
+        self.check_block(func_node.statements)
+
+    def report(self, description):
+        line = self.statement_node.lineno if self.statement_node is not None else None
+        self.errors.append((description, line))
+
+    #####################################################################
+    # statements
+    #####################################################################
+
+    def check_block(self, statements):
+        if statements != None:
+            for statement in statements:
+                self.check_statement(statement)
+
+    def check_statement(self, statement_node):
+        interp = self.interp
+        elem_type = statement_node.elem_type
+        outer_node, self.statement_node = self.statement_node, statement_node
+        if elem_type == interp.VAR_DEF_NODE:
+            var_type = statement_node.var_type
+            if not statement_node.redefined and var_type not in (interp.INT_NODE, interp.STRING_NODE, interp.BOOL_NODE) and var_type not in interp.struct_types:
+                self.report(f"Unknown/invalid type specified {var_type}")
+        elif elem_type == '=':
+            self.check_assignment(statement_node)
+        elif elem_type == interp.FCALL_NODE:
+            self.check_call(statement_node)
+        elif elem_type == interp.IF_NODE:
+            self.check_conditional(statement_node.condition)
+            self.check_block(statement_node.statements)
+            self.check_block(statement_node.else_statements)
+        elif elem_type == interp.FOR_NODE:
+            self.check_assignment(statement_node.init)
+            self.check_conditional(statement_node.condition)
+            self.check_block(statement_node.statements)
+            self.check_assignment(statement_node.update)
+        elif elem_type == interp.RETURN_NODE:
+            self.check_return(statement_node)
+        elif elem_type == interp.TRY_NODE:
+            self.check_block(statement_node.statements)
+            for catch_node in statement_node.catchers:
+                self.check_block(catch_node.statements)
+        elif elem_type == interp.RAISE_NODE:
+            raise_type = self.type_of(statement_node.exception_type, operand=False)
+            if raise_type in self.EXACT_TYPES and raise_type != interp.STRING_NODE:
+                self.report(f"Incompatible type for raise operation")
+        self.statement_node = outer_node
+
+    def check_assignment(self, statement_node):
+        var_type = statement_node.static_type
+        assign_type = self.type_of(statement_node.expression, operand=False)
+        statement_node.checked = var_type in self.EXACT_TYPES and assign_type == var_type
+        if var_type in self.EXACT_TYPES and assign_type in self.EXACT_TYPES and var_type != assign_type:
+            if not (var_type == self.interp.BOOL_NODE and assign_type == self.interp.INT_NODE):
+                self.report(f"Type mismatch {var_type} vs {assign_type} in assignment")
+
+    def check_return(self, return_node):
+        interp = self.interp
+        expression = return_node.expression
+        if expression == None:
+            return
+        return_type = self.func_node.return_type
+        ret_eval_type = expression.elem_type
+        ret_type = None
+        if ret_eval_type == interp.VAR_NODE or ret_eval_type in interp.var_types or ret_eval_type == interp.FCALL_NODE or self.is_operator(ret_eval_type):
+            ret_type = self.type_of(expression)
+        if ret_type != return_type:
+            self.returns_checked[id(self.func_node)] = False
+        # the top-level main's return value is never checked
+        if self.func_node is self.interp.func_defs_to_node['main_0']:
+            return
+        if ret_type in self.EXACT_TYPES and ret_type != return_type:
+            if not (ret_type == interp.INT_NODE and return_type == interp.BOOL_NODE):
+                self.report(f"Returned value's type {ret_type} is inconsistent with function's return type {return_type}")
+
+    # only the node kinds evaluate_conditional evaluates can fail the bool check
+    def check_conditional(self, condition_node):
+        interp = self.interp
+        condition_type = condition_node.elem_type
+        if condition_type == interp.VAR_NODE or condition_type == interp.FCALL_NODE or self.is_operator(condition_type):
+            result_type = self.type_of(condition_node)
+            if result_type in self.EXACT_TYPES and result_type != interp.INT_NODE and result_type != interp.BOOL_NODE:
+                self.report(f"Expression does not evaluate to boolean")
+
+    #####################################################################
+    # expressions
+    #####################################################################
+
+    def is_operator(self, elem_type):
+        interp = self.interp
+        return elem_type in interp.arithmetic_ops or elem_type in interp.bool_ops or elem_type in interp.comparison_ops
+
+    # static type of an expression, or None when it is not known. In operand
+    # position a 'new' node is read as a value (and fails), elsewhere it
+    # builds a struct
+    def type_of(self, node, operand=True):
+        interp = self.interp
+        elem_type = node.elem_type
+        if elem_type == interp.VAR_NODE:
+            return node.static_type
+        elif elem_type == interp.FCALL_NODE:
+            return self.check_call(node)
+        elif self.is_operator(elem_type):
+            return self.check_operation(node)
+        elif elem_type == interp.NEW_NODE:
+            if operand or node.var_type not in interp.struct_types:
+                return None
+            return node.var_type
+        elif elem_type in (interp.INT_NODE, interp.STRING_NODE, interp.BOOL_NODE):
+            return elem_type
+        elif elem_type == interp.NIL_NODE:
+            return interp.NIL_NODE
+        return None
+
+    def check_operation(self, node):
+        interp = self.interp
+        INT_NODE, BOOL_NODE, STRING_NODE = interp.INT_NODE, interp.BOOL_NODE, interp.STRING_NODE
+        elem_type = node.elem_type
+        node.checked = False
+        op1_type = self.type_of(node.op1)
+        op1_exact = op1_type in self.EXACT_TYPES
+
+        if elem_type == interp.NEG_NODE:
+            node.checked = op1_type == INT_NODE
+            if op1_exact and op1_type != INT_NODE:
+                self.report(f"Incompatible type for neg operation")
+            return INT_NODE
+        elif elem_type == interp.NOT_NODE:
+            node.checked = op1_type == INT_NODE or op1_type == BOOL_NODE
+            if op1_exact and not node.checked:
+                self.report(f"Incompatible type for ! operation")
+            return BOOL_NODE
+
+        op2_type = self.type_of(node.op2)
+        if elem_type in interp.comparison_ops or elem_type in interp.bool_ops:
+            result_type = BOOL_NODE
+        elif elem_type == '+':
+            result_type = None
+            if op1_type == STRING_NODE or op2_type == STRING_NODE:
+                result_type = STRING_NODE
+            elif op1_type == INT_NODE and op2_type == INT_NODE:
+                result_type = INT_NODE
+        else:
+            result_type = INT_NODE
+
+        if not op1_exact or op2_type not in self.EXACT_TYPES:
+            return result_type
+        if op1_type == interp.VOID_DEF or op2_type == interp.VOID_DEF:
+            self.report(f"Can't compare void type")
+            return result_type
+
+        if elem_type == '+':
+            valid = op1_type in (INT_NODE, STRING_NODE) and op2_type in (INT_NODE, STRING_NODE)
+            description = f"Cannot use operator + on non-string and non-integer operators"
+        elif elem_type == '-' or elem_type == '/':
+            valid = op1_type == INT_NODE and op2_type == INT_NODE
+            description = f"Cannot use operator {elem_type} on non-integer operators"
+        elif elem_type in ('*', '<', '>', '<=', '>='):
+            valid = op1_type == INT_NODE and op2_type == INT_NODE
+            description = f"Incompatible types for {elem_type} operation"
+        elif elem_type == '==' or elem_type == '!=':
+            # int/bool comparisons coerce at run time, so only equal types skip the checks
+            valid = op1_type == op2_type
+            description = None
+            if not valid and not (op1_type in (INT_NODE, BOOL_NODE) and op2_type in (INT_NODE, BOOL_NODE)):
+                description = f"Can't compare unrelated types {op1_type} and {op2_type}"
+        else:
+            valid = op1_type in (INT_NODE, BOOL_NODE) and op2_type in (INT_NODE, BOOL_NODE)
+            description = f"Invalid types used with operator {elem_type}"
+
+        node.checked = valid
+        if not valid and description != None:
+            self.report(description)
+        return result_type
+
+    def check_call(self, call_node):
+        interp = self.interp
+        call_node.checked = False
+        fcall_name = call_node.name
+        arg_nodes = call_node.args
+        if fcall_name == 'print':
+            for arg in arg_nodes:
+                if arg.elem_type == interp.NEW_NODE:
+                    continue
+                arg_type = self.type_of(arg)
+                if arg.elem_type == interp.FCALL_NODE and arg_type == interp.VOID_DEF:
+                    self.report(f"Cannot print type void")
+            return interp.VOID_DEF
+        elif fcall_name == 'inputi' or fcall_name == 'inputs':
+            # the prompt is read as a value, never evaluated
+            if len(arg_nodes) > 2:
+                return None
+            return interp.INT_NODE if fcall_name == 'inputi' else interp.STRING_NODE
+
+        fcall_dict_key = fcall_name + '_' + str(len(arg_nodes))
+        if fcall_dict_key not in interp.func_defs_to_node:
+            return None
+        func_node = interp.func_defs_to_node[fcall_dict_key]
+        args_checked = True
+        for arg_node, param_node in zip(arg_nodes, func_node.args):
+            param_type = param_node.var_type
+            arg_type = self.type_of(arg_node, operand=False)
+            if arg_type != param_type or arg_type not in self.EXACT_TYPES:
+                args_checked = False
+            if arg_type in self.EXACT_TYPES and arg_type != param_type and not (param_type == interp.BOOL_NODE and arg_type == interp.INT_NODE):
+                self.report(f"Type mismatch on formal parameter {param_node.name}")
+        self.calls.append((call_node, func_node, args_checked))
+
+        return_type = func_node.return_type
+        if return_type in self.EXACT_TYPES:
+            return return_type
+        return None